@@ -1,417 +1,1492 @@
 import math
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+import noise_profiles
+from channel_groups import ChannelGroups
+from dynamics import DynamicsProcessor
+from instrumentation import StageTimer
+from loudness import LoudnessMeter
+from noise_gate import NoiseFloorEstimator, NoiseGate, block_levels, detector_block_length
+from signal_stats import StatsAccumulator, measure
+from spectral import DEFAULT_FRAME_SIZE, SpectralSubtractor, noise_spectrum
+from timestretch import TimeStretcher
+
+# Format tags found in the fmt chunk
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Sample formats convert_format and write_wav_file can produce: (format tag, bits per sample)
+SAMPLE_FORMATS = {
+    'pcm8': (WAVE_FORMAT_PCM, 8),
+    'pcm16': (WAVE_FORMAT_PCM, 16),
+    'pcm24': (WAVE_FORMAT_PCM, 24),
+    'pcm32': (WAVE_FORMAT_PCM, 32),
+    'float32': (WAVE_FORMAT_IEEE_FLOAT, 32),
+    'float64': (WAVE_FORMAT_IEEE_FLOAT, 64),
+}
+
+# Samples per chunk of a fused pass, small enough for a chunk to stay in cache
+FUSION_BLOCK_SIZE = 65536
+
+# Operations that transform each sample independently and can be fused together
+POINTWISE_OPERATIONS = ('amplify', 'anti_distortion')
+
+# Ways change_speed can alter the playback speed
+SPEED_METHODS = ('wsola', 'resample')
+
+# Point-wise chains on formats up to this bit depth are precomputed as lookup tables
+# over every possible sample value (65,536 entries for 16-bit audio)
+TRANSFER_TABLE_MAX_BITS = 16
+
+# Number of lookup tables kept for reuse across files, least recently used first out
+TRANSFER_TABLE_CACHE_SIZE = 32
+_transfer_tables = OrderedDict()
+
+# 32-bit size fields holding this value are stored in the ds64 chunk of RF64 files
+RF64_SIZE_PLACEHOLDER = 0xFFFFFFFF
+
+# Bytes of the WAVE_FORMAT_EXTENSIBLE SubFormat GUID after its two-byte format code
+KSDATAFORMAT_SUBTYPE_SUFFIX = b'\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+
+def read_wav_header(file):
+    """
+    Parse the RIFF/fmt headers of a WAV file and locate the data chunk.
+
+    RF64 files (WAV files larger than 4 GB) are supported through their ds64
+    chunk, and WAVE_FORMAT_EXTENSIBLE headers are resolved to the format of
+    their SubFormat GUID.
+
+    Parameters:
+        file: A binary file object positioned at the start of the file
+
+    Returns:
+        dict: The format fields plus 'data_offset' and 'data_size'. The file is
+              left positioned at the first byte of audio data.
+    """
+    # Read RIFF header
+    riff = file.read(4)
+    if riff not in (b'RIFF', b'RF64'):
+        raise ValueError("Not a valid WAV file")
+
+    # Read file size (minus 8 bytes)
+    file_size = int.from_bytes(file.read(4), byteorder='little')
+
+    # Read WAVE format
+    wave = file.read(4)
+    if wave != b'WAVE':
+        raise ValueError("Not a valid WAV file")
+
+    fmt = None
+    ds64_data_size = None
+
+    # Walk the chunks until the data chunk, reading fmt and ds64 on the way
+    while True:
+        chunk_id = file.read(4)
+        if len(chunk_id) < 4:
+            if fmt is None:
+                raise ValueError("Not a valid WAV file")
+            raise ValueError("No data chunk found")
+
+        chunk_size = int.from_bytes(file.read(4), byteorder='little')
+
+        if chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("Not a valid WAV file")
+            break
+
+        if chunk_id == b'fmt ':
+            fmt = file.read(chunk_size)
+        elif chunk_id == b'ds64' and riff == b'RF64':
+            # 64-bit RIFF size, data size and sample count
+            ds64 = file.read(chunk_size)
+            file_size = int.from_bytes(ds64[0:8], byteorder='little')
+            ds64_data_size = int.from_bytes(ds64[8:16], byteorder='little')
+        else:
+            # Skip this chunk
+            file.seek(chunk_size, 1)
+
+        # Chunks are padded to an even number of bytes
+        if chunk_size % 2:
+            file.seek(1, 1)
+
+    if len(fmt) < 16:
+        raise ValueError("Not a valid WAV file")
+
+    # Read audio format
+    format_tag = int.from_bytes(fmt[0:2], byteorder='little')
+    audio_format = format_tag
+
+    # Read number of channels
+    channels = int.from_bytes(fmt[2:4], byteorder='little')
+
+    # Read sample rate
+    sample_rate = int.from_bytes(fmt[4:8], byteorder='little')
+
+    # Read byte rate
+    byte_rate = int.from_bytes(fmt[8:12], byteorder='little')
+
+    # Read block align
+    block_align = int.from_bytes(fmt[12:14], byteorder='little')
+
+    # Read bits per sample
+    bits_per_sample = int.from_bytes(fmt[14:16], byteorder='little')
+
+    # WAVE_FORMAT_EXTENSIBLE carries the real format in the first two bytes of
+    # the SubFormat GUID, after cbSize, valid bits and the channel mask
+    valid_bits_per_sample = bits_per_sample
+    channel_mask = 0
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 40:
+        valid_bits_per_sample = int.from_bytes(fmt[18:20], byteorder='little') or bits_per_sample
+        channel_mask = int.from_bytes(fmt[20:24], byteorder='little')
+        audio_format = int.from_bytes(fmt[24:26], byteorder='little')
+
+    # Read data size
+    data_size = chunk_size
+    if data_size == RF64_SIZE_PLACEHOLDER and ds64_data_size is not None:
+        data_size = ds64_data_size
+
+    return {
+        'audio_format': audio_format,
+        'format_tag': format_tag,
+        'channels': channels,
+        'sample_rate': sample_rate,
+        'bits_per_sample': bits_per_sample,
+        'valid_bits_per_sample': valid_bits_per_sample,
+        'channel_mask': channel_mask,
+        'byte_rate': byte_rate,
+        'block_align': block_align,
+        'data_offset': file.tell(),
+        'data_size': data_size
+    }
+
+def map_wav_data(filename, header=None, writable=False):
+    """
+    Memory-map the data chunk of a WAV file as an array of bytes.
+
+    Nothing is copied: pages are read from the page cache on demand and are
+    shared by every process that maps the same file. The size is clamped to
+    whole frames actually present in the file.
+
+    Parameters:
+        filename (str): Path to the WAV file
+        header (dict): Result of read_wav_header, parsed from the file if omitted
+        writable (bool): Map the data read-write, so that assigning to a slice
+                         patches the file in place (flush() to write it back)
+
+    Returns:
+        tuple: (header, data) where data is a uint8 array, read-only unless writable
+    """
+    with open(filename, 'rb') as file:
+        if header is None:
+            header = read_wav_header(file)
+        file.seek(0, 2)
+        available = file.tell() - header['data_offset']
+
+    frame_size = (header['bits_per_sample'] // 8) * header['channels']
+    data_size = min(header['data_size'], max(available, 0))
+    data_size -= data_size % frame_size
+
+    if data_size == 0:
+        # Empty regions cannot be mapped
+        return header, np.zeros(0, dtype=np.uint8)
+
+    data = np.memmap(filename, dtype=np.uint8, mode='r+' if writable else 'r',
+                     offset=header['data_offset'], shape=(data_size,))
+    return header, data
+
+def map_wav_file(filename):
+    """
+    Memory-map a WAV file and return a zero-copy typed view of its samples.
+
+    Parameters:
+        filename (str): Path to the WAV file
+
+    Returns:
+        tuple: (header, frames) where frames is a read-only array of shape
+               (frame count, channels). 8-bit PCM maps to unsigned integers
+               centred on 128, 16, 32 and 64-bit PCM to signed integers and IEEE
+               float data to float32/float64. Other widths
+               (e.g. 24-bit) have no native dtype and map to uint8 with a trailing
+               axis holding the bytes of each sample.
+    """
+    header, data = map_wav_data(filename)
+    bytes_per_sample = header['bits_per_sample'] // 8
+    channels = header['channels']
+    frame_count = len(data) // (bytes_per_sample * channels)
+
+    if header['audio_format'] == WAVE_FORMAT_IEEE_FLOAT and bytes_per_sample in (4, 8):
+        dtype = np.dtype(f'<f{bytes_per_sample}')
+    elif bytes_per_sample == 1:
+        dtype = np.dtype(np.uint8)
+    elif bytes_per_sample in (2, 4, 8):
+        dtype = np.dtype(f'<i{bytes_per_sample}')
+    else:
+        return header, data.reshape(frame_count, channels, bytes_per_sample)
+
+    return header, data.view(dtype).reshape(frame_count, channels)
+
+def write_wav_header(file, channels, sample_rate, bits_per_sample, data_size, audio_format=WAVE_FORMAT_PCM,
+                     channel_mask=0):
+    """
+    Write a canonical WAV header.
+
+    Mono and stereo PCM of up to 16 bits gets a plain 44-byte header. Audio
+    with more than 2 channels or more than 16 bits per sample, which includes
+    every IEEE float format, is written as WAVE_FORMAT_EXTENSIBLE, with a
+    40-byte fmt chunk carrying channel_mask and the format in its SubFormat
+    GUID: 68 bytes for PCM, and 80 for float with the fact chunk that format
+    requires. When the file would exceed the 4 GB that 32-bit RIFF sizes can
+    describe, an RF64 header is written instead: the sizes are
+    RF64_SIZE_PLACEHOLDER and the real ones are in a 36-byte ds64 chunk after
+    the WAVE tag. The data chunk starts right after the header.
+    """
+    bytes_per_sample = bits_per_sample // 8
+    byte_rate = sample_rate * channels * bytes_per_sample
+    block_align = channels * bytes_per_sample
+    frame_count = data_size // block_align if block_align else 0
+    is_float = audio_format == WAVE_FORMAT_IEEE_FLOAT
+    is_extensible = channels > 2 or bits_per_sample > 16 or is_float
+    fmt_size = 40 if is_extensible else 16
+    file_size = 4 + (8 + fmt_size) + (12 if is_float else 0) + (8 + data_size)
+
+    is_rf64 = file_size + 36 >= RF64_SIZE_PLACEHOLDER
+    if is_rf64:
+        file_size += 36
+
+    def size32(size):
+        return RF64_SIZE_PLACEHOLDER if is_rf64 else size
+
+    # Write RIFF header
+    file.write(b'RF64' if is_rf64 else b'RIFF')
+    file.write(size32(file_size).to_bytes(4, byteorder='little'))
+    file.write(b'WAVE')
+
+    if is_rf64:
+        # 64-bit RIFF size, data size and sample count, and no table entries
+        file.write(b'ds64')
+        file.write((28).to_bytes(4, byteorder='little'))
+        file.write(file_size.to_bytes(8, byteorder='little'))
+        file.write(data_size.to_bytes(8, byteorder='little'))
+        file.write(frame_count.to_bytes(8, byteorder='little'))
+        file.write((0).to_bytes(4, byteorder='little'))
+
+    # Write fmt chunk
+    file.write(b'fmt ')
+    file.write(fmt_size.to_bytes(4, byteorder='little'))  # Chunk size
+    format_tag = WAVE_FORMAT_EXTENSIBLE if is_extensible else audio_format
+    file.write(format_tag.to_bytes(2, byteorder='little'))
+    file.write(channels.to_bytes(2, byteorder='little'))
+    file.write(sample_rate.to_bytes(4, byteorder='little'))
+    file.write(byte_rate.to_bytes(4, byteorder='little'))
+    file.write(block_align.to_bytes(2, byteorder='little'))
+    file.write(bits_per_sample.to_bytes(2, byteorder='little'))
+
+    if is_extensible:
+        # Extension size, valid bits, speaker positions and SubFormat GUID
+        file.write((22).to_bytes(2, byteorder='little'))
+        file.write(bits_per_sample.to_bytes(2, byteorder='little'))
+        file.write(channel_mask.to_bytes(4, byteorder='little'))
+        file.write(audio_format.to_bytes(2, byteorder='little') + KSDATAFORMAT_SUBTYPE_SUFFIX)
+
+    if is_float:
+        # Number of frames
+        file.write(b'fact')
+        file.write((4).to_bytes(4, byteorder='little'))
+        file.write(size32(frame_count).to_bytes(4, byteorder='little'))
+
+    # Write data chunk
+    file.write(b'data')
+    file.write(size32(data_size).to_bytes(4, byteorder='little'))
+
 class ClearWaveAudio:
-    def __init__(self):
+    def __init__(self, lazy=False, quiet=False, observer=None, channel_workers=1):
+        """
+        Parameters:
+            lazy (bool): If True, processing methods only record a plan that is run
+                         by execute() or write_wav_file, where consecutive point-wise
+                         operations are fused into a single pass over the samples
+            quiet (bool): If True, diagnostics are not printed and the scans that
+                          only serve them (sample excerpts, range checks, modified
+                          and clipped counts) are skipped; warnings are still printed
+            observer (instrumentation.Observer): Receives the StageMetrics of every
+                                                 operation, read and write
+            channel_workers (int): Threads across which reduce_noise_with_reference
+                                   spreads the channels of multichannel audio
+        """
         self.header = {}
-        self.samples = []
+        self._stats = None
+        # One row per frame, one column per channel
+        self.samples = np.zeros((0, 1), dtype=np.int32)
         self.bits_per_sample = 0
         self.max_value = 0
-    
+        self.lazy = lazy
+        self.quiet = quiet
+        self.observer = observer
+        self.channel_workers = channel_workers
+        self.plan = []
+
+    def _log(self, *args):
+        """Print diagnostics unless in quiet mode"""
+        if not self.quiet:
+            print(*args)
+
+    @property
+    def _counting(self):
+        """Whether modified and clipped counts are wanted, for printing or for the observer"""
+        return not self.quiet or self.observer is not None
+
+    @contextmanager
+    def _measure(self, stage):
+        """
+        Time the stage run by the body and report its StageMetrics to the observer.
+
+        The body may set modified_count and clipped_count on the yielded metrics.
+        """
+        timer = StageTimer(stage, len(self.samples))
+        yield timer.metrics
+        metrics = timer.finish(len(self.samples))
+        if self.observer is not None:
+            self.observer.stage_finished(metrics)
+
+    @property
+    def samples(self):
+        """The (frames, channels) sample buffer; assigning it invalidates stats"""
+        return self._samples
+
+    @samples.setter
+    def samples(self, samples):
+        self._samples = samples
+        self._stats = None
+
+    @property
+    def stats(self):
+        """
+        signal_stats.SignalStats of the samples (peak, min/max, RMS, DC offset,
+        clip count).
+
+        Stages keep them up to date as a by-product of their own pass, or derive
+        the range from the previous one, so they are only measured here when
+        they are missing or incomplete. Changing the samples in place does not
+        invalidate them; assign the array instead.
+        """
+        if self._stats is None or not self._stats.complete:
+            self._stats = measure(self.samples, self.min_value, self.max_value)
+        return self._stats
+
+    def _sample_range(self):
+        """Return (minimum, maximum) of the samples, measuring them only if no range is known"""
+        stats = self._stats if self._stats is not None else self.stats
+        return stats.minimum, stats.maximum
+
+    def _accumulator(self):
+        """
+        Return a StatsAccumulator for the output of a stage, or None when nothing
+        will report statistics (quiet mode without an observer)
+        """
+        if not self._counting:
+            return None
+        return StatsAccumulator(self.header['channels'], self.min_value, self.max_value)
+
+    def _derive_stats(self, previous, function):
+        """Set the stats of samples just produced by a monotonic point-wise function of the previous ones"""
+        if previous is not None:
+            self._stats = previous.mapped(function, self.min_value, self.max_value)
+
+    def _run_blocks(self, process, flush):
+        """
+        Replace the samples with the output of a streaming processor, fed about
+        FUSION_BLOCK_SIZE samples at a time.
+
+        process and flush return blocks in the working dtype. Each output block
+        is added to the statistics (when wanted) as soon as it is produced.
+        """
+        accumulator = self._accumulator()
+        block_frames = max(1, FUSION_BLOCK_SIZE // self.samples.shape[1])
+        pieces = []
+        for start in range(0, len(self.samples), block_frames):
+            pieces.append(process(self.samples[start:start + block_frames]))
+            if accumulator is not None:
+                accumulator.add(pieces[-1])
+        pieces.append(flush())
+        if accumulator is not None:
+            accumulator.add(pieces[-1])
+
+        self.samples = np.concatenate(pieces)
+        if accumulator is not None:
+            self._stats = accumulator.result()
+
+    @staticmethod
+    def _working_dtype(bits_per_sample, audio_format=WAVE_FORMAT_PCM):
+        """
+        Return the dtype used to hold samples in memory.
+
+        The working buffer is wider than the file format so that amplification
+        without limiting can push samples beyond the valid range until they are
+        clipped in write_wav_file. IEEE float samples are held as float64 in
+        the -1.0 to 1.0 range of the file.
+        """
+        if audio_format == WAVE_FORMAT_IEEE_FLOAT:
+            return np.float64
+        return np.int32 if bits_per_sample <= 16 else np.int64
+
+    @staticmethod
+    def _decode_samples(audio_data, bytes_per_sample, channels, audio_format=WAVE_FORMAT_PCM):
+        """
+        Convert raw little-endian sample bytes to a (frames, channels) array in
+        a single bulk conversion.
+
+        16, 32 and 64-bit PCM and IEEE float are viewed in place, 8-bit PCM is
+        unsigned and shifted down by 128, and odd widths (e.g. 24-bit) are
+        widened to the next native integer and sign-extended with a shift.
+        """
+        frame_size = bytes_per_sample * channels
+        frame_count = len(audio_data) // frame_size
+        raw = np.frombuffer(audio_data, dtype=np.uint8, count=frame_count * frame_size)
+
+        if audio_format == WAVE_FORMAT_IEEE_FLOAT:
+            return raw.view(np.dtype(f'<f{bytes_per_sample}')).reshape(frame_count, channels)
+
+        if bytes_per_sample == 1:
+            # 8-bit PCM is unsigned, centred on 128
+            return raw.reshape(frame_count, channels).astype(np.int16) - 128
+
+        if bytes_per_sample in (2, 4, 8):
+            # Native widths can be viewed directly
+            return raw.view(np.dtype(f'<i{bytes_per_sample}')).reshape(frame_count, channels)
+
+        # Odd widths: copy the bytes of each sample to the top of a wider
+        # integer, then an arithmetic shift brings them down with the sign
+        width = 4 if bytes_per_sample < 4 else 8
+        padding = width - bytes_per_sample
+        wide = np.zeros((frame_count * channels, width), dtype=np.uint8)
+        wide[:, padding:] = raw.reshape(frame_count * channels, bytes_per_sample)
+        return wide.view(np.dtype(f'<i{width}')).reshape(frame_count, channels) >> (8 * padding)
+
+    @staticmethod
+    def _encode_samples(samples, bytes_per_sample, audio_format=WAVE_FORMAT_PCM):
+        """Convert an array of in-range samples (or frames) to interleaved little-endian sample bytes"""
+        if audio_format == WAVE_FORMAT_IEEE_FLOAT:
+            return samples.astype(np.dtype(f'<f{bytes_per_sample}')).tobytes()
+
+        if bytes_per_sample == 1:
+            # 8-bit PCM is unsigned, centred on 128
+            return (samples + 128).astype(np.uint8).tobytes()
+
+        if bytes_per_sample in (2, 4, 8):
+            return samples.astype(np.dtype(f'<i{bytes_per_sample}')).tobytes()
+
+        # Odd widths: keep the low bytes of each little-endian value of the next native width
+        width = 4 if bytes_per_sample < 4 else 8
+        wide = np.ascontiguousarray(samples, dtype=np.dtype(f'<i{width}')).view(np.uint8).reshape(-1, width)
+        return wide[:, :bytes_per_sample].tobytes()
+
+    @property
+    def is_float(self):
+        """Whether the samples are IEEE float, held in the -1.0 to 1.0 range"""
+        return self.header.get('audio_format') == WAVE_FORMAT_IEEE_FLOAT
+
+    @property
+    def _dtype(self):
+        """dtype of the working sample buffer for the current format"""
+        return self._working_dtype(self.bits_per_sample, self.header.get('audio_format', WAVE_FORMAT_PCM))
+
+    def _to_samples(self, values):
+        """Truncate floating point results towards zero, like int(), into the working dtype"""
+        if self.is_float:
+            return np.asarray(values, dtype=np.float64)
+        return np.trunc(values).astype(self._dtype)
+
+    def _format_header(self, audio_format, bits_per_sample):
+        """Return the header of the current audio in another sample format"""
+        block_align = self.header['channels'] * (bits_per_sample // 8)
+        return dict(self.header, audio_format=audio_format, bits_per_sample=bits_per_sample,
+                    byte_rate=self.header['sample_rate'] * block_align, block_align=block_align)
+
+    def _convert_samples(self, samples, audio_format, bits_per_sample):
+        """
+        Return samples of the current format rescaled to another sample format.
+
+        Full scale maps to full scale: PCM values are divided by 2**(bits - 1) to
+        become float and float values multiplied by it, PCM widths are shifted,
+        and narrower results are rounded to the nearest value. Out-of-range
+        samples stay out of range until they are clipped on writing.
+        """
+        if audio_format == WAVE_FORMAT_IEEE_FLOAT:
+            if self.is_float:
+                return samples
+            return samples / 2.0**(self.bits_per_sample - 1)
+
+        dtype = self._working_dtype(bits_per_sample, audio_format)
+        if self.is_float:
+            return np.rint(samples * 2.0**(bits_per_sample - 1)).astype(dtype)
+
+        shift = bits_per_sample - self.bits_per_sample
+        if shift >= 0:
+            return samples.astype(dtype) << shift
+        return ((samples + (1 << (-shift - 1))) >> -shift).astype(dtype)
+
+    # The helpers below hold the signal processing of each operation. They work on
+    # any block of samples and keep whatever they need between blocks in an explicit
+    # state dict, so the same code serves whole-file processing and streaming.
+
+    def _apply_gain(self, samples, gain_factor, no_limit):
+        """Return samples multiplied by gain_factor, optionally limited to the valid range"""
+        amplified = self._to_samples(samples * gain_factor)
+        if not no_limit:
+            np.clip(amplified, self.min_value, self.max_value, out=amplified)
+        return amplified
+
+    def _soft_clip(self, samples, threshold):
+        """
+        Return (processed, mask) where samples above threshold * max_value are
+        softly compressed with a tanh curve and mask marks the modified samples.
+        """
+        threshold_value = self.max_value * threshold
+        processed = samples.copy()
+
+        # Only samples above the threshold are soft clipped
+        magnitude = np.abs(samples)
+        mask = magnitude > threshold_value
+
+        if mask.any():
+            # Apply soft clipping using a tanh-like function
+            sign = np.where(samples[mask] > 0, 1, -1)
+            # Map to 0-1 range
+            normalized = magnitude[mask] / self.max_value
+            # Apply soft curve
+            normalized = threshold + (1 - threshold) * np.tanh((normalized - threshold) / (1 - threshold))
+            # Map back to sample range
+            processed[mask] = self._to_samples(sign * normalized * self.max_value)
+
+        return processed, mask
+
+    def _noise_floor(self, estimator, threshold_db, floor_percentile):
+        """
+        Return the noise floor in dBFS read from a NoiseFloorEstimator: the
+        floor_percentile of the detector levels, but never above threshold_db.
+        """
+        noise_floor_db = estimator.percentile(floor_percentile)
+        return threshold_db if noise_floor_db is None else min(noise_floor_db, threshold_db)
+
+    def _noise_gate(self, noise_floor_db, attack_ms, hold_ms, release_ms, detector):
+        """Return a NoiseGate for the current format that opens 6dB above noise_floor_db"""
+        return NoiseGate(self.header['sample_rate'], self.max_value, noise_floor_db, attack_ms=attack_ms,
+                         hold_ms=hold_ms, release_ms=release_ms, detector=detector)
+
+    def _dynamics(self, threshold_db, ratio, attack_ms, release_ms, makeup_db=0.0):
+        """Return a DynamicsProcessor for the current format, with threshold_db relative to full scale"""
+        return DynamicsProcessor(self.header['sample_rate'], self.max_value, threshold_db, ratio=ratio,
+                                 attack_ms=attack_ms, release_ms=release_ms, makeup_db=makeup_db,
+                                 channels=self.header['channels'])
+
+    def _loudness_meter(self, channel_weights=None):
+        """Return a LoudnessMeter for the current format"""
+        return LoudnessMeter(self.header['sample_rate'], self.max_value, self.header['channels'], channel_weights)
+
+    def _loudness_gain(self, loudness, target_lufs, max_true_peak_db):
+        """Return the gain factor that brings audio with the given LoudnessStats to target_lufs"""
+        self._log(f"Measured loudness: {loudness.integrated:.1f} LUFS, range {loudness.loudness_range:.1f} LU, "
+                  f"true peak {loudness.true_peak:.1f} dBTP")
+        gain_db = loudness.gain_db(target_lufs, max_true_peak_db)
+        if gain_db is None:
+            print("Warning: Audio too short or too quiet to measure its loudness, level left unchanged")
+            return 1.0
+        if gain_db < target_lufs - loudness.integrated:
+            self._log(f"Gain limited by the {max_true_peak_db} dBTP true peak ceiling")
+        self._log(f"Normalizing to {target_lufs} LUFS with a gain of {gain_db:+.2f} dB")
+        return 10 ** (gain_db / 20)
+
+    def _noise_spectrum(self, noise_file, frame_size=DEFAULT_FRAME_SIZE):
+        """
+        Return the average magnitude of each frequency bin of a noise reference
+        file, relative to the full scale of the reference, so that it applies
+        to audio of any sample format (see _spectral_subtractor).
+
+        Spectra are kept in the noise profile store, so a reference that was
+        already analysed with the same frame size is loaded instead of decoded.
+        """
+        with open(noise_file, 'rb') as file:
+            noise_header = read_wav_header(file)
+
+        # Bins only line up at the same sample rate; the sample format is scaled out
+        if self.header['sample_rate'] != noise_header['sample_rate']:
+            print("Warning: Noise file has a different sample rate than the main audio file")
+        if (self.header['audio_format'] != noise_header['audio_format'] or
+                self.header['bits_per_sample'] != noise_header['bits_per_sample']):
+            self._log("Noise file has a different sample format, its spectrum is rescaled to the audio")
+
+        def compute():
+            # Create a temporary ClearWaveAudio instance to load the noise file
+            noise_audio = ClearWaveAudio(quiet=self.quiet)
+            noise_audio.read_wav_file(noise_file)
+            # Create a noise profile (frequency spectrum) from the noise file
+            return noise_spectrum(noise_audio.samples, frame_size) / noise_audio.max_value
+
+        store = noise_profiles.default_store()
+        if store is None:
+            spectrum, cached = compute(), False
+        else:
+            spectrum, cached = store.get_or_compute(noise_file, frame_size, compute)
+
+        source = "Loaded cached" if cached else "Calculated"
+        self._log(f"{source} noise spectrum over {len(spectrum)} frequency bins, "
+                  f"average magnitude: {spectrum.mean():.3g} of full scale")
+        return spectrum
+
+    def _spectral_subtractor(self, spectrum, frame_size, over_subtraction, spectral_floor):
+        """
+        Return a SpectralSubtractor for a noise spectrum relative to full scale
+        (from _noise_spectrum), or one per group of channels when they are
+        spread over channel_workers threads.
+        """
+        # In the units of the samples of the current format
+        spectrum = np.asarray(spectrum) * self.max_value
+
+        def factory(channels):
+            return SpectralSubtractor(spectrum, frame_size, over_subtraction, spectral_floor, channels)
+
+        channels = self.header['channels']
+        if self.channel_workers <= 1 or channels == 1:
+            return factory(channels)
+        return ChannelGroups(factory, channels, self.channel_workers)
+
+    @staticmethod
+    def _speed_output_length(input_length, speed_factor):
+        """Return the number of samples change_speed produces from input_length samples"""
+        if speed_factor == 1.0:
+            return input_length
+        if speed_factor > 1.0:
+            new_length = math.ceil(input_length / speed_factor)
+            # Guard against rounding of the last position
+            while new_length > 0 and (new_length - 1) * speed_factor >= input_length:
+                new_length -= 1
+            return new_length
+        return int(input_length / speed_factor)
+
+    def _change_speed_block(self, samples, speed_factor, state):
+        """
+        Resample the next block of a signal by speed_factor.
+
+        Output sample k is taken from input position k * speed_factor: decimated
+        when speeding up, linearly interpolated when slowing down. state holds
+        'input_length' (total samples of the whole signal) and is updated with
+        the next output index and the input samples still needed by it; start
+        with {'input_length': n, 'next_output': 0, 'offset': 0, 'carry': None}.
+        """
+        input_length = state['input_length']
+        new_length = self._speed_output_length(input_length, speed_factor)
+
+        # Samples left over from the previous block come first
+        if state['carry'] is not None and len(state['carry']):
+            samples = np.concatenate((state['carry'], samples))
+        start = state['offset']
+        end = start + len(samples)
+
+        # Map the new positions back to the original positions
+        first = state['next_output']
+        last = min(new_length, int(end / speed_factor) + 2)
+        orig_pos = np.arange(first, max(first, last)) * speed_factor
+        # Get the integer positions before and after
+        pos_before = orig_pos.astype(np.int64)
+        if speed_factor > 1.0:
+            pos_after = pos_before
+        else:
+            pos_after = np.minimum(pos_before + 1, input_length - 1)
+
+        # Only emit outputs whose source samples have been read already
+        ready = int(np.searchsorted(pos_after, end))
+        orig_pos, pos_before, pos_after = orig_pos[:ready], pos_before[:ready], pos_after[:ready]
+
+        if speed_factor > 1.0:
+            # Speed up: Take every Nth sample based on the speed factor
+            # This is a simple decimation approach
+            new_samples = samples[pos_before - start]
+        else:
+            # Slow down: Linear interpolation between samples
+            # Calculate the fractional part for interpolation weight
+            fraction = (orig_pos - pos_before)[:, np.newaxis]
+            # Perform linear interpolation
+            new_samples = self._to_samples((1 - fraction) * samples[pos_before - start] +
+                                           fraction * samples[pos_after - start])
+
+        # Keep the input samples that later outputs still depend on
+        state['next_output'] = first + ready
+        keep_from = min(max(int(state['next_output'] * speed_factor), start), end)
+        state['carry'] = samples[keep_from - start:].copy()
+        state['offset'] = keep_from
+        return new_samples
+
+    def _record(self, name, **params):
+        """In lazy mode, append an operation to the plan and return True"""
+        if not self.lazy:
+            return False
+        self.plan.append((name, params))
+        return True
+
+    def _apply_pointwise(self, operations, block, per_sample=False):
+        """
+        Apply point-wise operations to a block of samples.
+
+        Returns:
+            tuple: (processed, modified) where modified counts the samples changed
+                   by anti_distortion, per sample if per_sample is True
+        """
+        modified = np.zeros(len(block), dtype=np.uint8) if per_sample else 0
+        for name, params in operations:
+            if name == 'amplify':
+                block = self._apply_gain(block, params['gain_factor'], params['no_limit'])
+            elif name == 'anti_distortion':
+                block, mask = self._soft_clip(block, params['threshold'])
+                modified = modified + mask if per_sample else modified + int(np.count_nonzero(mask))
+            else:
+                raise ValueError(f"Operation '{name}' is not point-wise")
+        return block, modified
+
+    def _transfer_table(self, operations):
+        """
+        Return the lookup tables (values, modified) of point-wise operations.
+
+        Every possible input sample is run through the chain once and the result
+        is cached by bit depth and operation parameters, so files of the same
+        format processed with the same settings share the tables. Returns None
+        when the format is too wide for a table.
+        """
+        if not operations or self.bits_per_sample > TRANSFER_TABLE_MAX_BITS:
+            return None
+
+        key = (self.bits_per_sample,
+               tuple((name, tuple(sorted(params.items()))) for name, params in operations))
+        table = _transfer_tables.get(key)
+        if table is not None:
+            _transfer_tables.move_to_end(key)
+            return table
+
+        domain = np.arange(self.min_value, self.max_value + 1,
+                           dtype=self._dtype)
+        table = self._apply_pointwise(operations, domain, per_sample=True)
+
+        _transfer_tables[key] = table
+        if len(_transfer_tables) > TRANSFER_TABLE_CACHE_SIZE:
+            _transfer_tables.popitem(last=False)
+        return table
+
+    def _pointwise_chain(self, operations, count_modified=True):
+        """
+        Return a function applying point-wise operations to a block of samples.
+
+        The function returns (processed, anti-distortion modified count). Blocks
+        whose samples are all within the format range are processed with a single
+        lookup per sample; other blocks (e.g. after unlimited amplification) are
+        computed directly. With count_modified False, table lookups skip the
+        count and report 0.
+        """
+        table = self._transfer_table(operations)
+
+        def apply(block):
+            if (table is not None and len(block) and
+                    block.min() >= self.min_value and block.max() <= self.max_value):
+                values, modified = table
+                index = block - self.min_value
+                return values[index], int(modified[index].sum()) if count_modified else 0
+            return self._apply_pointwise(operations, block)
+
+        return apply
+
+    def _fused_pass(self, operations, bytes_per_sample=None):
+        """
+        Apply point-wise operations to the samples in a single pass.
+
+        The samples are processed FUSION_BLOCK_SIZE at a time and every operation
+        runs on a chunk while it is still in cache, so the chain costs one pass
+        over memory and no full-length intermediate arrays.
+
+        Parameters:
+            operations (list): (name, params) entries of POINTWISE_OPERATIONS
+            bytes_per_sample (int): If given, the result is also clipped to the
+                                    valid range and encoded in the file format
+
+        Returns:
+            tuple: (output, modified_count, clipped_count) where output is the
+                   processed samples, or the sample bytes when encoding. The counts
+                   are None when not wanted (see quiet) or not applicable.
+        """
+        counting = self._counting
+        chain = self._pointwise_chain(operations, count_modified=counting)
+        modified_count = 0
+
+        length = len(self.samples)
+        channels = self.samples.shape[1]
+        if bytes_per_sample is None:
+            output = np.empty(self.samples.shape, dtype=self._dtype)
+        else:
+            output = bytearray(self.samples.size * bytes_per_sample)
+        frame_size = channels * (bytes_per_sample or 0)
+        clipped_count = 0
+
+        # Chunks of about FUSION_BLOCK_SIZE samples, whatever the channel count
+        block_frames = max(1, FUSION_BLOCK_SIZE // channels)
+        for start in range(0, length, block_frames):
+            block, block_modified = chain(self.samples[start:start + block_frames])
+            modified_count += block_modified
+
+            if bytes_per_sample is None:
+                output[start:start + len(block)] = block
+                continue
+
+            # Clip the samples to fit in the WAV format
+            if counting:
+                clipped_count += int(np.count_nonzero(block > self.max_value) +
+                                     np.count_nonzero(block < self.min_value))
+            block = np.clip(block, self.min_value, self.max_value)
+            output[start * frame_size:(start + len(block)) * frame_size] = \
+                self._encode_samples(block, bytes_per_sample, self.header['audio_format'])
+
+        if not any(name == 'anti_distortion' for name, params in operations) or not counting:
+            modified_count = None
+        elif not self.quiet:
+            percent_modified = (modified_count / self.samples.size) * 100 if length else 0
+            print(f"Anti-distortion modified {modified_count} samples ({percent_modified:.2f}% of total)")
+
+        if bytes_per_sample is None or not counting:
+            clipped_count = None
+        return output, modified_count, clipped_count
+
+    def _pointwise_pass(self, operations):
+        """Replace the samples with the result of a fused pass, measured as one stage"""
+        with self._measure('+'.join(name for name, params in operations)) as metrics:
+            previous = self._stats
+            self.samples, metrics.modified_count, _ = self._fused_pass(operations)
+            self._derive_stats(previous, lambda extremes: self._apply_pointwise(operations, extremes)[0])
+
+    def _execute_plan(self, plan):
+        """
+        Run a recorded plan and return its trailing point-wise operations unapplied,
+        so the caller can fuse them with its own pass.
+        """
+        lazy, self.lazy = self.lazy, False
+        try:
+            pending = []
+            for name, params in plan:
+                if name in POINTWISE_OPERATIONS:
+                    pending.append((name, params))
+                    continue
+                # Other operations need their whole input, so the pending group runs first
+                if pending:
+                    self._pointwise_pass(pending)
+                    pending = []
+                getattr(self, name)(**params)
+        finally:
+            self.lazy = lazy
+        return pending
+
+    def execute(self):
+        """
+        Run the operations recorded in lazy mode.
+
+        Consecutive point-wise operations (amplify, anti_distortion) are fused
+        into a single pass; the noise reductions and change_speed run on their
+        own because they depend on neighbouring samples or the whole signal.
+
+        Returns:
+            self: The ClearWaveAudio instance for method chaining
+        """
+        plan, self.plan = self.plan, []
+        if plan:
+            self._log(f"Executing {len(plan)} planned operation(s)")
+            pending = self._execute_plan(plan)
+            if pending:
+                self._pointwise_pass(pending)
+        return self
+
+    def _set_format(self, header):
+        """Adopt the audio format described by a header dict from read_wav_header"""
+        bits_per_sample = header['bits_per_sample']
+        audio_format = header.get('audio_format', WAVE_FORMAT_PCM)
+        if audio_format == WAVE_FORMAT_IEEE_FLOAT:
+            if bits_per_sample not in (32, 64):
+                raise ValueError(f"Unsupported {bits_per_sample}-bit IEEE float format, expected 32 or 64-bit")
+        elif audio_format != WAVE_FORMAT_PCM:
+            raise ValueError(f"Unsupported audio format {audio_format}, expected PCM or IEEE float")
+        elif bits_per_sample % 8 or not 8 <= bits_per_sample <= 64:
+            raise ValueError(f"Unsupported {bits_per_sample}-bit PCM format")
+        if header['channels'] < 1:
+            raise ValueError("Not a valid WAV file")
+
+        self.header = {
+            'audio_format': audio_format,
+            'channels': header['channels'],
+            'sample_rate': header['sample_rate'],
+            'bits_per_sample': bits_per_sample,
+            'byte_rate': header['byte_rate'],
+            'block_align': header['block_align'],
+            'channel_mask': header.get('channel_mask', 0)
+        }
+        self.bits_per_sample = bits_per_sample
+        if audio_format == WAVE_FORMAT_IEEE_FLOAT:
+            self.max_value = 1.0
+            self.min_value = -1.0
+        else:
+            self.max_value = 2**(bits_per_sample - 1) - 1
+            self.min_value = -2**(bits_per_sample - 1)
+        # Clip counts depend on the format range
+        self._stats = None
+
     def read_wav_file(self, filename):
-        """Read and parse a WAV file"""
-        with open(filename, 'rb') as file:
-            # Read RIFF header
-            riff = file.read(4)
-            if riff != b'RIFF':
-                raise ValueError("Not a valid WAV file")
-            
-            # Read file size (minus 8 bytes)
-            file_size = int.from_bytes(file.read(4), byteorder='little')
-            
-            # Read WAVE format
-            wave = file.read(4)
-            if wave != b'WAVE':
-                raise ValueError("Not a valid WAV file")
-            
-            # Read fmt chunk
-            fmt = file.read(4)
-            if fmt != b'fmt ':
-                raise ValueError("Not a valid WAV file")
-            
-            # Read chunk size
-            chunk_size = int.from_bytes(file.read(4), byteorder='little')
-            
-            # Read audio format
-            audio_format = int.from_bytes(file.read(2), byteorder='little')
-            
-            # Read number of channels
-            channels = int.from_bytes(file.read(2), byteorder='little')
-            if channels != 1:
-                print("Warning: This file is not mono. Only the first channel will be processed.")
-            
-            # Read sample rate
-            sample_rate = int.from_bytes(file.read(4), byteorder='little')
-            
-            # Read byte rate
-            byte_rate = int.from_bytes(file.read(4), byteorder='little')
-            
-            # Read block align
-            block_align = int.from_bytes(file.read(2), byteorder='little')
-            
-            # Read bits per sample
-            bits_per_sample = int.from_bytes(file.read(2), byteorder='little')
-            
-            # Skip any extra parameters in fmt chunk
-            if chunk_size > 16:
-                file.read(chunk_size - 16)
-            
-            # Look for data chunk
-            while True:
-                chunk_id = file.read(4)
-                if not chunk_id:
-                    raise ValueError("No data chunk found")
-                
-                if chunk_id == b'data':
-                    break
-                
-                # Skip this chunk
-                chunk_size = int.from_bytes(file.read(4), byteorder='little')
-                file.read(chunk_size)
-            
-            # Read data size
-            data_size = int.from_bytes(file.read(4), byteorder='little')
-            
-            # Read audio data
-            audio_data = file.read(data_size)
-            
-            # Convert to samples
-            samples = []
+        """Read and parse a WAV file (8 to 64-bit PCM or 32/64-bit IEEE float)"""
+        # Map the audio data instead of reading it into an intermediate copy
+        header, audio_data = map_wav_data(filename)
+        channels = header['channels']
+        sample_rate = header['sample_rate']
+        bits_per_sample = header['bits_per_sample']
+
+        with self._measure('read_wav_file') as metrics:
+            self._set_format(header)
+
+            # Convert to samples in bulk, a chunk at a time so that the
+            # statistics are gathered while each chunk is in cache
             bytes_per_sample = bits_per_sample // 8
-            for i in range(0, len(audio_data), bytes_per_sample * channels):
-                sample = int.from_bytes(audio_data[i:i+bytes_per_sample], byteorder='little', signed=True)
-                samples.append(sample)
-            
-            self.header = {
-                'channels': channels,
-                'sample_rate': sample_rate,
-                'bits_per_sample': bits_per_sample,
-                'byte_rate': byte_rate,
-                'block_align': block_align
-            }
+            frame_size = bytes_per_sample * channels
+            samples = np.empty((len(audio_data) // frame_size, channels), dtype=self._dtype)
+            accumulator = self._accumulator()
+            block_frames = max(1, FUSION_BLOCK_SIZE // channels)
+            for start in range(0, len(samples), block_frames):
+                chunk = audio_data[start * frame_size:(start + block_frames) * frame_size]
+                block = samples[start:start + block_frames]
+                block[:] = self._decode_samples(chunk, bytes_per_sample, channels, header['audio_format'])
+                if accumulator is not None:
+                    accumulator.add(block)
+
             self.samples = samples
-            self.bits_per_sample = bits_per_sample
-            self.max_value = 2**(bits_per_sample - 1) - 1
-            self.min_value = -2**(bits_per_sample - 1)
-            
-            print(f"Loaded WAV file: {len(samples)} samples, {sample_rate}Hz, {bits_per_sample}-bit, max_value= {self.max_value}, min_value= {self.min_value} ")
-            
-    def write_wav_file(self, filename):
-        """Write the processed audio data to a new WAV file"""
+            if accumulator is not None:
+                self._stats = accumulator.result()
+            metrics.input_samples = len(samples)
+
+        kind = ' float' if self.is_float else ''
+        layout = '' if channels == 1 else f" x {channels} channels"
+        self._log(f"Loaded WAV file: {len(samples)} samples{layout}, {sample_rate}Hz, {bits_per_sample}-bit{kind}, max_value= {self.max_value}, min_value= {self.min_value} ")
+
+    def write_wav_file(self, filename, sample_format=None):
+        """
+        Write the processed audio data to a new WAV file.
+
+        In lazy mode the plan runs first, except for its trailing point-wise
+        operations: they are applied while encoding and are not stored in the
+        samples, so they stay in the plan. Writing again, execute() or the
+        operations recorded next still see them.
+
+        Parameters:
+            filename (str): Output WAV file
+            sample_format (str): One of SAMPLE_FORMATS to write instead of the
+                                 current format; the audio is converted first,
+                                 as by convert_format
+        """
+        if sample_format is not None:
+            self.convert_format(sample_format)
+
+        pending = []
+        if self.lazy and self.plan:
+            # Run the plan but keep its trailing point-wise operations, which are
+            # fused with clipping and encoding below. They only reach the bytes
+            # written, so they stay in the plan for whatever comes next
+            plan, self.plan = self.plan, []
+            self._log(f"Executing {len(plan)} planned operation(s)")
+            pending = self._execute_plan(plan)
+            self.plan = list(pending)
+
         channels = self.header['channels']
         sample_rate = self.header['sample_rate']
         bits_per_sample = self.header['bits_per_sample']
-        
+        audio_format = self.header['audio_format']
+        channel_mask = self.header['channel_mask']
+
         bytes_per_sample = bits_per_sample // 8
-        byte_rate = sample_rate * channels * bytes_per_sample
-        block_align = channels * bytes_per_sample
-        
-        # Determine if we need to clip the samples
-        max_sample = max(self.samples) if self.samples else 0
-        min_sample = min(self.samples) if self.samples else 0
-        
-        if max_sample > self.max_value or min_sample < self.min_value:
-            print(f"WARNING: Samples exceed normal range ({self.min_value} to {self.max_value})")
-            print(f"Current range: {min_sample} to {max_sample}")
-            print("Clipping samples to fit the WAV format...")
-            
-            # Clip the samples to fit in the WAV format
-            clipped_samples = []
-            for sample in self.samples:
-                clipped_sample = max(min(sample, self.max_value), self.min_value)
-                clipped_samples.append(clipped_sample)
-            
-            # Calculate percentage of clipped samples
-            clipped_count = sum(1 for i, s in enumerate(self.samples) 
-                            if s != clipped_samples[i])
-            clip_percentage = (clipped_count / len(self.samples)) * 100
-            print(f"Clipped {clipped_count} samples ({clip_percentage:.2f}% of total)")
-            
-            # Use clipped samples for file writing
-            write_samples = clipped_samples
-        else:
-            # No clipping needed
-            write_samples = self.samples
-        
-        # Convert samples to bytes
-        data_bytes = bytearray()
-        for sample in write_samples:
-            data_bytes.extend(sample.to_bytes(bytes_per_sample, byteorder='little', signed=True))
-        
-        data_size = len(data_bytes)
-        file_size = 36 + data_size
-        
-        with open(filename, 'wb') as file:
-            # Write RIFF header
-            file.write(b'RIFF')
-            file.write(file_size.to_bytes(4, byteorder='little'))
-            file.write(b'WAVE')
-            
-            # Write fmt chunk
-            file.write(b'fmt ')
-            file.write((16).to_bytes(4, byteorder='little'))  # Chunk size
-            file.write((1).to_bytes(2, byteorder='little'))   # PCM format
-            file.write(channels.to_bytes(2, byteorder='little'))
-            file.write(sample_rate.to_bytes(4, byteorder='little'))
-            file.write(byte_rate.to_bytes(4, byteorder='little'))
-            file.write(block_align.to_bytes(2, byteorder='little'))
-            file.write(bits_per_sample.to_bytes(2, byteorder='little'))
-            
-            # Write data chunk
-            file.write(b'data')
-            file.write(data_size.to_bytes(4, byteorder='little'))
-            file.write(data_bytes)
-        
-        print(f"Written enhanced audio to {filename}")
-        
+
+        stage = '+'.join([name for name, params in pending] + ['write_wav_file'])
+        with self._measure(stage) as metrics:
+            if self.lazy:
+                # One pass applies the pending operations, clips and encodes
+                data_bytes, metrics.modified_count, clipped_count = self._fused_pass(pending, bytes_per_sample)
+                if clipped_count:
+                    clip_percentage = (clipped_count / self.samples.size) * 100
+                    self._log(f"Clipped {clipped_count} samples ({clip_percentage:.2f}% of total)")
+            elif not self._counting:
+                # Nothing to report: clip without checking the range first,
+                # unless the statistics already show that nothing clips
+                clipped_count = None
+                write_samples = self.samples
+                if self._stats is None or self._stats.out_of_range(self.min_value, self.max_value):
+                    write_samples = np.clip(self.samples, self.min_value, self.max_value)
+                data_bytes = self._encode_samples(write_samples, bytes_per_sample, audio_format)
+            else:
+                # Determine if we need to clip the samples
+                min_sample, max_sample = self._sample_range()
+                clipped_count = 0
+
+                if max_sample > self.max_value or min_sample < self.min_value:
+                    self._log(f"WARNING: Samples exceed normal range ({self.min_value} to {self.max_value})")
+                    self._log(f"Current range: {min_sample} to {max_sample}")
+                    self._log("Clipping samples to fit the WAV format...")
+
+                    # Calculate percentage of clipped samples
+                    clipped_count = self._stats.clip_count
+                    if clipped_count is None:
+                        clipped_count = int(np.count_nonzero(self.samples > self.max_value) +
+                                            np.count_nonzero(self.samples < self.min_value))
+                    clip_percentage = (clipped_count / self.samples.size) * 100
+                    self._log(f"Clipped {clipped_count} samples ({clip_percentage:.2f}% of total)")
+
+                    # Clip the samples to fit in the WAV format
+                    write_samples = np.clip(self.samples, self.min_value, self.max_value)
+                else:
+                    # No clipping needed
+                    write_samples = self.samples
+
+                # Convert samples to bytes
+                data_bytes = self._encode_samples(write_samples, bytes_per_sample, audio_format)
+
+            metrics.clipped_count = clipped_count
+            data_size = len(data_bytes)
+
+            with open(filename, 'wb') as file:
+                write_wav_header(file, channels, sample_rate, bits_per_sample, data_size, audio_format, channel_mask)
+                file.write(data_bytes)
+
+        self._log(f"Written enhanced audio to {filename}")
+
     def amplify(self, gain_factor=2.0, no_limit=True):
         """
         Apply amplification to the audio samples with optional limiting.
-        
+
         Parameters:
             gain_factor (float): The amplification factor to apply
             no_limit (bool): If True, allows samples to exceed the normal range
                             If False, clips samples to the valid range
-        
+
         Returns:
             self: The ClearWaveAudio instance for method chaining
         """
-        print(f"Applying amplification with gain factor: {gain_factor}, limit: {'disabled' if no_limit else 'enabled'}")
+        if self._record('amplify', gain_factor=gain_factor, no_limit=no_limit):
+            return self
+
+        self._log(f"Applying amplification with gain factor: {gain_factor}, limit: {'disabled' if no_limit else 'enabled'}")
 
-        print("Before amplification (first 10 samples):", self.samples[:10])
+        previous = self._stats
+        if self.quiet:
+            with self._measure('amplify'):
+                self.samples = self._apply_gain(self.samples, gain_factor, no_limit)
+                self._derive_stats(previous, lambda x: self._apply_gain(x, gain_factor, no_limit))
+            return self
+
+        print("Before amplification (first 10 samples):", self.samples[:10].tolist())
 
-        amplified = []
-        for sample in self.samples:
-            # Apply the gain factor
-            new_sample = int(sample * gain_factor)
-            
-            # Apply limiting only if requested
-            if not no_limit:
-                new_sample = max(min(new_sample, self.max_value), self.min_value)
-                
-            amplified.append(new_sample)
+        # Apply the gain factor, limiting only if requested
+        with self._measure('amplify'):
+            self.samples = self._apply_gain(self.samples, gain_factor, no_limit)
+            self._derive_stats(previous, lambda x: self._apply_gain(x, gain_factor, no_limit))
 
-        self.samples = amplified
+        print("After amplification (first 10 samples):", self.samples[:10].tolist())
 
-        print("After amplification (first 10 samples):", self.samples[:10])
-        
         # Show warning if samples are out of range
-        max_sample = max(self.samples) if self.samples else 0
-        min_sample = min(self.samples) if self.samples else 0
-        
+        min_sample, max_sample = self._sample_range()
+
         if max_sample > self.max_value or min_sample < self.min_value:
             print(f"WARNING: Samples exceed normal range ({self.min_value} to {self.max_value})")
             print(f"Current range: {min_sample} to {max_sample}")
-            
+
         return self
 
     def anti_distortion(self, threshold=0.8):
         """Apply soft clipping to prevent harsh distortion"""
-        print(f"Applying anti-distortion with threshold: {threshold}")
-        
+        if self._record('anti_distortion', threshold=threshold):
+            return self
+
+        self._log(f"Applying anti-distortion with threshold: {threshold}")
+
+        previous = self._stats
+        if self.quiet:
+            with self._measure('anti_distortion') as metrics:
+                self.samples, mask = self._soft_clip(self.samples, threshold)
+                self._derive_stats(previous, lambda x: self._soft_clip(x, threshold)[0])
+                if self.observer is not None:
+                    metrics.modified_count = int(np.count_nonzero(mask))
+            return self
+
         # Save the original samples for comparison
-        original_first_10 = self.samples[:10]
+        original_first_10 = self.samples[:10].tolist()
         print("Before anti-distortion (first 10 samples):", original_first_10)
-        
-        threshold_value = int(self.max_value * threshold)
+
+        threshold_value = self.max_value * threshold if self.is_float else int(self.max_value * threshold)
         print(f"Threshold value: {threshold_value} (±{threshold * 100}% of max)")
-        
-        processed = []
-        modified_count = 0
-        
-        for sample in self.samples:
-            if abs(sample) > threshold_value:
-                # Apply soft clipping using a tanh-like function
-                sign = 1 if sample > 0 else -1
-                # Map to 0-1 range
-                normalized = abs(sample) / self.max_value
-                # Apply soft curve
-                normalized = threshold + (1 - threshold) * math.tanh((normalized - threshold) / (1 - threshold))
-                # Map back to sample range
-                processed_sample = int(sign * normalized * self.max_value)
-                processed.append(processed_sample)
-                modified_count += 1
-            else:
-                processed.append(sample)
-        
-        self.samples = processed
-        
-        print("After anti-distortion (first 10 samples):", self.samples[:10])
-        
+
+        original = self.samples
+        with self._measure('anti_distortion') as metrics:
+            processed, mask = self._soft_clip(original, threshold)
+            modified_count = int(np.count_nonzero(mask))
+            metrics.modified_count = modified_count
+
+            self.samples = processed
+            self._derive_stats(previous, lambda x: self._soft_clip(x, threshold)[0])
+
+        print("After anti-distortion (first 10 samples):", self.samples[:10].tolist())
+
         # Find the first few modified samples to show as example
-        example_modified = []
-        example_original = []
-        example_indices = []
-        count = 0
-        
-        for i, (orig, proc) in enumerate(zip(self.samples, processed)):
-            if orig != proc and count < 5:
-                example_indices.append(i)
-                example_original.append(orig)
-                example_modified.append(proc)
-                count += 1
-        
-        if example_indices:
+        example_indices = np.argwhere(original != processed)[:5]
+
+        if len(example_indices):
             print("\nExample of modified samples:")
-            for idx, orig, mod in zip(example_indices, example_original, example_modified):
-                print(f"Sample #{idx}: {orig} → {mod} (delta: {mod - orig})")
-        
+            for idx, channel in example_indices.tolist():
+                orig, mod = original[idx, channel].item(), processed[idx, channel].item()
+                where = f"Sample #{idx}" if original.shape[1] == 1 else f"Sample #{idx} (channel {channel})"
+                print(f"{where}: {orig} → {mod} (delta: {mod - orig})")
+
         # Calculate percentage of modified samples
-        percent_modified = (modified_count / len(self.samples)) * 100 if self.samples else 0
+        percent_modified = (modified_count / self.samples.size) * 100 if self.samples.size else 0
         print(f"\nAnti-distortion modified {modified_count} samples ({percent_modified:.2f}% of total)")
-        
+
         return self
-    
-    def reduce_noise(self, threshold_db=-60):
-        """Simple noise gate to reduce background noise"""
-        print(f"Applying noise reduction with threshold: {threshold_db}dB")
-        
-        # Convert threshold from dB to linear
-        threshold = self.max_value * (10 ** (threshold_db / 20))
-        
-        # Calculate noise profile from "silent" portions
-        noise_samples = [abs(s) for s in self.samples if abs(s) < threshold]
-        if noise_samples:
-            noise_floor = sum(noise_samples) / len(noise_samples)
-        else:
-            noise_floor = 0
-        
-        print(f"Detected noise floor: {noise_floor}")
-        
-        # Apply noise reduction
-        processed = []
-        
-        # For a simple version, we'll use a basic noise gate with a release tail
-        release_time = int(self.header['sample_rate'] * 0.1)  # 100ms release
-        gate_open = False
-        remaining_release = 0
-        
-        for sample in self.samples:
-            if abs(sample) > noise_floor * 2:
-                # Signal above threshold, open gate
-                gate_open = True
-                remaining_release = release_time
-                processed.append(sample)
-            elif gate_open and remaining_release > 0:
-                # In release phase
-                attenuation = remaining_release / release_time
-                processed.append(int(sample * attenuation))
-                remaining_release -= 1
-            else:
-                # Gate closed
-                gate_open = False
-                # Attenuate but don't completely remove
-                processed.append(int(sample * 0.1))
-        
-        self.samples = processed
+
+    def reduce_noise(self, threshold_db=-60, attack_ms=5.0, hold_ms=50.0, release_ms=100.0,
+                     floor_percentile=10.0, detector='rms'):
+        """
+        Noise gate to reduce background noise.
+
+        The envelope is measured on short blocks (see noise_gate.DETECTOR_SECONDS).
+        The noise floor is the floor_percentile of the block levels, capped at
+        threshold_db; blocks more than 6dB above it open the gate, and the gain
+        of the rest is reduced to 0.1 after the hold and release times.
+
+        Parameters:
+            threshold_db (float): Highest level in dBFS accepted as the noise floor
+            attack_ms (float): Time for the gate to open fully
+            hold_ms (float): Time the gate stays open after the signal drops
+            release_ms (float): Time for the gate to close after the hold
+            floor_percentile (float): Percentile of the block levels taken as the noise floor
+            detector (str): 'rms' or 'peak' envelope detector
+
+        Returns:
+            ClearWaveAudio: self
+        """
+        if self._record('reduce_noise', threshold_db=threshold_db, attack_ms=attack_ms, hold_ms=hold_ms,
+                        release_ms=release_ms, floor_percentile=floor_percentile, detector=detector):
+            return self
+
+        self._log(f"Applying noise reduction with threshold: {threshold_db}dB")
+
+        with self._measure('reduce_noise'):
+            # One pass over the samples measures the envelope; the noise floor and
+            # the gate then only need the block levels
+            block_length = detector_block_length(self.header['sample_rate'])
+            levels = block_levels(self.samples, block_length, self.max_value, detector)
+            estimator = NoiseFloorEstimator()
+            estimator.add(levels)
+            noise_floor_db = self._noise_floor(estimator, threshold_db, floor_percentile)
+
+            self._log(f"Detected noise floor: {noise_floor_db:.1f} dBFS")
+
+            gate = self._noise_gate(noise_floor_db, attack_ms, hold_ms, release_ms, detector)
+            accumulator = self._accumulator()
+            processed = np.empty_like(self.samples)
+            chunk_size = max(1, FUSION_BLOCK_SIZE // block_length) * block_length
+            for start in range(0, len(self.samples), chunk_size):
+                chunk = self.samples[start:start + chunk_size]
+                first = start // block_length
+                chunk_levels = levels[first:first + math.ceil(len(chunk) / block_length)]
+                processed[start:start + len(chunk)] = self._to_samples(gate.gate_blocks(chunk, chunk_levels))
+                if accumulator is not None:
+                    accumulator.add(processed[start:start + len(chunk)])
+
+            self.samples = processed
+            if accumulator is not None:
+                self._stats = accumulator.result()
         return self
-    
-    def reduce_noise_with_reference(self, noise_file):
-        
-        print(f"Applying noise reduction using reference file: {noise_file}")
-        
-        # Create a temporary ClearWaveAudio instance to load the noise file
-        noise_audio = ClearWaveAudio()
-        noise_audio.read_wav_file(noise_file)
-        
-        # Check if the audio formats are compatible
-        if (self.header['sample_rate'] != noise_audio.header['sample_rate'] or 
-            self.header['bits_per_sample'] != noise_audio.header['bits_per_sample']):
-            print("Warning: Noise file has different format than the main audio file")
-        
-        # Create a noise profile (frequency spectrum) from the noise file
-        # For a simple approach, we'll just calculate the average magnitude of noise
-        noise_profile = sum(abs(sample) for sample in noise_audio.samples) / len(noise_audio.samples)
-        print(f"Calculated noise profile with average magnitude: {noise_profile}")
-        
-        # Apply spectral subtraction (simplified version)
-        # In a real implementation, this would use FFT for frequency-domain processing
-        processed = []
-        for sample in self.samples:
-            # Simple noise reduction: if the sample is below the noise profile threshold,
-            # reduce it significantly. If it's above, reduce it by a smaller amount.
-            if abs(sample) <= noise_profile * 1.5:
-                # Reduce noise significantly (80%)
-                new_sample = int(sample * 0.2)
-            else:
-                # For signal above noise floor, apply gentler reduction
-                # The amount of reduction decreases as the signal gets stronger
-                ratio = min(1.0, (abs(sample) - noise_profile) / (self.max_value - noise_profile))
-                reduction_factor = 0.2 + (0.8 * ratio)
-                new_sample = int(sample * reduction_factor)
-            
-            processed.append(new_sample)
-        
-        self.samples = processed
-        print(f"Noise reduction complete using '{noise_file}' as reference")
+
+    def reduce_noise_with_reference(self, noise_file, over_subtraction=1.0, spectral_floor=0.05,
+                                    frame_size=DEFAULT_FRAME_SIZE):
+        """
+        Reduce stationary background noise by spectral subtraction.
+
+        The average spectrum of the noise reference is subtracted from every
+        windowed STFT frame of the audio, which is then resynthesized by overlap-add.
+
+        Parameters:
+            noise_file (str): WAV file containing only background noise
+            over_subtraction (float): Multiple of the noise spectrum to subtract
+            spectral_floor (float): Minimum fraction of each bin's magnitude to keep
+            frame_size (int): STFT frame length in samples
+
+        Returns:
+            self: The ClearWaveAudio instance for method chaining
+        """
+        if self._record('reduce_noise_with_reference', noise_file=noise_file, over_subtraction=over_subtraction,
+                        spectral_floor=spectral_floor, frame_size=frame_size):
+            return self
+
+        self._log(f"Applying noise reduction using reference file: {noise_file}")
+
+        with self._measure('reduce_noise_with_reference'):
+            spectrum = self._noise_spectrum(noise_file, frame_size)
+            subtractor = self._spectral_subtractor(spectrum, frame_size, over_subtraction, spectral_floor)
+
+            # Apply spectral subtraction
+            self._run_blocks(lambda block: self._to_samples(subtractor.process(block)),
+                             lambda: self._to_samples(subtractor.flush()))
+        self._log(f"Noise reduction complete using '{noise_file}' as reference")
         return self
-    
-    def change_speed(self, speed_factor=1.0):
+
+    def limit(self, ceiling_db=-1.0, attack_ms=5.0, release_ms=50.0):
+        """
+        Look-ahead peak limiter: a smooth alternative to anti_distortion and to
+        the hard clipping of write_wav_file.
+
+        The gain starts falling attack_ms before each peak that would exceed the
+        ceiling, so no sample ends up above it, and recovers over release_ms
+        (see dynamics.DynamicsProcessor).
+
+        Parameters:
+            ceiling_db (float): Highest peak level in dBFS, at most 0
+            attack_ms (float): Look-ahead, over which the gain ramps down
+            release_ms (float): Time for the gain to recover from silence to 1
+
+        Returns:
+            self: The ClearWaveAudio instance for method chaining
+        """
+        if ceiling_db > 0:
+            raise ValueError("Limiter ceiling must be at most 0 dBFS")
+        if attack_ms < 0 or release_ms <= 0:
+            raise ValueError("Attack must not be negative and release must be greater than 0")
+
+        if self._record('limit', ceiling_db=ceiling_db, attack_ms=attack_ms, release_ms=release_ms):
+            return self
+
+        self._log(f"Limiting peaks to {ceiling_db} dBFS with {attack_ms}ms look-ahead")
+
+        with self._measure('limit'):
+            limiter = self._dynamics(ceiling_db, math.inf, attack_ms, release_ms)
+            self._run_blocks(lambda block: self._to_samples(limiter.process(block)),
+                             lambda: self._to_samples(limiter.flush()))
+        return self
+
+    def compress(self, threshold_db=-20.0, ratio=4.0, attack_ms=5.0, release_ms=100.0, makeup_db=0.0):
+        """
+        Look-ahead dynamic range compressor.
+
+        Peaks above threshold_db are reduced by 1 - 1 / ratio of their excess in
+        dB, with the gain ramping down over attack_ms before each peak and back
+        up over release_ms (see dynamics.DynamicsProcessor). makeup_db can push
+        the result back over full scale; follow with limit() to catch it.
+
+        Parameters:
+            threshold_db (float): Level in dBFS above which peaks are compressed
+            ratio (float): Compression ratio, at least 1
+            attack_ms (float): Look-ahead, over which the gain ramps down
+            release_ms (float): Time for the gain to recover from silence to 1
+            makeup_db (float): Gain in dB applied after compression
+
+        Returns:
+            self: The ClearWaveAudio instance for method chaining
+        """
+        if ratio < 1:
+            raise ValueError("Ratio must be at least 1")
+        if attack_ms < 0 or release_ms <= 0:
+            raise ValueError("Attack must not be negative and release must be greater than 0")
+
+        if self._record('compress', threshold_db=threshold_db, ratio=ratio, attack_ms=attack_ms,
+                        release_ms=release_ms, makeup_db=makeup_db):
+            return self
+
+        self._log(f"Compressing above {threshold_db} dBFS with ratio {ratio}:1")
+
+        with self._measure('compress'):
+            compressor = self._dynamics(threshold_db, ratio, attack_ms, release_ms, makeup_db)
+            self._run_blocks(lambda block: self._to_samples(compressor.process(block)),
+                             lambda: self._to_samples(compressor.flush()))
+        return self
+
+    def _planned_pointwise(self):
+        """
+        In lazy mode, run the recorded plan except for its trailing point-wise
+        operations, which stay in the plan.
+
+        Returns:
+            function: Applies those operations to a block, as returned by
+                      _pointwise_chain, or None when there are none
+        """
+        if not (self.lazy and self.plan):
+            return None
+        plan, self.plan = self.plan, []
+        self._log(f"Executing {len(plan)} planned operation(s)")
+        self.plan = self._execute_plan(plan)
+        return self._pointwise_chain(self.plan, count_modified=False) if self.plan else None
+
+    def _analysis_pass(self, analyze, chain=None):
+        """
+        Feed the samples to analyze() FUSION_BLOCK_SIZE samples at a time,
+        through chain (from _planned_pointwise) if given, so that the blocks are
+        those a lazy plan would produce without the plan being applied.
+        """
+        block_frames = max(1, FUSION_BLOCK_SIZE // self.samples.shape[1])
+        for start in range(0, len(self.samples), block_frames):
+            block = self.samples[start:start + block_frames]
+            analyze(chain(block)[0] if chain is not None else block)
+
+    def measure_loudness(self, channel_weights=None):
+        """
+        Measure the loudness of the audio after EBU R128 in one pass: integrated
+        loudness over 400ms blocks with absolute and relative gates, loudness
+        range over 3s windows and true peak (see loudness.LoudnessMeter).
+
+        Parameters:
+            channel_weights (list): Weight of each channel's power; by default
+                                    1.0, with the 5.0 and 5.1 surround channels
+                                    at 1.41 and the LFE channel left out
+
+        Returns:
+            loudness.LoudnessStats: Integrated loudness, loudness range and true peak
+        """
+        chain = self._planned_pointwise()
+        with self._measure('measure_loudness'):
+            meter = self._loudness_meter(channel_weights)
+            self._analysis_pass(meter.process, chain)
+            loudness = meter.result()
+        self._log(f"Loudness: {loudness.integrated:.1f} LUFS, range {loudness.loudness_range:.1f} LU, "
+                  f"true peak {loudness.true_peak:.1f} dBTP")
+        return loudness
+
+    def normalize_loudness(self, target_lufs=-23.0, max_true_peak_db=None):
+        """
+        Apply the gain that brings the integrated loudness to target_lufs.
+
+        The loudness is measured in one pass (see measure_loudness), then the
+        gain is applied like amplify without limiting. In lazy mode the gain is
+        recorded in the plan as an amplify, so it is fused with the point-wise
+        operations around it and with writing the file.
+
+        Parameters:
+            target_lufs (float): Integrated loudness to reach, e.g. -23 (EBU R128)
+                                 or -16 (streaming platforms)
+            max_true_peak_db (float): If given, the gain is lowered when needed
+                                      to keep the true peak at or below this level
+
+        Returns:
+            self: The ClearWaveAudio instance for method chaining
+        """
+        if max_true_peak_db is not None and max_true_peak_db > 0:
+            raise ValueError("True peak ceiling must be at most 0 dBTP")
+
+        chain = self._planned_pointwise()
+        with self._measure('normalize_loudness'):
+            meter = self._loudness_meter()
+            self._analysis_pass(meter.process, chain)
+            gain_factor = self._loudness_gain(meter.result(), target_lufs, max_true_peak_db)
+            if not self.lazy:
+                previous = self._stats
+                self.samples = self._apply_gain(self.samples, gain_factor, True)
+                self._derive_stats(previous, lambda x: self._apply_gain(x, gain_factor, True))
+
+        if self.lazy:
+            self.plan.append(('amplify', {'gain_factor': gain_factor, 'no_limit': True}))
+        return self
+
+    def change_speed(self, speed_factor=1.0, method='wsola'):
         """
         Change the playback speed of audio without affecting pitch.
-        
+
         Parameters:
             speed_factor (float): Speed multiplier
                                 > 1.0: Faster playback (e.g., 2.0 = twice as fast)
                                 < 1.0: Slower playback (e.g., 0.5 = half speed)
                                 = 1.0: No change
-        
+            method (str): 'wsola' time-stretches with waveform similarity overlap-add,
+                          keeping the pitch and sample rate. 'resample' keeps the
+                          previous behaviour: decimation or linear interpolation
+                          followed by a sample rate change, which alters the pitch.
+
         Returns:
             self: The ClearWaveAudio instance for method chaining
         """
         if speed_factor <= 0:
             raise ValueError("Speed factor must be greater than 0")
-        
-        print(f"Changing playback speed by factor: {speed_factor}")
-        
+        if method not in SPEED_METHODS:
+            raise ValueError(f"Unknown speed change method '{method}', expected one of {', '.join(SPEED_METHODS)}")
+
+        if self._record('change_speed', speed_factor=speed_factor, method=method):
+            return self
+
+        self._log(f"Changing playback speed by factor: {speed_factor}")
+
         if speed_factor == 1.0:
-            print("Speed unchanged")
+            self._log("Speed unchanged")
             return self
-        
+
         # Store original sample count
         original_length = len(self.samples)
-        print(f"Original number of samples: {original_length}")
-        
+        self._log(f"Original number of samples: {original_length}")
+
+        if method == 'wsola':
+            # Rearrange overlapping frames of the waveform; the sample rate is unchanged
+            with self._measure('change_speed'):
+                stretcher = TimeStretcher(speed_factor, self.header['sample_rate'], channels=self.header['channels'])
+                self._run_blocks(lambda block: self._to_samples(stretcher.process(block)),
+                                 lambda: self._to_samples(stretcher.flush()))
+            self._log(f"New number of samples: {len(self.samples)}")
+            self._log(f"Speed change complete. Duration is now {100/speed_factor:.1f}% of original")
+            return self
+
         # For speeding up (speed_factor > 1), we take fewer samples
         # For slowing down (speed_factor < 1), we take more samples through interpolation
-        new_samples = []
-        
-        if speed_factor > 1.0:
-            # Speed up: Take every Nth sample based on the speed factor
-            # This is a simple decimation approach
-            step = speed_factor
-            idx = 0
-            while idx < original_length:
-                new_samples.append(self.samples[int(idx)])
-                idx += step
-        else:
-            # Slow down: Linear interpolation between samples
-            # For each new sample position, calculate the weighted average of adjacent original samples
-            new_length = int(original_length / speed_factor)
-            for i in range(new_length):
-                # Map the new position back to the original position
-                orig_pos = i * speed_factor
-                # Get the integer positions before and after
-                pos_before = int(orig_pos)
-                pos_after = min(pos_before + 1, original_length - 1)
-                # Calculate the fractional part for interpolation weight
-                fraction = orig_pos - pos_before
-                # Perform linear interpolation
-                interpolated = int((1 - fraction) * self.samples[pos_before] + 
-                                fraction * self.samples[pos_after])
-                new_samples.append(interpolated)
-        
-        # Update samples
-        self.samples = new_samples
-        
+        with self._measure('change_speed'):
+            state = {'input_length': original_length, 'next_output': 0, 'offset': 0, 'carry': None}
+            empty = np.zeros((0, self.header['channels']), dtype=self._dtype)
+            self._run_blocks(lambda block: self._change_speed_block(block, speed_factor, state), lambda: empty)
+
         # Update sample rate in header (technically this changes pitch in standard players,
         # but it's needed to maintain correct playback duration)
         new_sample_rate = int(self.header['sample_rate'] * speed_factor)
-        print(f"Adjusted sample rate from {self.header['sample_rate']} to {new_sample_rate} Hz")
+        self._log(f"Adjusted sample rate from {self.header['sample_rate']} to {new_sample_rate} Hz")
         self.header['sample_rate'] = new_sample_rate
-        
+
         # Update byte rate in header
         self.header['byte_rate'] = new_sample_rate * self.header['channels'] * (self.header['bits_per_sample'] // 8)
-        
-        print(f"New number of samples: {len(self.samples)}")
-        print(f"Speed change complete. Duration is now {100/speed_factor:.1f}% of original")
-        
-        return self        
\ No newline at end of file
+
+        self._log(f"New number of samples: {len(self.samples)}")
+        self._log(f"Speed change complete. Duration is now {100/speed_factor:.1f}% of original")
+
+        return self
+
+    def convert_format(self, sample_format):
+        """
+        Convert the samples to another sample format, e.g. 24-bit PCM to float.
+
+        Parameters:
+            sample_format (str): One of SAMPLE_FORMATS: 'pcm8', 'pcm16', 'pcm24',
+                                 'pcm32', 'float32' or 'float64'
+
+        Returns:
+            self: The ClearWaveAudio instance for method chaining
+        """
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"Unknown sample format '{sample_format}', expected one of {', '.join(SAMPLE_FORMATS)}")
+
+        if self._record('convert_format', sample_format=sample_format):
+            return self
+
+        audio_format, bits_per_sample = SAMPLE_FORMATS[sample_format]
+        if audio_format == self.header['audio_format'] and bits_per_sample == self.bits_per_sample:
+            self._log(f"Samples are already {sample_format}")
+            return self
+
+        self._log(f"Converting samples to {sample_format}")
+        with self._measure('convert_format'):
+            # The conversion is monotonic, so the new range follows from the old one
+            previous = self._stats
+            self.samples = self._convert_samples(self.samples, audio_format, bits_per_sample)
+            if previous is not None:
+                previous = previous.mapped(lambda x: self._convert_samples(x, audio_format, bits_per_sample),
+                                           -np.inf, np.inf)
+            self._set_format(self._format_header(audio_format, bits_per_sample))
+            if previous is not None:
+                previous.clip_count = 0 if not previous.out_of_range(self.min_value, self.max_value) else None
+                self._stats = previous
+        return self
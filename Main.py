@@ -24,7 +24,7 @@ def main():
     
     try:
         processor.read_wav_file(input_file)
-        max_sample = max(abs(min(processor.samples)), abs(max(processor.samples)))
+        max_sample = processor.stats.peak
         print(f"Maximum sample value before processing: {max_sample}")
         
         while True:
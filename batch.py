@@ -0,0 +1,263 @@
+import argparse
+import contextlib
+import glob
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from ClearWave import SAMPLE_FORMATS, SPEED_METHODS, read_wav_header
+from pipeline import load_pipeline, pipeline_from_spec
+from result_cache import ResultCache, default_cache
+from streaming import DEFAULT_BLOCK_SIZE, ClearWaveStream
+
+
+class _OperationAction(argparse.Action):
+    """Append (operation name, parameters) to the pipeline in command line order"""
+
+    def __init__(self, option_strings, dest, operation=None, parameter=None, convert=float, **kwargs):
+        super().__init__(option_strings, dest, **kwargs)
+        self.operation = operation
+        self.parameter = parameter
+        self.convert = convert
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        operations = getattr(namespace, self.dest) or []
+        operations.append((self.operation, {self.parameter: self.convert(values)}))
+        setattr(namespace, self.dest, operations)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Process many WAV files with the same ClearWave pipeline in parallel.",
+        epilog="Operations run in the order they are given, e.g. "
+               "--amplify 1.5 --anti-distortion 0.8 --speed 1.25")
+    parser.add_argument('inputs', nargs='+', help="Input WAV files or glob patterns")
+    parser.add_argument('-o', '--output-dir', required=True, help="Directory for the processed files")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help="Maximum number of files submitted at once (default: 2 x workers)")
+    parser.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE,
+                        help="Frames processed at a time in each worker")
+    parser.add_argument('--limit', action='store_true',
+                        help="Clip samples to the valid range when amplifying")
+    parser.add_argument('--speed-method', choices=SPEED_METHODS, default='wsola',
+                        help="How --speed changes the speed (default: wsola, which keeps the pitch)")
+    parser.add_argument('--pipeline', metavar='FILE',
+                        help="Read the operations from a JSON pipeline spec instead of the options below")
+    parser.add_argument('--cache', action='store_true',
+                        help="Serve unchanged (input, pipeline) pairs from the result cache in "
+                             "$CLEARWAVE_CACHE_DIR/results and store new results there")
+    parser.add_argument('--cache-stages', action='store_true',
+                        help="With --cache, also cache the output of every stage so that a changed "
+                             "operation only re-runs the ones after it")
+
+    pipeline = parser.add_argument_group("pipeline")
+    pipeline.add_argument('--amplify', dest='operations', metavar='GAIN', action=_OperationAction,
+                          operation='amplify', parameter='gain_factor',
+                          help="Amplify by GAIN")
+    pipeline.add_argument('--anti-distortion', dest='operations', metavar='THRESHOLD', action=_OperationAction,
+                          operation='anti_distortion', parameter='threshold',
+                          help="Soft clip above THRESHOLD (0-1)")
+    pipeline.add_argument('--noise-gate', dest='operations', metavar='DB', action=_OperationAction,
+                          operation='reduce_noise', parameter='threshold_db',
+                          help="Noise gate with a threshold in dB")
+    pipeline.add_argument('--noise-reference', dest='operations', metavar='FILE', action=_OperationAction,
+                          operation='reduce_noise_with_reference', parameter='noise_file', convert=str,
+                          help="Noise reduction using a reference WAV file")
+    pipeline.add_argument('--compress', dest='operations', metavar='DB', action=_OperationAction,
+                          operation='compress', parameter='threshold_db',
+                          help="Compress peaks above DB dBFS (ratio 4:1)")
+    pipeline.add_argument('--limiter', dest='operations', metavar='DB', action=_OperationAction,
+                          operation='limit', parameter='ceiling_db',
+                          help="Look-ahead limiter holding peaks at or below DB dBFS")
+    pipeline.add_argument('--normalize', dest='operations', metavar='LUFS', action=_OperationAction,
+                          operation='normalize_loudness', parameter='target_lufs',
+                          help="Normalize the integrated loudness to LUFS (EBU R128, e.g. -23)")
+    pipeline.add_argument('--speed', dest='operations', metavar='FACTOR', action=_OperationAction,
+                          operation='change_speed', parameter='speed_factor',
+                          help="Change playback speed by FACTOR")
+    pipeline.add_argument('--format', dest='operations', metavar='FORMAT', action=_OperationAction,
+                          operation='convert_format', parameter='sample_format', convert=str,
+                          choices=list(SAMPLE_FORMATS),
+                          help=f"Convert the samples to FORMAT ({', '.join(SAMPLE_FORMATS)})")
+    return parser
+
+
+def expand_inputs(patterns):
+    """Expand glob patterns, keeping the given order and dropping duplicates"""
+    files = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            if match not in seen:
+                seen.add(match)
+                files.append(match)
+    return files
+
+
+def _frame_count(filename):
+    with open(filename, 'rb') as file:
+        header = read_wav_header(file)
+    return header['data_size'] // ((header['bits_per_sample'] // 8) * header['channels'])
+
+
+def process_file(input_file, output_file, operations, block_size=DEFAULT_BLOCK_SIZE, cache_dir=None,
+                 cache_stages=False):
+    """
+    Stream one file through a pipeline of ClearWaveAudio operations.
+
+    With cache_dir, the result comes from a result_cache.ResultCache in that
+    directory when the same input went through the same pipeline before.
+
+    Returns:
+        tuple: (input samples, output samples, seconds)
+    """
+    start = time.perf_counter()
+    input_samples = _frame_count(input_file)
+
+    # Diagnostics of parallel workers would interleave, so they are skipped and
+    # the remaining warnings discarded
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if cache_dir is not None:
+            ResultCache(cache_dir).run(input_file, output_file, operations, cache_stages, block_size=block_size)
+            output_samples = _frame_count(output_file)
+        else:
+            stream = ClearWaveStream(block_size, quiet=True)
+            stream.operations = list(operations)
+            output_samples = stream.process(input_file, output_file)
+
+    return input_samples, output_samples, time.perf_counter() - start
+
+
+def run_batch(jobs, operations, workers, max_in_flight=None, block_size=DEFAULT_BLOCK_SIZE, cache_dir=None,
+              cache_stages=False):
+    """
+    Process (input, output) pairs on a process pool with bounded in-flight work.
+    cache_dir and cache_stages are passed to process_file.
+
+    Returns:
+        tuple: (processed files, failed files, total input samples, seconds)
+    """
+    if workers < 1:
+        raise ValueError("Number of workers must be at least 1")
+    max_in_flight = max_in_flight or 2 * workers
+
+    start = time.perf_counter()
+    processed = 0
+    failed = 0
+    total_samples = 0
+
+    def report(input_file, output_file, result=None, error=None):
+        nonlocal processed, failed, total_samples
+        if error is not None:
+            failed += 1
+            print(f"FAILED {input_file}: {error}")
+            return
+        input_samples, output_samples, seconds = result
+        processed += 1
+        total_samples += input_samples
+        rate = input_samples / seconds if seconds > 0 else 0
+        print(f"{input_file} -> {output_file}: {input_samples} samples in {seconds:.3f}s ({rate:,.0f} samples/s)")
+
+    if workers == 1:
+        # Run in this process, which keeps tracebacks and profiling simple
+        for input_file, output_file in jobs:
+            try:
+                report(input_file, output_file, process_file(input_file, output_file, operations, block_size,
+                                                             cache_dir, cache_stages))
+            except Exception as e:
+                report(input_file, output_file, error=e)
+    else:
+        pending = {}
+        job_iter = iter(jobs)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                # Keep at most max_in_flight files submitted
+                for input_file, output_file in job_iter:
+                    future = executor.submit(process_file, input_file, output_file, operations, block_size,
+                                             cache_dir, cache_stages)
+                    pending[future] = (input_file, output_file)
+                    if len(pending) >= max_in_flight:
+                        break
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    input_file, output_file = pending.pop(future)
+                    try:
+                        report(input_file, output_file, future.result())
+                    except Exception as e:
+                        report(input_file, output_file, error=e)
+
+    return processed, failed, total_samples, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    operations = []
+    for name, params in args.operations or []:
+        if name == 'amplify':
+            params = dict(params, no_limit=not args.limit)
+        elif name == 'change_speed':
+            params = dict(params, method=args.speed_method)
+        operations.append((name, params))
+    # Fill in the defaults, so the operations match those of an equivalent
+    # --pipeline spec (and hash to the same result cache keys)
+    operations = pipeline_from_spec([[name, params] for name, params in operations])
+    if args.pipeline:
+        if operations:
+            print("Give the operations either with --pipeline or as options, not both")
+            return 1
+        try:
+            operations = load_pipeline(args.pipeline)
+        except (OSError, ValueError) as e:
+            print(f"Invalid pipeline {args.pipeline}: {e}")
+            return 1
+
+    cache_dir = None
+    if args.cache:
+        cache = default_cache()
+        if cache is None:
+            print("Warning: The result cache is disabled (CLEARWAVE_CACHE_DIR is empty)")
+        else:
+            cache_dir = cache.directory
+
+    inputs = expand_inputs(args.inputs)
+    if not inputs:
+        print("No input files found")
+        return 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    jobs = [(path, os.path.join(args.output_dir, os.path.basename(path))) for path in inputs]
+    outputs = set()
+    for input_file, output_file in jobs:
+        if os.path.abspath(input_file) == os.path.abspath(output_file):
+            print(f"Output directory would overwrite the input file {input_file}")
+            return 1
+        if output_file in outputs:
+            print(f"Several input files would be written to {output_file}")
+            return 1
+        outputs.add(output_file)
+
+    pipeline = ", ".join(f"{name}({', '.join(f'{k}={v}' for k, v in params.items())})"
+                         for name, params in operations) or "no operations"
+    print(f"Processing {len(jobs)} file(s) with {args.workers} worker(s): {pipeline}")
+
+    processed, failed, total_samples, seconds = run_batch(
+        jobs, operations, args.workers, args.max_in_flight, args.block_size, cache_dir, args.cache_stages)
+
+    files_per_second = processed / seconds if seconds > 0 else 0
+    samples_per_second = total_samples / seconds if seconds > 0 else 0
+    print(f"\nProcessed {processed} file(s), {failed} failed, in {seconds:.2f}s: "
+          f"{files_per_second:.2f} files/s, {samples_per_second:,.0f} samples/s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+
+import numpy as np
+
+from ClearWave import ClearWaveAudio, read_wav_header
+from generate_test_wav import CORPORA, generate_corpus
+from instrumentation import MetricsRecorder, peak_rss
+
+# Bump when the measured stages or the result layout change
+BASELINE_VERSION = 1
+
+# (label, operation, parameters) timed on every file, each on the original samples
+OPERATIONS = [
+    ('amplify', 'amplify', {'gain_factor': 1.5, 'no_limit': True}),
+    ('anti_distortion', 'anti_distortion', {'threshold': 0.8}),
+    ('reduce_noise', 'reduce_noise', {'threshold_db': -50}),
+    ('reduce_noise_with_reference', 'reduce_noise_with_reference', {}),
+    ('limit', 'limit', {'ceiling_db': -6.0}),
+    ('compress', 'compress', {'threshold_db': -30.0, 'ratio': 4.0}),
+    ('measure_loudness', 'measure_loudness', {}),
+    ('normalize_loudness', 'normalize_loudness', {'target_lufs': -23.0, 'max_true_peak_db': -1.0}),
+    ('change_speed:wsola', 'change_speed', {'speed_factor': 1.25, 'method': 'wsola'}),
+    ('change_speed:resample', 'change_speed', {'speed_factor': 1.25, 'method': 'resample'}),
+    ('convert_format:pcm16>float32', 'convert_format', {'sample_format': 'float32'}),
+    ('convert_format:float32>pcm24', 'convert_format', {'sample_format': 'pcm24'}),
+]
+
+# Sample format the original samples are converted to, untimed, before an operation of OPERATIONS
+SOURCE_FORMATS = {
+    'convert_format:pcm16>float32': 'pcm16',
+    'convert_format:float32>pcm24': 'float32',
+}
+
+# A stage is reported as a regression when its throughput drops by more than this
+DEFAULT_TOLERANCE = 0.25
+
+
+def _write_noise_reference(audio, filename):
+    """Write the first second of the loaded samples as a noise reference"""
+    reference = ClearWaveAudio(quiet=True)
+    reference._set_format(audio.header)
+    reference.samples = audio.samples[:audio.header['sample_rate']]
+    reference.write_wav_file(filename)
+
+
+def benchmark_file(path, repeat=3):
+    """
+    Time reading, every operation of OPERATIONS and writing on one file.
+
+    Each stage runs repeat times on the original samples, first converted to
+    their SOURCE_FORMATS entry if any, and the fastest run is kept. The caches
+    are disabled while the file is benchmarked, so reduce_noise_with_reference
+    includes the noise analysis, and CLEARWAVE_CACHE_DIR is restored afterwards.
+
+    Returns:
+        dict: File format, samples, per-stage seconds and samples/s, and the peak
+              resident set size of the process in bytes
+    """
+    previous_cache_dir = os.environ.get('CLEARWAVE_CACHE_DIR')
+    os.environ['CLEARWAVE_CACHE_DIR'] = ''
+    try:
+        recorder = MetricsRecorder()
+        audio = ClearWaveAudio(quiet=True, observer=recorder)
+
+        with open(path, 'rb') as file:
+            header = read_wav_header(file)
+
+        timings = {}
+
+        def record(label):
+            metrics = recorder.stages[-1]
+            best = timings.get(label)
+            if best is None or metrics.seconds < best['seconds']:
+                timings[label] = {'seconds': metrics.seconds, 'samples': metrics.input_samples,
+                                  'samples_per_second': metrics.throughput}
+
+        for _ in range(repeat):
+            audio.read_wav_file(path)
+            record('read_wav_file')
+        original = audio.samples
+        original_header = dict(audio.header)
+
+        with tempfile.TemporaryDirectory() as directory:
+            noise_file = os.path.join(directory, 'noise.wav')
+            _write_noise_reference(audio, noise_file)
+
+            for label, name, params in OPERATIONS:
+                if name == 'reduce_noise_with_reference':
+                    params = dict(params, noise_file=noise_file)
+                for _ in range(repeat):
+                    audio._set_format(original_header)
+                    audio.samples = original
+                    if label in SOURCE_FORMATS:
+                        audio.convert_format(SOURCE_FORMATS[label])
+                    getattr(audio, name)(**params)
+                    record(label)
+
+            audio._set_format(original_header)
+            audio.samples = original
+            for _ in range(repeat):
+                audio.write_wav_file(os.path.join(directory, 'output.wav'))
+                record('write_wav_file')
+
+        return {
+            'file': os.path.basename(path),
+            'channels': header['channels'],
+            'sample_rate': header['sample_rate'],
+            'bits_per_sample': header['bits_per_sample'],
+            'samples': len(original),
+            'stages': timings,
+            'peak_rss': peak_rss(),
+        }
+    finally:
+        if previous_cache_dir is None:
+            del os.environ['CLEARWAVE_CACHE_DIR']
+        else:
+            os.environ['CLEARWAVE_CACHE_DIR'] = previous_cache_dir
+
+def run_benchmark(paths, repeat=3, isolate=True):
+    """
+    Benchmark every file and return the list of benchmark_file results.
+
+    With isolate, each file runs in a fresh worker process so that its peak RSS
+    is not hidden by the files before it.
+    """
+    if not isolate:
+        return [benchmark_file(path, repeat) for path in paths]
+
+    results = []
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        for path in paths:
+            results.append(pool.apply(benchmark_file, (path, repeat)))
+    return results
+
+
+def print_results(results):
+    """Print one line of samples/s per file and stage"""
+    print(f"{'file':<40} {'stage':<28} {'samples/s':>14} {'peak MB':>8}")
+    for result in results:
+        peak = '-' if result['peak_rss'] is None else f"{result['peak_rss'] / 1e6:.0f}"
+        for label, timing in result['stages'].items():
+            print(f"{result['file']:<40} {label:<28} {timing['samples_per_second']:>14,.0f} {peak:>8}")
+
+
+def save_baseline(results, filename, repeat):
+    """Save results with a description of the environment as a JSON baseline"""
+    baseline = {
+        'version': BASELINE_VERSION,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': results,
+    }
+    with open(filename, 'w') as file:
+        json.dump(baseline, file, indent=2)
+    print(f"Saved baseline to {filename}")
+
+
+def compare_to_baseline(results, filename, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare throughputs with a saved baseline and return the regressions.
+
+    Returns:
+        list: (file, stage, baseline samples/s, current samples/s) of every stage
+              slower than the baseline by more than tolerance
+    """
+    with open(filename) as file:
+        baseline = json.load(file)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError(f"Baseline {filename} has version {baseline.get('version')}, expected {BASELINE_VERSION}")
+
+    previous = {result['file']: result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        reference = previous.get(result['file'])
+        if reference is None:
+            continue
+        for label, timing in result['stages'].items():
+            before = reference['stages'].get(label)
+            if before is None or not before['samples_per_second']:
+                continue
+            ratio = timing['samples_per_second'] / before['samples_per_second']
+            if ratio < 1 - tolerance:
+                regressions.append((result['file'], label, before['samples_per_second'],
+                                    timing['samples_per_second']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ClearWave operations on a WAV corpus.")
+    parser.add_argument('files', nargs='*', help="WAV files to benchmark (default: the generated corpus)")
+    parser.add_argument('--corpus', choices=sorted(CORPORA), default='quick',
+                        help="Corpus generated when no files are given (default: quick)")
+    parser.add_argument('--corpus-dir', default='benchmark_corpus',
+                        help="Directory of the generated corpus (default: benchmark_corpus)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per stage; the fastest is kept")
+    parser.add_argument('--in-process', action='store_true',
+                        help="Run every file in this process (peak RSS then covers all files so far)")
+    parser.add_argument('--save-baseline', metavar='JSON', help="Save the results as a baseline")
+    parser.add_argument('--baseline', metavar='JSON', help="Compare the results with a saved baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Throughput drop reported as a regression (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    paths = args.files or generate_corpus(args.corpus_dir, args.corpus)
+    results = run_benchmark(paths, args.repeat, isolate=not args.in_process)
+    print_results(results)
+
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline, args.repeat)
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for file, label, before, after in regressions:
+                print(f"{file} {label}: {before:,.0f} -> {after:,.0f} samples/s ({after / before - 1:+.0%})")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
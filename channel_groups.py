@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+class ChannelGroups:
+    """
+    Run a streaming processor on groups of channels in parallel threads.
+
+    The channels are split into up to workers contiguous groups and each group
+    gets its own processor, created by factory(channel count). Blocks are
+    (frames, channels) arrays; every call sends its slice of the block to each
+    group and joins the results. NumPy releases the GIL inside FFTs and large
+    array operations, so the groups run on separate cores.
+
+    The processors must handle their channels independently and return the
+    same number of frames for the same input, like SpectralSubtractor.
+    """
+
+    def __init__(self, factory, channels, workers):
+        bounds = np.linspace(0, channels, min(max(1, workers), channels) + 1).astype(int)
+        self.slices = [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+        self.processors = [factory(part.stop - part.start) for part in self.slices]
+        self.executor = ThreadPoolExecutor(len(self.slices)) if len(self.slices) > 1 else None
+
+    def _map(self, call):
+        if self.executor is None:
+            return call(self.processors[0], self.slices[0])
+        results = self.executor.map(call, self.processors, self.slices)
+        return np.concatenate(list(results), axis=1)
+
+    def process(self, block):
+        """Feed a block to every group and return the frames finished so far"""
+        return self._map(lambda processor, part: processor.process(block[:, part]))
+
+    def flush(self):
+        """Return the remaining frames of every group and stop the threads"""
+        try:
+            return self._map(lambda processor, part: processor.flush())
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
@@ -0,0 +1,125 @@
+import math
+import numpy as np
+
+
+def sliding_max(values, width):
+    """
+    Return the maximum of every window of width consecutive values.
+
+    The van Herk/Gil-Werman algorithm splits the values into blocks of width
+    and takes running maxima forwards and backwards within each block; every
+    window spans at most two blocks, so its maximum is the larger of one
+    backward and one forward running maximum. Like a monotonic deque this is
+    amortized O(1) per value whatever the width, but it runs as a few array
+    operations instead of a Python loop over the samples.
+
+    Returns:
+        ndarray: len(values) - width + 1 maxima, window i covering values[i:i + width]
+    """
+    count = len(values) - width + 1
+    if count <= 0:
+        return np.zeros(0)
+    if width == 1:
+        return np.asarray(values, dtype=np.float64)
+
+    padding = -len(values) % width
+    blocks = np.concatenate((values, np.full(padding, -np.inf))).reshape(-1, width)
+    forward = np.maximum.accumulate(blocks, axis=1).ravel()
+    backward = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    return np.maximum(backward[:count], forward[width - 1:width - 1 + count])
+
+
+class DynamicsProcessor:
+    """
+    Look-ahead peak compressor and limiter.
+
+    The level of each frame is the peak of its loudest channel over the next
+    attack_ms (the look-ahead window), so the channels share one gain and keep
+    their balance. Above threshold_db the gain reduces the level by
+    1 - 1 / ratio of its excess in dB; an infinite ratio makes a limiter that
+    holds every peak at the threshold. The gain is then:
+
+    - averaged over attack_ms, so it ramps down across the look-ahead window
+      and has reached the reduction a peak needs when the peak arrives (each
+      averaged value is at most the gain that the frame itself requires, which
+      is why a limiter never lets a sample over the threshold);
+    - limited to rise by at most 1 per release_ms, with the running minimum
+      used by noise_gate.NoiseGate, so it recovers linearly after a peak.
+
+    makeup_db is applied last (limiters have none). Frames are fed with
+    process() in (frames, channels) blocks of any size and come back delayed
+    by the look-ahead; flush() returns the rest, so the total output has as
+    many frames as the input. Each block is processed with array operations.
+    """
+
+    def __init__(self, sample_rate, full_scale, threshold_db, ratio=math.inf, attack_ms=5.0,
+                 release_ms=50.0, makeup_db=0.0, channels=1):
+        if ratio < 1:
+            raise ValueError("Ratio must be at least 1")
+        if attack_ms < 0 or release_ms <= 0:
+            raise ValueError("Attack must not be negative and release must be greater than 0")
+
+        self.threshold = full_scale * 10 ** (threshold_db / 20)
+        self.slope = 1 - 1 / ratio
+        self.limiting = math.isinf(ratio) and makeup_db == 0
+        self.makeup = 10 ** (makeup_db / 20)
+        self.lookahead = int(round(attack_ms * sample_rate / 1000))
+        self.release_step = 1 / max(1.0, release_ms * sample_rate / 1000)
+
+        self.channels = channels
+        # Frames not yet output and the peak of each
+        self.input = np.zeros((0, channels))
+        self.peaks = np.zeros(0)
+        # Required gains of the look-ahead frames before the next output, for
+        # the average (the signal is silent before its start)
+        self.recent = np.ones(self.lookahead)
+        self.gain = 1.0
+
+    def required_gains(self, levels):
+        """Return the gain each level needs to obey the threshold and ratio"""
+        return (self.threshold / np.maximum(levels, self.threshold)) ** self.slope
+
+    def _emit(self, count):
+        """Return the first count buffered frames, whose look-ahead window is complete"""
+        if count <= 0:
+            return np.zeros((0, self.channels))
+        window = self.lookahead + 1
+
+        # Gain needed by each frame for the loudest peak of its look-ahead window
+        required = self.required_gains(sliding_max(self.peaks[:count + self.lookahead], window))
+
+        # Average over the look-ahead: the gain ramps down before each peak
+        history = np.concatenate((self.recent, required))
+        totals = np.concatenate(([0.0], np.cumsum(history)))
+        averaged = np.minimum((totals[window:] - totals[:-window]) / window, required)
+        self.recent = history[len(history) - self.lookahead:]
+
+        # Release: gain[n] = min(averaged[n], gain[n - 1] + release_step)
+        step = self.release_step * np.arange(count)
+        gains = np.minimum(np.minimum.accumulate(averaged - step), self.gain + self.release_step) + step
+        self.gain = float(gains[-1])
+
+        output = self.input[:count] * (gains * self.makeup)[:, np.newaxis]
+        if self.limiting:
+            # Rounding in the gain computation must not put a peak above the threshold
+            np.clip(output, -self.threshold, self.threshold, out=output)
+        self.input = self.input[count:]
+        self.peaks = self.peaks[count:]
+        return output
+
+    def process(self, block):
+        """Feed a (frames, channels) block and return the frames finished so far"""
+        block = np.asarray(block, dtype=np.float64)
+        self.input = np.concatenate((self.input, block))
+        self.peaks = np.concatenate((self.peaks, np.abs(block).max(axis=1) if len(block) else np.zeros(0)))
+        return self._emit(len(self.input) - self.lookahead)
+
+    def flush(self):
+        """Return the remaining frames once the whole signal has been fed"""
+        remaining = len(self.input)
+        self.input = np.concatenate((self.input, np.zeros((self.lookahead, self.channels))))
+        self.peaks = np.concatenate((self.peaks, np.zeros(self.lookahead)))
+        output = self._emit(remaining)
+        self.input = np.zeros((0, self.channels))
+        self.peaks = np.zeros(0)
+        return output
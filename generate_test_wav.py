@@ -1,53 +1,237 @@
-import wave
-import struct
-import math
+import argparse
+import os
+import numpy as np
 
-def generate_test_wav(filename="test_mono.wav", duration=2.0, freq=440.0, sample_rate=44100, amplitude=0.5):
+# Signals the generator can produce
+SIGNALS = ('sine', 'noise', 'speech')
+
+# Bit depths; 32 is written as IEEE float, the others as PCM
+BIT_DEPTHS = (8, 16, 24, 32)
+
+# Seconds of audio generated and written at a time, so hour-long files do not
+# need to fit in memory
+CHUNK_SECONDS = 10
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+
+# Durations swept by each corpus, in seconds
+CORPORA = {
+    'quick': (1.0, 10.0, 60.0),
+    'full': (1.0, 10.0, 60.0, 600.0, 3600.0),
+}
+
+
+def _harmonics(phase, count):
+    """
+    Return the sum of sin(k * phase) / k for k = 1..count, normalized to peak near 1.
+
+    Harmonics come from the recurrence sin((k + 1)x) = 2 cos(x) sin(kx) - sin((k - 1)x)
+    instead of one sin() call each.
+    """
+    twice_cos = 2 * np.cos(phase)
+    previous, current = np.zeros_like(phase), np.sin(phase)
+    total = current.copy()
+    for k in range(2, count + 1):
+        previous, current = current, twice_cos * current - previous
+        total += current / k
+    return total / sum(1 / k for k in range(1, count + 1))
+
+
+def _signal(kind, start, frames, channels, sample_rate, freq, amplitude, rng):
+    """
+    Return frames x channels samples in [-1, 1] of a signal, starting at frame start.
+
+    Every deterministic component is a function of absolute time, so a signal
+    generated chunk by chunk is continuous.
+    """
+    t = (start + np.arange(frames)) / sample_rate
+    output = np.empty((frames, channels))
+
+    for channel in range(channels):
+        if kind == 'sine':
+            # One semitone higher per channel
+            output[:, channel] = amplitude * np.sin(2 * np.pi * freq * 2 ** (channel / 12) * t)
+        elif kind == 'noise':
+            output[:, channel] = np.clip(rng.normal(0, amplitude / 3, frames), -1, 1)
+        elif kind == 'speech':
+            # Voiced harmonics around a gliding 120Hz pitch. The phase is the
+            # integral of f0(t) = 120 + 30 sin(pi t).
+            phase = 2 * np.pi * (120 * t - 30 / np.pi * np.cos(np.pi * t))
+            voice = _harmonics(phase, 10)
+            # Four syllables per second, in 2.2s phrases separated by pauses
+            syllables = np.sin(2 * np.pi * 4 * t) ** 2
+            phrases = (t % 3.0) < 2.2
+            background = rng.normal(0, 0.01, frames)
+            output[:, channel] = amplitude / (channel + 1) * voice * syllables * phrases + background
+        else:
+            raise ValueError(f"Unknown signal '{kind}', expected one of {', '.join(SIGNALS)}")
+
+    return np.clip(output, -1, 1)
+
+
+def _encode(samples, bits_per_sample):
+    """Convert samples in [-1, 1] to little-endian WAV sample bytes"""
+    if bits_per_sample == 8:
+        # 8-bit PCM is unsigned, centred on 128
+        return (np.trunc(samples * 127) + 128).astype(np.uint8).tobytes()
+    if bits_per_sample == 16:
+        return np.trunc(samples * 32767).astype('<i2').tobytes()
+    if bits_per_sample == 24:
+        wide = np.trunc(samples * 8388607).astype('<i4').reshape(-1)
+        return wide.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    if bits_per_sample == 32:
+        return samples.astype('<f4').tobytes()
+    raise ValueError(f"Unsupported bit depth {bits_per_sample}, expected one of {BIT_DEPTHS}")
+
+
+def _write_header(file, channels, sample_rate, bits_per_sample, frames):
+    """Write a canonical WAV header; float data gets the extended fmt chunk and a fact chunk"""
+    is_float = bits_per_sample == 32
+    block_align = channels * bits_per_sample // 8
+    data_size = frames * block_align
+    fmt_size = 18 if is_float else 16
+    riff_size = 4 + (8 + fmt_size) + (12 if is_float else 0) + (8 + data_size)
+
+    file.write(b'RIFF')
+    file.write(riff_size.to_bytes(4, byteorder='little'))
+    file.write(b'WAVE')
+
+    file.write(b'fmt ')
+    file.write(fmt_size.to_bytes(4, byteorder='little'))
+    file.write((WAVE_FORMAT_IEEE_FLOAT if is_float else WAVE_FORMAT_PCM).to_bytes(2, byteorder='little'))
+    file.write(channels.to_bytes(2, byteorder='little'))
+    file.write(sample_rate.to_bytes(4, byteorder='little'))
+    file.write((sample_rate * block_align).to_bytes(4, byteorder='little'))
+    file.write(block_align.to_bytes(2, byteorder='little'))
+    file.write(bits_per_sample.to_bytes(2, byteorder='little'))
+    if is_float:
+        file.write((0).to_bytes(2, byteorder='little'))
+        file.write(b'fact')
+        file.write((4).to_bytes(4, byteorder='little'))
+        file.write(frames.to_bytes(4, byteorder='little'))
+
+    file.write(b'data')
+    file.write(data_size.to_bytes(4, byteorder='little'))
+
+
+def generate_test_wav(filename="test_mono.wav", duration=2.0, freq=440.0, sample_rate=44100, amplitude=0.5,
+                      bits_per_sample=16, channels=1, signal='sine', seed=0, verbose=True):
     """
-    Generate a test mono WAV file with a sine wave
-    
+    Generate a test WAV file.
+
+    The signal is computed with array operations CHUNK_SECONDS at a time and
+    written as it goes, so memory use does not depend on the duration.
+
     Parameters:
     filename (str): Output filename
     duration (float): Length of the audio in seconds
     freq (float): Frequency of the sine wave in Hz
     sample_rate (int): Sample rate in Hz
-    amplitude (float): Amplitude of the sine wave (0.0 to 1.0)
+    amplitude (float): Amplitude of the signal (0.0 to 1.0)
+    bits_per_sample (int): 8, 16 or 24 for PCM, 32 for IEEE float
+    channels (int): Number of channels
+    signal (str): 'sine', 'noise' (white) or 'speech' (voiced syllables, pauses and background noise)
+    seed (int): Seed of the random components
     """
+    if bits_per_sample not in BIT_DEPTHS:
+        raise ValueError(f"Unsupported bit depth {bits_per_sample}, expected one of {BIT_DEPTHS}")
+    if signal not in SIGNALS:
+        raise ValueError(f"Unknown signal '{signal}', expected one of {', '.join(SIGNALS)}")
+
     # Calculate the number of frames
     num_frames = int(duration * sample_rate)
-    
-    # Create a sine wave
-    samples = []
-    for i in range(num_frames):
-        t = i / sample_rate  # Time in seconds
-        # Generate a sine wave
-        value = amplitude * math.sin(2 * math.pi * freq * t)
-        # Convert to 16-bit PCM
-        sample = int(value * 32767)
-        samples.append(sample)
-    
-    # Open a new WAV file
-    with wave.open(filename, 'w') as wav_file:
-        # Set parameters
-        # nchannels, sampwidth, framerate, nframes, comptype, compname
-        wav_file.setparams((1, 2, sample_rate, num_frames, 'NONE', 'not compressed'))
-        
-        # Convert samples to byte data
-        sample_data = struct.pack('<' + 'h' * num_frames, *samples)
-        wav_file.writeframes(sample_data)
-    
-    print(f"Created test mono WAV file: {filename}")
-    print(f"Duration: {duration} seconds")
-    print(f"Frequency: {freq} Hz")
-    print(f"Sample rate: {sample_rate} Hz")
-    print(f"Number of samples: {num_frames}")
+    chunk_frames = CHUNK_SECONDS * sample_rate
+    rng = np.random.default_rng(seed)
+
+    with open(filename, 'wb') as file:
+        _write_header(file, channels, sample_rate, bits_per_sample, num_frames)
+        for start in range(0, num_frames, chunk_frames):
+            frames = min(chunk_frames, num_frames - start)
+            samples = _signal(signal, start, frames, channels, sample_rate, freq, amplitude, rng)
+            file.write(_encode(samples, bits_per_sample))
+
+    if verbose:
+        print(f"Created test WAV file: {filename}")
+        print(f"Signal: {signal}, {channels} channel(s), {bits_per_sample}-bit{' float' if bits_per_sample == 32 else ''}")
+        print(f"Duration: {duration} seconds")
+        if signal == 'sine':
+            print(f"Frequency: {freq} Hz")
+        print(f"Sample rate: {sample_rate} Hz")
+        print(f"Number of samples: {num_frames}")
+
+
+def corpus_specs(name='quick'):
+    """
+    Return the files of a benchmark corpus as dicts of generate_test_wav arguments.
+
+    Every signal is covered at every bit depth, then speech is swept over the
+    corpus durations, over sample rates and over channel counts.
+    """
+    if name not in CORPORA:
+        raise ValueError(f"Unknown corpus '{name}', expected one of {', '.join(CORPORA)}")
+
+    specs = []
+
+    def add(signal, duration, sample_rate, bits_per_sample, channels):
+        spec = {'signal': signal, 'duration': duration, 'sample_rate': sample_rate,
+                'bits_per_sample': bits_per_sample, 'channels': channels}
+        if spec not in specs:
+            specs.append(spec)
+
+    for signal in SIGNALS:
+        for bits_per_sample in BIT_DEPTHS:
+            add(signal, 10.0, 44100, bits_per_sample, 1)
+    for duration in CORPORA[name]:
+        add('speech', duration, 44100, 16, 1)
+    for sample_rate in (8000, 22050, 48000, 96000):
+        add('speech', 10.0, sample_rate, 16, 1)
+    for channels in (2, 6):
+        add('speech', 10.0, 44100, 16, channels)
+    return specs
+
+
+def corpus_filename(spec):
+    """Return the file name of a corpus entry, e.g. speech_10s_44100hz_16bit_1ch.wav"""
+    depth = '32float' if spec['bits_per_sample'] == 32 else f"{spec['bits_per_sample']}bit"
+    return (f"{spec['signal']}_{spec['duration']:g}s_{spec['sample_rate']}hz_"
+            f"{depth}_{spec['channels']}ch.wav")
+
+
+def generate_corpus(directory, name='quick', force=False):
+    """
+    Generate a benchmark corpus in directory and return the paths of its files.
+
+    Files that already exist are kept unless force is True.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for spec in corpus_specs(name):
+        path = os.path.join(directory, corpus_filename(spec))
+        if force or not os.path.exists(path):
+            generate_test_wav(path, verbose=False, **spec)
+            print(f"Created {path}")
+        paths.append(path)
+    return paths
+
 
 # Generate a test mono WAV file
 if __name__ == "__main__":
-    generate_test_wav()
-    
-    # You can also generate different test files
-    generate_test_wav("low_tone.wav", freq=220.0)
-    generate_test_wav("high_tone.wav", freq=880.0)
-    generate_test_wav("quiet_tone.wav", amplitude=0.1)
-    generate_test_wav("loud_tone.wav", amplitude=0.9)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate test WAV files.")
+    parser.add_argument('--corpus', choices=sorted(CORPORA),
+                        help="Generate a benchmark corpus instead of the default test tones")
+    parser.add_argument('-o', '--output-dir', default='benchmark_corpus',
+                        help="Directory of the corpus (default: benchmark_corpus)")
+    parser.add_argument('--force', action='store_true', help="Regenerate existing corpus files")
+    args = parser.parse_args()
+
+    if args.corpus:
+        generate_corpus(args.output_dir, args.corpus, args.force)
+    else:
+        generate_test_wav()
+
+        # You can also generate different test files
+        generate_test_wav("low_tone.wav", freq=220.0)
+        generate_test_wav("high_tone.wav", freq=880.0)
+        generate_test_wav("quiet_tone.wav", amplitude=0.1)
+        generate_test_wav("loud_tone.wav", amplitude=0.9)
@@ -0,0 +1,108 @@
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory is then only known while tracemalloc traces
+    resource = None
+
+
+def peak_rss():
+    """Return the peak resident set size of this process in bytes, or None if unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, other systems kilobytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageMetrics:
+    """
+    Measurements of one processing stage.
+
+    Attributes:
+        stage (str): Operation name, or names joined by '+' for a fused pass
+        seconds (float): Wall time of the stage
+        input_samples (int): Samples the stage received
+        output_samples (int): Samples the stage produced
+        modified_count (int): Samples changed by anti_distortion, or None
+        clipped_count (int): Samples clipped to the format range, or None
+        peak_memory (int): Peak traced memory of the stage in bytes when
+                           tracemalloc is tracing, otherwise the peak resident
+                           set size of the process so far (None if unknown)
+    """
+
+    def __init__(self, stage, input_samples=0):
+        self.stage = stage
+        self.seconds = 0.0
+        self.input_samples = input_samples
+        self.output_samples = 0
+        self.modified_count = None
+        self.clipped_count = None
+        self.peak_memory = None
+
+    @property
+    def throughput(self):
+        """Input samples processed per second"""
+        return self.input_samples / self.seconds if self.seconds > 0 else 0.0
+
+    def __repr__(self):
+        return (f"StageMetrics({self.stage!r}, {self.seconds:.4f}s, {self.input_samples} -> "
+                f"{self.output_samples} samples, modified={self.modified_count}, "
+                f"clipped={self.clipped_count}, peak_memory={self.peak_memory})")
+
+
+class StageTimer:
+    """Measure a stage from creation until finish()"""
+
+    def __init__(self, stage, input_samples=0):
+        self.metrics = StageMetrics(stage, input_samples)
+        self.tracing = tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+
+    def finish(self, output_samples):
+        """Complete the measurements and return the StageMetrics"""
+        metrics = self.metrics
+        metrics.seconds = time.perf_counter() - self.start
+        metrics.output_samples = output_samples
+        metrics.peak_memory = tracemalloc.get_traced_memory()[1] if self.tracing else peak_rss()
+        return metrics
+
+
+class Observer:
+    """
+    Receives the metrics of every stage run by ClearWaveAudio or ClearWaveStream.
+
+    Subclass and override stage_finished, then pass an instance as observer.
+    """
+
+    def stage_finished(self, metrics):
+        """Called with the StageMetrics of each stage once it has run"""
+
+
+class MetricsRecorder(Observer):
+    """Observer that keeps every StageMetrics and can print them as a table"""
+
+    def __init__(self):
+        self.stages = []
+
+    def stage_finished(self, metrics):
+        self.stages.append(metrics)
+
+    def total_seconds(self):
+        return sum(metrics.seconds for metrics in self.stages)
+
+    def report(self):
+        """Print one line per stage"""
+        print(f"{'stage':<32} {'seconds':>9} {'samples':>11} {'samples/s':>14} "
+              f"{'modified':>9} {'clipped':>9} {'peak MB':>8}")
+        for metrics in self.stages:
+            modified = '-' if metrics.modified_count is None else metrics.modified_count
+            clipped = '-' if metrics.clipped_count is None else metrics.clipped_count
+            peak = '-' if metrics.peak_memory is None else f"{metrics.peak_memory / 1e6:.1f}"
+            print(f"{metrics.stage:<32} {metrics.seconds:>9.4f} {metrics.input_samples:>11} "
+                  f"{metrics.throughput:>14,.0f} {modified:>9} {clipped:>9} {peak:>8}")
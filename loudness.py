@@ -0,0 +1,324 @@
+import math
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Loudness measurement after ITU-R BS.1770-4 and EBU R128 / Tech 3342
+
+# Gating blocks are BLOCK_SEGMENTS consecutive segments of SEGMENT_SECONDS
+# (400ms blocks overlapping by 75%); the short-term windows of the loudness
+# range are SHORT_TERM_SEGMENTS segments (3s, every 100ms)
+SEGMENT_SECONDS = 0.1
+BLOCK_SEGMENTS = 4
+SHORT_TERM_SEGMENTS = 30
+
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+RANGE_RELATIVE_GATE_LU = -20.0
+RANGE_PERCENTILES = (10, 95)
+
+# Weight of each channel in the sum of channel powers, by channel count (WAV
+# channel order); other layouts weigh every channel 1.0
+CHANNEL_WEIGHTS = {
+    5: (1.0, 1.0, 1.0, 1.41, 1.41),
+    6: (1.0, 1.0, 1.0, 0.0, 1.41, 1.41),
+}
+
+# Polyphase FIR of BS.1770-4 Annex 2 interpolating 4 samples per input sample
+# for the true peak, one row per phase
+TRUE_PEAK_PHASES = np.array([
+    [0.0017089843750, 0.0109863281250, -0.0196533203125, 0.0332031250000, -0.0594482421875, 0.1373291015625,
+     0.9721679687500, -0.1022949218750, 0.0476074218750, -0.0266113281250, 0.0148925781250, -0.0083007812500],
+    [-0.0291748046875, 0.0292968750000, -0.0517578125000, 0.0891113281250, -0.1665039062500, 0.4650878906250,
+     0.7797851562500, -0.2003173828125, 0.1015625000000, -0.0582275390625, 0.0330810546875, -0.0189208984375],
+    [-0.0189208984375, 0.0330810546875, -0.0582275390625, 0.1015625000000, -0.2003173828125, 0.7797851562500,
+     0.4650878906250, -0.1665039062500, 0.0891113281250, -0.0517578125000, 0.0292968750000, -0.0291748046875],
+    [-0.0083007812500, 0.0148925781250, -0.0266113281250, 0.0476074218750, -0.1022949218750, 0.9721679687500,
+     0.1373291015625, -0.0594482421875, 0.0332031250000, -0.0196533203125, 0.0109863281250, 0.0017089843750],
+])
+
+# Samples per block of the block-parallel IIR filter
+FILTER_BLOCK_LENGTH = 32
+
+
+def k_weighting(sample_rate):
+    """
+    Return the two biquad sections (b, a) of the K-weighting filter at
+    sample_rate: a high shelf modelling the head, then a high-pass filter.
+
+    The analog prototypes of BS.1770 are mapped with the bilinear transform,
+    which gives the coefficients of the standard at 48kHz.
+    """
+    k = math.tan(math.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = ([(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0],
+             [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+
+    k = math.tan(math.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    high_pass = ([1.0, -2.0, 1.0], [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+    return [shelf, high_pass]
+
+
+class IIRFilter:
+    """
+    Cascade of IIR sections applied to (frames, channels) blocks of any size.
+
+    A recursive filter cannot be vectorized sample by sample, so the signal is
+    cut into blocks of block_length. In state-space form, the output of a block
+    is the response to its own samples from a zero state (one matrix product
+    with the truncated impulse response, which is exact within the block) plus
+    the response to the state at its start. The states at the block starts
+    follow s[k + 1] = M s[k] + u[k], where M is the state transition over a
+    whole block; this recurrence is solved for every block at once by a prefix
+    scan with log2(blocks) matrix products. The result equals running the
+    difference equation sample by sample, up to floating point rounding.
+    """
+
+    def __init__(self, sections, channels=1, block_length=FILTER_BLOCK_LENGTH):
+        # State-space form s' = A s + B x, y = C s + D x of the cascade, built
+        # section by section so that it is as well conditioned as the sections
+        transition, input_gain, output_gain, direct = np.zeros((0, 0)), np.zeros(0), np.zeros(0), 1.0
+        for b, a in sections:
+            b = np.asarray(b, dtype=np.float64) / a[0]
+            a = np.asarray(a, dtype=np.float64) / a[0]
+            # Transposed direct form II: y = b0 x + s[0]
+            order = len(a) - 1
+            section = np.zeros((order, order))
+            section[:, 0] = -a[1:]
+            section[:-1, 1:] = np.eye(order - 1)
+            section_input = b[1:] - a[1:] * b[0]
+            section_output = np.eye(order)[0]
+
+            size = len(transition)
+            combined = np.zeros((size + order, size + order))
+            combined[:size, :size] = transition
+            combined[size:, :size] = np.outer(section_input, output_gain)
+            combined[size:, size:] = section
+            transition = combined
+            input_gain = np.concatenate((input_gain, section_input * direct))
+            output_gain = np.concatenate((b[0] * output_gain, section_output))
+            direct *= b[0]
+
+        powers = [np.eye(len(transition))]
+        for _ in range(block_length):
+            powers.append(transition @ powers[-1])
+        powers = np.array(powers)
+        # A^i B and C A^i for every i
+        responses = powers @ input_gain
+        outputs = output_gain @ powers
+
+        impulse = np.concatenate(([direct], responses[:block_length - 1] @ output_gain))
+        lags = np.subtract.outer(np.arange(block_length), np.arange(block_length))
+        # toeplitz[j, m]: weight of input j in output m of a block, from a zero state
+        self.toeplitz = np.where(lags <= 0, impulse[np.clip(-lags, 0, None)], 0.0)
+        # Contribution of the state at the start of a block to its outputs
+        self.state_output = outputs[:block_length].T
+        # Contribution of input j of a block to the state at its end
+        self.input_state = responses[block_length - 1::-1]
+        self.powers = powers
+        self.block_transition = powers[block_length].T
+
+        self.block_length = block_length
+        self.state = np.zeros((channels, len(transition)))
+
+    def _blocks(self, values):
+        """Filter a whole number of blocks, given as (blocks * channels, block_length) rows"""
+        channels = self.state.shape[0]
+        output = values @ self.toeplitz
+        # Inclusive scan of the state contributions, including the initial state
+        states = values @ self.input_state
+        states[:channels] += self.state @ self.block_transition
+        transition = self.block_transition
+        shift = channels
+        while shift < len(states):
+            states[shift:] += states[:-shift] @ transition
+            transition = transition @ transition
+            shift *= 2
+        starts = np.concatenate((self.state, states[:-channels]))
+        output += starts @ self.state_output
+        self.state = states[-channels:]
+        return output
+
+    def process(self, block):
+        """Filter a (frames, channels) block and return the filtered samples as float64"""
+        block = np.asarray(block, dtype=np.float64)
+        frames, channels = block.shape
+        length = self.block_length
+        full = frames // length * length
+        output = np.empty((frames, channels))
+
+        if full:
+            values = block[:full].reshape(-1, length, channels).transpose(0, 2, 1).reshape(-1, length)
+            filtered = self._blocks(values)
+            output[:full] = filtered.reshape(-1, channels, length).transpose(0, 2, 1).reshape(full, channels)
+
+        rest = frames - full
+        if rest:
+            tail = block[full:]
+            output[full:] = (tail.T @ self.toeplitz[:rest, :rest] + self.state @ self.state_output[:, :rest]).T
+            self.state = self.state @ self.powers[rest].T + tail.T @ self.input_state[length - rest:]
+        return output
+
+
+class TruePeakMeter:
+    """
+    Maximum magnitude of a signal oversampled 4 times (BS.1770-4 Annex 2), which
+    catches the peaks between samples that a digital to analog converter
+    reconstructs.
+
+    An interpolated sample is at most the sum of the absolute taps of its phase
+    times the largest input sample it is computed from, so only the windows
+    holding a sample above peak / that bound can raise the peak. Only those
+    windows are interpolated, which leaves out most of a typical signal.
+    """
+
+    def __init__(self, channels=1):
+        self.taps = TRUE_PEAK_PHASES.shape[1]
+        # Column p computes phase p from a window of inputs in time order
+        self.kernel = TRUE_PEAK_PHASES[:, ::-1].T.copy()
+        self.bound = np.abs(TRUE_PEAK_PHASES).sum(axis=1).max()
+        self.history = np.zeros((self.taps - 1, channels))
+        self.peak = 0.0
+
+    def process(self, block):
+        """Add a (frames, channels) block of float samples"""
+        if not len(block):
+            return
+        values = np.concatenate((self.history, block))
+        self.history = values[len(values) - len(self.history):]
+        magnitude = np.abs(values)
+        self.peak = max(self.peak, float(magnitude[self.taps - 1:].max()))
+
+        loud = np.flatnonzero(magnitude.ravel() > self.peak / self.bound) // values.shape[1]
+        if not len(loud):
+            return
+        windows = sliding_window_view(values, self.taps, axis=0)
+        if len(loud) * self.taps < len(windows):
+            selected = np.zeros(len(windows) + self.taps, dtype=bool)
+            # Starts before the first window wrap around to the padding at the end
+            selected[(loud[:, np.newaxis] - np.arange(self.taps)).ravel()] = True
+            windows = windows[selected[:len(windows)]]
+        self.peak = max(self.peak, float(np.abs(windows.reshape(-1, self.taps) @ self.kernel).max()))
+
+
+class LoudnessStats:
+    """
+    Loudness of a signal after EBU R128.
+
+    Attributes:
+        integrated (float): Gated integrated loudness in LUFS, -inf when no
+                            400ms block is above the absolute gate
+        loudness_range (float): Loudness range in LU (EBU Tech 3342)
+        true_peak (float): Highest true peak in dBTP (-inf for silence)
+    """
+
+    def __init__(self, integrated, loudness_range, true_peak):
+        self.integrated = integrated
+        self.loudness_range = loudness_range
+        self.true_peak = true_peak
+
+    def gain_db(self, target_lufs, max_true_peak_db=None):
+        """
+        Return the gain in dB that brings the integrated loudness to
+        target_lufs, lowered if needed to keep the true peak at or below
+        max_true_peak_db, or None when the loudness is not defined.
+        """
+        if math.isinf(self.integrated):
+            return None
+        gain_db = target_lufs - self.integrated
+        if max_true_peak_db is not None and not math.isinf(self.true_peak):
+            gain_db = min(gain_db, max_true_peak_db - self.true_peak)
+        return gain_db
+
+    def __repr__(self):
+        return (f"LoudnessStats(integrated={self.integrated:.2f} LUFS, "
+                f"loudness_range={self.loudness_range:.2f} LU, true_peak={self.true_peak:.2f} dBTP)")
+
+
+def _loudness(mean_squares):
+    with np.errstate(divide='ignore'):
+        return -0.691 + 10 * np.log10(mean_squares)
+
+
+class LoudnessMeter:
+    """
+    Integrated loudness, loudness range and true peak of a signal, measured in
+    one pass over (frames, channels) blocks of any size.
+
+    Each block is K-weighted with an IIRFilter and its weighted channel powers
+    are summed per 100ms segment as it arrives; only those sums (10 per
+    second) are kept. The gating blocks and short-term windows are sums of
+    consecutive segments, so result() gates them all with array operations.
+    """
+
+    def __init__(self, sample_rate, full_scale, channels=1, channel_weights=None):
+        if channel_weights is None:
+            channel_weights = CHANNEL_WEIGHTS.get(channels, (1.0,) * channels)
+        if len(channel_weights) != channels:
+            raise ValueError(f"Expected {channels} channel weights, got {len(channel_weights)}")
+
+        self.full_scale = full_scale
+        self.weights = np.asarray(channel_weights, dtype=np.float64)
+        self.filter = IIRFilter(k_weighting(sample_rate), channels)
+        self.true_peak = TruePeakMeter(channels)
+        self.segment_length = max(1, int(round(sample_rate * SEGMENT_SECONDS)))
+        self.segments = []
+        # Weighted power of the samples of the segment in progress
+        self.partial = 0.0
+        self.partial_length = 0
+
+    def process(self, block):
+        """Add a (frames, channels) block of samples"""
+        if not len(block):
+            return
+        values = np.asarray(block, dtype=np.float64) / self.full_scale
+        self.true_peak.process(values)
+        weighted = self.filter.process(values)
+        powers = np.einsum('ij,ij,j->i', weighted, weighted, self.weights)
+
+        # Complete the segment in progress, then whole segments, then start the next
+        head = min(len(powers), self.segment_length - self.partial_length)
+        self.partial += powers[:head].sum()
+        self.partial_length += head
+        if self.partial_length < self.segment_length:
+            return
+        self.segments.append([self.partial])
+
+        length = self.segment_length
+        whole = (len(powers) - head) // length
+        self.segments.append(powers[head:head + whole * length].reshape(whole, length).sum(axis=1))
+        rest = powers[head + whole * length:]
+        self.partial = rest.sum()
+        self.partial_length = len(rest)
+
+    def result(self):
+        """Return the LoudnessStats of the blocks added so far"""
+        segments = np.concatenate(self.segments) if self.segments else np.zeros(0)
+        totals = np.concatenate(([0.0], np.cumsum(segments)))
+
+        def windows(count):
+            """Mean square of every window of count consecutive segments"""
+            return (totals[count:] - totals[:-count]) / (count * self.segment_length)
+
+        blocks = windows(BLOCK_SEGMENTS)
+        integrated = -math.inf
+        gated = blocks[_loudness(blocks) > ABSOLUTE_GATE_LUFS]
+        if len(gated):
+            relative_gate = _loudness(gated.mean()) + RELATIVE_GATE_LU
+            integrated = float(_loudness(gated[_loudness(gated) > relative_gate].mean()))
+
+        short_term = windows(SHORT_TERM_SEGMENTS)
+        loudness_range = 0.0
+        gated = short_term[_loudness(short_term) > ABSOLUTE_GATE_LUFS]
+        if len(gated):
+            relative_gate = _loudness(gated.mean()) + RANGE_RELATIVE_GATE_LU
+            levels = _loudness(gated[_loudness(gated) > relative_gate])
+            low, high = np.percentile(levels, RANGE_PERCENTILES)
+            loudness_range = float(high - low)
+
+        true_peak = 20 * math.log10(self.true_peak.peak) if self.true_peak.peak else -math.inf
+        return LoudnessStats(integrated, loudness_range, true_peak)
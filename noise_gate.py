@@ -0,0 +1,219 @@
+import math
+import numpy as np
+
+# Length of the envelope detector blocks, in seconds
+DETECTOR_SECONDS = 0.005
+
+# Detector levels are histogrammed in LEVEL_STEP_DB bins from LEVEL_MIN_DB up to
+# LEVEL_MAX_DB (above full scale, for amplified signals)
+LEVEL_MIN_DB = -140.0
+LEVEL_MAX_DB = 40.0
+LEVEL_STEP_DB = 0.5
+
+# Samples converted to floating point at a time
+CHUNK_SIZE = 1 << 16
+
+DETECTORS = ('rms', 'peak')
+
+
+def detector_block_length(sample_rate):
+    """Return the number of samples in one detector block at sample_rate"""
+    return max(1, int(sample_rate * DETECTOR_SECONDS))
+
+
+def block_levels(samples, block_length, full_scale, detector='rms'):
+    """
+    Return the level in dBFS of consecutive blocks of samples.
+
+    samples is a signal of shape (frames,) or (frames, channels); the level of
+    a block is that of its loudest channel. The last block may be shorter than
+    block_length. The work is done a chunk at a time so that no full-length
+    floating point copy of the signal is made.
+    """
+    levels = np.empty(math.ceil(len(samples) / block_length))
+    chunk_size = max(1, CHUNK_SIZE // block_length) * block_length
+
+    for start in range(0, len(samples), chunk_size):
+        chunk = np.asarray(samples[start:start + chunk_size], dtype=np.float64)
+        chunk = chunk.reshape(len(chunk), -1)
+        full = len(chunk) // block_length
+        values = []
+        if full:
+            blocks = chunk[:full * block_length].reshape(full, block_length, chunk.shape[1])
+            if detector == 'rms':
+                values.append(np.sqrt(np.einsum('ijk,ijk->ik', blocks, blocks) / block_length).max(axis=1))
+            else:
+                values.append(np.abs(blocks).max(axis=(1, 2)))
+        if len(chunk) > full * block_length:
+            tail = chunk[full * block_length:]
+            values.append([np.sqrt(np.mean(tail ** 2, axis=0)).max() if detector == 'rms' else np.abs(tail).max()])
+
+        first = start // block_length
+        values = np.concatenate(values)
+        levels[first:first + len(values)] = values
+
+    with np.errstate(divide='ignore'):
+        levels = 20 * np.log10(levels / full_scale)
+    return np.maximum(levels, LEVEL_MIN_DB)
+
+
+class NoiseFloorEstimator:
+    """
+    Histogram of detector levels from which the noise floor is read as a percentile.
+
+    Levels can be added in any number of batches; memory stays at one small
+    histogram whatever the length of the signal.
+    """
+
+    def __init__(self):
+        self.counts = np.zeros(int((LEVEL_MAX_DB - LEVEL_MIN_DB) / LEVEL_STEP_DB) + 1, dtype=np.int64)
+
+    def add(self, levels):
+        bins = ((np.asarray(levels) - LEVEL_MIN_DB) / LEVEL_STEP_DB).astype(np.int64)
+        np.clip(bins, 0, len(self.counts) - 1, out=bins)
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+
+    def percentile(self, percentile):
+        """Return the level in dBFS below which percentile % of the blocks fall, or None"""
+        total = int(self.counts.sum())
+        if not total:
+            return None
+        rank = max(1, math.ceil(total * percentile / 100))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return LEVEL_MIN_DB + (index + 0.5) * LEVEL_STEP_DB
+
+
+class LevelMeter:
+    """Streaming block_levels: blocks stay aligned however the signal is split"""
+
+    def __init__(self, block_length, full_scale, detector='rms'):
+        self.block_length = block_length
+        self.full_scale = full_scale
+        self.detector = detector
+        self.carry = np.zeros(0)
+
+    def process(self, block):
+        """Return the levels of the detector blocks completed by block"""
+        samples = np.concatenate((self.carry, block)) if len(self.carry) else block
+        full = (len(samples) // self.block_length) * self.block_length
+        self.carry = np.array(samples[full:], dtype=np.float64)
+        return block_levels(samples[:full], self.block_length, self.full_scale, self.detector)
+
+    def flush(self):
+        """Return the level of the last, partial detector block, if any"""
+        levels = block_levels(self.carry, self.block_length, self.full_scale, self.detector)
+        self.carry = np.zeros(0)
+        return levels
+
+
+class NoiseGate:
+    """
+    Block-based noise gate with attack, hold and release.
+
+    The envelope is measured on DETECTOR_SECONDS blocks. A block opens the gate
+    when its level is more than open_ratio above the noise floor; the gate
+    stays fully open for hold_ms after the last such block, then its gain falls
+    linearly to closed_gain over release_ms. When it opens again the gain rises
+    to 1 over attack_ms. Gains are computed per detector block with array
+    operations (the attack slew limit is a running minimum) and ramped linearly
+    across the samples of each block.
+
+    The channels of a (frames, channels) signal share one gate, driven by the
+    loudest channel, so the balance between them is kept. Frames are fed with
+    process() in blocks of any size and come back delayed by less than one
+    detector block; flush() returns the rest.
+    """
+
+    def __init__(self, sample_rate, full_scale, noise_floor_db, attack_ms=5.0, hold_ms=50.0,
+                 release_ms=100.0, closed_gain=0.1, open_ratio=2.0, detector='rms'):
+        if detector not in DETECTORS:
+            raise ValueError(f"Unknown detector '{detector}', expected one of {', '.join(DETECTORS)}")
+
+        self.block_length = detector_block_length(sample_rate)
+        block_ms = 1000 * self.block_length / sample_rate
+        self.full_scale = full_scale
+        self.detector = detector
+        self.open_db = noise_floor_db + 20 * math.log10(open_ratio)
+        self.closed_gain = closed_gain
+        self.hold_blocks = int(round(hold_ms / block_ms))
+        self.release_blocks = max(1, int(round(release_ms / block_ms)))
+        self.attack_step = (1 - closed_gain) / max(1, int(round(attack_ms / block_ms)))
+
+        # The gate starts closed
+        self.since_open = self.hold_blocks + self.release_blocks
+        self.gain = closed_gain
+        self.lowest = closed_gain + self.attack_step
+        self.block_index = 0
+        self.carry = np.zeros(0)
+
+    def block_gains(self, levels):
+        """Return the gain at the end of each detector block, continuing from the previous call"""
+        count = len(levels)
+        if not count:
+            return np.zeros(0)
+        index = np.arange(count)
+
+        # Blocks since the gate was last opened, continuing the count of the previous call
+        is_open = levels > self.open_db
+        last_open = np.maximum.accumulate(np.where(is_open, index, -self.since_open - 1))
+        since_open = index - last_open
+
+        # Fully open while holding, then a linear release down to closed_gain
+        release = np.clip((since_open - self.hold_blocks) / self.release_blocks, 0, 1)
+        target = 1 - (1 - self.closed_gain) * release
+
+        # Attack: the gain rises by at most attack_step per block, i.e.
+        # gain[n] = min(target[n], gain[n - 1] + attack_step), which unrolls to
+        # gain[n] = min over m <= n of (target[m] - m * attack_step) + n * attack_step.
+        # n counts blocks from the start of the signal, so the result does not
+        # depend on how the signal was split between calls.
+        step = self.attack_step * (self.block_index + index)
+        lowest = np.minimum(np.minimum.accumulate(target - step), self.lowest)
+        gains = lowest + step
+
+        self.since_open = min(int(since_open[-1]), self.hold_blocks + self.release_blocks)
+        self.lowest = float(lowest[-1])
+        self.block_index += count
+        return gains
+
+    def advance(self, levels):
+        """
+        Update the state as if detector blocks with these levels had been gated,
+        without touching any samples. A copy of the gate taken before advance()
+        then gates those blocks elsewhere (e.g. in another process) exactly as
+        this gate would have.
+        """
+        gains = self.block_gains(levels)
+        if len(gains):
+            self.gain = float(gains[-1])
+
+    def gate_blocks(self, samples, levels):
+        """Apply the gate to samples made of whole detector blocks (the last may be partial)"""
+        previous = self.gain
+        gains = self.block_gains(levels)
+        if not len(gains):
+            return np.zeros(samples.shape)
+
+        # Ramp from the previous block's gain to this block's gain across its samples
+        starts = np.concatenate(([previous], gains[:-1]))
+        self.gain = float(gains[-1])
+        positions = np.arange(len(samples))
+        block = positions // self.block_length
+        ramp = (positions % self.block_length + 1) / self.block_length
+        frame_gains = starts[block] + (gains[block] - starts[block]) * ramp
+        return samples * (frame_gains[:, np.newaxis] if samples.ndim == 2 else frame_gains)
+
+    def process(self, block):
+        """Feed a block of samples and return the gated samples finished so far"""
+        samples = np.concatenate((self.carry, block)) if len(self.carry) else np.asarray(block)
+        full = (len(samples) // self.block_length) * self.block_length
+        self.carry = np.array(samples[full:], dtype=np.float64)
+        samples = samples[:full]
+        levels = block_levels(samples, self.block_length, self.full_scale, self.detector)
+        return self.gate_blocks(samples, levels)
+
+    def flush(self):
+        """Return the gated last, partial detector block once the whole signal has been fed"""
+        samples, self.carry = self.carry, np.zeros(0)
+        levels = block_levels(samples, self.block_length, self.full_scale, self.detector)
+        return self.gate_blocks(samples, levels)
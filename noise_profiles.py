@@ -0,0 +1,144 @@
+import hashlib
+import os
+import tempfile
+import numpy as np
+from spectral import OVERLAP
+
+# Bump when the way noise spectra are computed changes, so old entries are ignored
+PROFILE_VERSION = 3
+
+# Entries kept on disk; the least recently used ones are removed beyond this
+DEFAULT_MAX_ENTRIES = 256
+
+# Bytes read at a time when hashing a reference file
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_digest(filename):
+    """Return the SHA-256 hex digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class NoiseProfileStore:
+    """
+    On-disk cache of noise spectra, shared by every run and worker process.
+    Spectra are stored relative to the full scale of their reference file.
+
+    Entries are keyed by the content hash of the reference file and the
+    analysis parameters, so renaming or copying a reference still hits the
+    cache while editing it does not. Each entry is a .npy file that is
+    memory-mapped on load; writes go through a temporary file and an atomic
+    rename, so concurrent workers never see a partial entry. Hits refresh the
+    file's modification time, which orders entries for LRU eviction.
+    """
+
+    def __init__(self, directory, max_entries=DEFAULT_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        # Profiles already loaded by this process
+        self._loaded = {}
+
+    def key(self, noise_file, frame_size):
+        """Return the cache key of a reference file analysed with frame_size"""
+        parameters = f"v{PROFILE_VERSION}:frame={frame_size}:overlap={OVERLAP}:window=sqrt-hann"
+        return hashlib.sha256(f"{file_digest(noise_file)}:{parameters}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key):
+        """Return the cached spectrum for key, or None"""
+        if key in self._loaded:
+            return self._loaded[key]
+
+        path = self._path(key)
+        try:
+            spectrum = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        self._loaded[key] = spectrum
+        return spectrum
+
+    def put(self, key, spectrum):
+        """Store a spectrum and evict the least recently used entries"""
+        self._loaded[key] = spectrum
+        temp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(handle, 'wb') as file:
+                np.save(file, np.asarray(spectrum, dtype=np.float64))
+            os.replace(temp_path, self._path(key))
+        except OSError as e:
+            print(f"Warning: Could not store noise profile in {self.directory}: {e}")
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries beyond max_entries"""
+        try:
+            entries = [os.path.join(self.directory, name)
+                       for name in os.listdir(self.directory) if name.endswith('.npy')]
+        except OSError:
+            return
+
+        if len(entries) <= self.max_entries:
+            return
+
+        def last_used(path):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0
+
+        entries.sort(key=last_used)
+        for path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_or_compute(self, noise_file, frame_size, compute):
+        """
+        Return (spectrum, cached) for a reference file, calling compute() and
+        storing its result on a miss.
+        """
+        key = self.key(noise_file, frame_size)
+        spectrum = self.get(key)
+        if spectrum is not None:
+            return spectrum, True
+
+        spectrum = compute()
+        self.put(key, spectrum)
+        return spectrum, False
+
+
+_default_store = None
+
+
+def default_store():
+    """
+    Return the store used by ClearWaveAudio, or None when caching is disabled.
+
+    The cache lives in $CLEARWAVE_CACHE_DIR/noise_profiles (by default
+    ~/.cache/clearwave/noise_profiles); setting CLEARWAVE_CACHE_DIR to an empty
+    string disables it.
+    """
+    global _default_store
+    base = os.environ.get('CLEARWAVE_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'clearwave'))
+    if not base:
+        return None
+
+    directory = os.path.join(base, 'noise_profiles')
+    if _default_store is None or _default_store.directory != directory:
+        _default_store = NoiseProfileStore(directory)
+    return _default_store
@@ -0,0 +1,312 @@
+import copy
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from ClearWave import FUSION_BLOCK_SIZE, POINTWISE_OPERATIONS, ClearWaveAudio
+from noise_gate import NoiseFloorEstimator, block_levels, detector_block_length
+from regions import context_frames
+from signal_stats import StatsAccumulator, combine
+
+# Operations split into segments; the others run on the whole signal in the parent
+SEGMENTED_OPERATIONS = POINTWISE_OPERATIONS + ('reduce_noise', 'reduce_noise_with_reference')
+
+# Shortest segment worth sending to a worker, in frames (about 24 s at 44.1 kHz):
+# below it, spawning and copying to shared memory cost more than the split saves
+MIN_SEGMENT_FRAMES = 1 << 20
+
+
+class _SharedBuffer:
+    """A (frames, channels) sample array in shared memory, which workers attach to by name"""
+
+    def __init__(self, shape, dtype):
+        dtype = np.dtype(dtype)
+        self.memory = shared_memory.SharedMemory(create=True, size=max(1, math.prod(shape) * dtype.itemsize))
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.memory.buf)
+        self.spec = (self.memory.name, shape, dtype.str)
+
+    def close(self):
+        self.array = None
+        self.memory.close()
+        self.memory.unlink()
+
+
+def _attach(spec):
+    """Return (shared memory, array) for the spec of a _SharedBuffer created by the parent"""
+    name, shape, dtype = spec
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf)
+
+
+def _worker_audio(header):
+    """Return a ClearWaveAudio holding only the format, for its block kernels"""
+    audio = ClearWaveAudio(quiet=True)
+    audio._set_format(header)
+    return audio
+
+
+def _run_segment(task):
+    """
+    Worker entry point: run one segment task and return (modified count, stats).
+
+    task is (kind, header, counting, source spec, target spec, start, end, arguments);
+    the result for frames start..end of the source is written to the same frames
+    of the target. 'levels' tasks only read the source and return their levels.
+    """
+    kind, header, counting, source_spec, target_spec, start, end, arguments = task
+    audio = _worker_audio(header)
+    source_memory, source = _attach(source_spec)
+    target_memory, target = _attach(target_spec) if target_spec is not None else (None, None)
+    try:
+        if kind == 'levels':
+            block_length, detector = arguments
+            return block_levels(source[start:end], block_length, audio.max_value, detector), None
+
+        accumulator = StatsAccumulator(header['channels'], audio.min_value, audio.max_value) if counting else None
+        modified_count = 0
+
+        def emit(offset, block):
+            target[offset:offset + len(block)] = block
+            if accumulator is not None:
+                accumulator.add(block)
+
+        if kind == 'pointwise':
+            chain = audio._pointwise_chain(arguments, count_modified=counting)
+            block_frames = max(1, FUSION_BLOCK_SIZE // header['channels'])
+            for offset in range(start, end, block_frames):
+                block, block_modified = chain(source[offset:min(offset + block_frames, end)])
+                modified_count += block_modified
+                emit(offset, block)
+
+        elif kind == 'gate':
+            # The gate arrives in the state it has at start in the serial pass
+            gate, levels = arguments
+            block_length = gate.block_length
+            chunk_size = max(1, FUSION_BLOCK_SIZE // block_length) * block_length
+            for offset in range(start, end, chunk_size):
+                chunk = source[offset:min(offset + chunk_size, end)]
+                first = (offset - start) // block_length
+                chunk_levels = levels[first:first + math.ceil(len(chunk) / block_length)]
+                emit(offset, audio._to_samples(gate.gate_blocks(chunk, chunk_levels)))
+
+        elif kind == 'spectral':
+            # Overlapping context on each side lines the STFT frames up with
+            # those of the serial pass, then only the segment is kept
+            spectrum, frame_size, over_subtraction, spectral_floor, first, last = arguments
+            subtractor = audio._spectral_subtractor(spectrum, frame_size, over_subtraction, spectral_floor)
+            block_frames = max(1, FUSION_BLOCK_SIZE // header['channels'])
+            pieces = [subtractor.process(source[offset:min(offset + block_frames, last)])
+                      for offset in range(first, last, block_frames)]
+            pieces.append(subtractor.flush())
+            emit(start, audio._to_samples(np.concatenate(pieces)[start - first:end - first]))
+
+        return modified_count, accumulator.result() if accumulator is not None else None
+    finally:
+        source_memory.close()
+        if target_memory is not None:
+            target_memory.close()
+
+
+class SegmentExecutor:
+    """
+    Run the plan of a lazy ClearWaveAudio on several cores, splitting one long
+    signal into segments.
+
+    The samples are copied once into shared memory (multiprocessing.shared_memory)
+    and every worker of a process pool reads its segment from there and writes
+    its output into a second shared buffer, so no samples are pickled. Stages
+    are run one after another, each split into one segment per worker:
+
+    - amplify and anti_distortion (fused as in execute()) are point-wise, so
+      the segments are independent and the output is bit-identical to the
+      serial path;
+    - reduce_noise measures the detector levels of the segments in parallel,
+      estimates the noise floor from all of them, then runs the gate state
+      over the levels in the parent (one value per detector block) and hands
+      each worker a copy of the gate in the state it has at the start of its
+      segment, so the output is bit-identical as well;
+    - reduce_noise_with_reference gives each segment one STFT frame of
+      overlapping context on each side, aligned on the hop, and keeps the
+      segment's part of the output. FFT rounding can differ by one LSB from
+      the serial pass on a few samples.
+
+    change_speed, whose WSOLA alignment depends on all the output before it,
+    and convert_format, which changes the sample type, run on the whole signal
+    in the parent. Signals shorter
+    than two MIN_SEGMENT_FRAMES segments are processed serially, and the
+    number of workers is capped at the number of CPUs, since more processes
+    than cores only add overhead.
+
+    The pool is kept between calls; use the executor as a context manager or
+    call close(). Workers are spawned, as in server.py.
+
+    Example:
+        with SegmentExecutor(4) as executor:
+            audio = ClearWaveAudio(lazy=True)
+            audio.read_wav_file('long.wav')
+            executor.execute(audio.reduce_noise(-50).amplify(1.5))
+            audio.write_wav_file('out.wav')
+    """
+
+    def __init__(self, workers=None):
+        cpu_count = os.cpu_count() or 1
+        workers = workers or cpu_count
+        if workers < 1:
+            raise ValueError("The number of workers must be at least 1")
+        self.workers = min(workers, cpu_count)
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop the worker processes"""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def _map(self, tasks):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return list(self.pool.map(_run_segment, tasks))
+
+    def _segments(self, frame_count, grid):
+        """Return (start, end) of one segment per worker, with every start on a multiple of grid"""
+        count = max(1, min(self.workers, frame_count // MIN_SEGMENT_FRAMES))
+        bounds = [(frame_count * index // count) // grid * grid for index in range(count)] + [frame_count]
+        return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+    def execute(self, audio):
+        """
+        Run the operations recorded by a lazy ClearWaveAudio, like audio.execute().
+
+        Parameters:
+            audio (ClearWaveAudio): Audio with samples loaded and a recorded plan
+
+        Returns:
+            ClearWaveAudio: audio, with the plan applied
+        """
+        if self.workers == 1 or len(audio.samples) < 2 * MIN_SEGMENT_FRAMES:
+            return audio.execute()
+
+        plan, audio.plan = audio.plan, []
+        if not plan:
+            return audio
+        audio._log(f"Executing {len(plan)} planned operation(s) on {self.workers} worker(s)")
+
+        # Consecutive point-wise operations form one stage
+        stages = []
+        for name, params in plan:
+            if name in POINTWISE_OPERATIONS and stages and stages[-1][0] == 'pointwise':
+                stages[-1][1].append((name, params))
+            elif name in POINTWISE_OPERATIONS:
+                stages.append(('pointwise', [(name, params)]))
+            else:
+                stages.append((name, params))
+
+        lazy, audio.lazy = audio.lazy, False
+        buffers = None
+        try:
+            for name, params in stages:
+                if name != 'pointwise' and name not in SEGMENTED_OPERATIONS:
+                    if buffers is not None:
+                        self._release(audio, buffers)
+                        buffers = None
+                    getattr(audio, name)(**params)
+                    continue
+
+                if buffers is None:
+                    buffers = [_SharedBuffer(audio.samples.shape, audio.samples.dtype) for _ in range(2)]
+                    buffers[0].array[:] = audio.samples
+                    audio.samples = buffers[0].array
+                self._run_stage(audio, name, params, *buffers)
+                buffers.reverse()
+            if buffers is not None:
+                self._release(audio, buffers)
+                buffers = None
+        finally:
+            audio.lazy = lazy
+            if buffers is not None:
+                # A stage failed: the samples must not be left pointing at freed memory
+                self._release(audio, buffers)
+        return audio
+
+    @staticmethod
+    def _release(audio, buffers):
+        """Copy the samples out of shared memory, keeping their stats, and free the buffers"""
+        for buffer in buffers:
+            if audio.samples is buffer.array:
+                stats = audio._stats
+                audio.samples = buffer.array.copy()
+                audio._stats = stats
+        for buffer in buffers:
+            buffer.close()
+
+    def _run_stage(self, audio, name, params, source, target):
+        """Run one segmented stage from source to target and make target the samples of audio"""
+        header = audio.header
+        counting = audio._counting
+        frame_count = len(source.array)
+        previous = audio._stats
+
+        def tasks(kind, grid, arguments):
+            return [(kind, header, counting, source.spec, target.spec, start, end, arguments(start, end))
+                    for start, end in self._segments(frame_count, grid)]
+
+        stage = '+'.join(operation for operation, _ in params) if name == 'pointwise' else name
+        with audio._measure(stage) as metrics:
+            if name == 'pointwise':
+                results = self._map(tasks('pointwise', 1, lambda start, end: params))
+
+            elif name == 'reduce_noise':
+                # Recorded plans hold every parameter, defaults included
+                audio._log(f"Applying noise reduction with threshold: {params['threshold_db']}dB")
+                block_length = detector_block_length(header['sample_rate'])
+                segments = self._segments(frame_count, block_length)
+                levels = [result[0] for result in self._map(
+                    [('levels', header, counting, source.spec, None, start, end, (block_length, params['detector']))
+                     for start, end in segments])]
+
+                estimator = NoiseFloorEstimator()
+                for segment_levels in levels:
+                    estimator.add(segment_levels)
+                noise_floor_db = audio._noise_floor(estimator, params['threshold_db'], params['floor_percentile'])
+                audio._log(f"Detected noise floor: {noise_floor_db:.1f} dBFS")
+
+                # Hand each segment the gate in the state the serial pass reaches at its start
+                gate = audio._noise_gate(noise_floor_db, params['attack_ms'], params['hold_ms'],
+                                         params['release_ms'], params['detector'])
+                gates = []
+                for segment_levels in levels:
+                    gates.append(copy.deepcopy(gate))
+                    gate.advance(segment_levels)
+                results = self._map([('gate', header, counting, source.spec, target.spec, start, end,
+                                      (segment_gate, segment_levels))
+                                     for (start, end), segment_gate, segment_levels in zip(segments, gates, levels)])
+
+            else:
+                audio._log(f"Applying noise reduction using reference file: {params['noise_file']}")
+                frame_size = params['frame_size']
+                spectrum = audio._noise_spectrum(params['noise_file'], frame_size)
+                context, grid = context_frames(name, params, header['sample_rate'])
+
+                def arguments(start, end):
+                    return (spectrum, frame_size, params['over_subtraction'], params['spectral_floor'],
+                            max(0, start - context), min(frame_count, end + context))
+                results = self._map(tasks('spectral', grid, arguments))
+
+            audio.samples = target.array
+            if counting:
+                audio._stats = combine([stats for _, stats in results])
+            elif name == 'pointwise':
+                audio._derive_stats(previous, lambda extremes: audio._apply_pointwise(params, extremes)[0])
+
+            if name == 'pointwise' and any(operation == 'anti_distortion' for operation, _ in params) and counting:
+                metrics.modified_count = sum(modified for modified, _ in results)
+                percent_modified = (metrics.modified_count / target.array.size) * 100
+                audio._log(f"Anti-distortion modified {metrics.modified_count} samples ({percent_modified:.2f}% of total)")
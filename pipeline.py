@@ -0,0 +1,141 @@
+import hashlib
+import json
+from noise_profiles import file_digest
+from streaming import ClearWaveStream
+
+# Operations a pipeline may run, by ClearWaveStream method name
+OPERATIONS = ('amplify', 'anti_distortion', 'reduce_noise', 'reduce_noise_with_reference', 'limit', 'compress',
+              'normalize_loudness', 'change_speed', 'convert_format')
+
+# JSON types accepted for each operation parameter
+_NUMBER = 'a number'
+_OPTIONAL_NUMBER = 'a number or null'
+_INTEGER = 'an integer'
+_STRING = 'a string'
+_BOOLEAN = 'a boolean'
+PARAMETER_TYPES = {
+    'gain_factor': _NUMBER,
+    'no_limit': _BOOLEAN,
+    'threshold': _NUMBER,
+    'threshold_db': _NUMBER,
+    'attack_ms': _NUMBER,
+    'hold_ms': _NUMBER,
+    'release_ms': _NUMBER,
+    'floor_percentile': _NUMBER,
+    'detector': _STRING,
+    'noise_file': _STRING,
+    'over_subtraction': _NUMBER,
+    'spectral_floor': _NUMBER,
+    'frame_size': _INTEGER,
+    'ceiling_db': _NUMBER,
+    'ratio': _NUMBER,
+    'makeup_db': _NUMBER,
+    'target_lufs': _NUMBER,
+    'max_true_peak_db': _OPTIONAL_NUMBER,
+    'speed_factor': _NUMBER,
+    'method': _STRING,
+    'sample_format': _STRING,
+}
+
+# Bump when the output of an operation changes, so cached results are not reused
+PIPELINE_VERSION = 1
+
+
+def _has_type(value, expected):
+    """Whether a decoded JSON value is of one of the PARAMETER_TYPES"""
+    if expected == _BOOLEAN:
+        return isinstance(value, bool)
+    if expected == _STRING:
+        return isinstance(value, str)
+    if value is None:
+        return expected == _OPTIONAL_NUMBER
+    # JSON true and false decode to bool, which is a subclass of int
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, int) if expected == _INTEGER else isinstance(value, (int, float))
+
+
+def pipeline_from_spec(spec):
+    """
+    Validate a decoded pipeline spec and return its list of (name, params)
+    operations, with every parameter filled in (defaults included).
+
+    The spec is a list of [operation, parameters] pairs using the ClearWaveAudio
+    method and parameter names, e.g.
+    [["amplify", {"gain_factor": 1.5}], ["change_speed", {"speed_factor": 1.25}]].
+    The parameters may be omitted; given ones must have the JSON type listed
+    in PARAMETER_TYPES.
+
+    Raises:
+        ValueError: If the spec is not valid
+    """
+    if not isinstance(spec, list):
+        raise ValueError("The pipeline must be a JSON list of [operation, parameters] pairs")
+
+    stream = ClearWaveStream()
+    for entry in spec:
+        if (not isinstance(entry, list) or len(entry) not in (1, 2) or not isinstance(entry[0], str) or
+                (len(entry) == 2 and not isinstance(entry[1], dict))):
+            raise ValueError(f"Invalid pipeline entry {json.dumps(entry)}, expected [operation, parameters]")
+        name = entry[0]
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}', expected one of {', '.join(OPERATIONS)}")
+        for parameter, value in (entry[1] if len(entry) == 2 else {}).items():
+            if parameter in PARAMETER_TYPES and not _has_type(value, PARAMETER_TYPES[parameter]):
+                raise ValueError(f"Invalid parameter {parameter} of {name}: expected {PARAMETER_TYPES[parameter]}, "
+                                 f"got {json.dumps(value)}")
+        try:
+            getattr(stream, name)(**(entry[1] if len(entry) == 2 else {}))
+        except TypeError as e:
+            raise ValueError(f"Invalid parameters for {name}: {e}")
+    return stream.operations
+
+
+def parse_pipeline(text):
+    """
+    Parse a JSON pipeline spec (see pipeline_from_spec) into a list of
+    (name, params) operations.
+
+    Raises:
+        ValueError: If the spec is not valid
+    """
+    try:
+        spec = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid pipeline JSON: {e}")
+    return pipeline_from_spec(spec)
+
+
+def load_pipeline(filename):
+    """Read a JSON pipeline spec file into a list of (name, params) operations"""
+    with open(filename) as file:
+        return parse_pipeline(file.read())
+
+
+def pipeline_json(operations):
+    """
+    Return the canonical JSON spec of a list of operations: parameters sorted
+    and no whitespace, so equal pipelines serialize to the same text.
+    """
+    return json.dumps([[name, params] for name, params in operations], sort_keys=True, separators=(',', ':'))
+
+
+def stage_keys(input_digest, operations):
+    """
+    Return one cache key per operation: the key of the output after that
+    operation, for an input with content digest input_digest.
+
+    Each key hashes the previous one with the canonical JSON of the
+    operation, so pipelines sharing their first operations share the keys of
+    those stages. The content of noise reference files is hashed in as well,
+    since editing a reference changes the result under the same path.
+    """
+    keys = []
+    key = hashlib.sha256(f"v{PIPELINE_VERSION}:{input_digest}".encode()).hexdigest()
+    for name, params in operations:
+        stage = pipeline_json([(name, params)])
+        if name == 'reduce_noise_with_reference':
+            stage += f":noise={file_digest(params['noise_file'])}"
+        key = hashlib.sha256(f"{key}:{stage}".encode()).hexdigest()
+        keys.append(key)
+    return keys
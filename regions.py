@@ -0,0 +1,182 @@
+import math
+import numpy as np
+from ClearWave import ClearWaveAudio, map_wav_data
+from noise_gate import detector_block_length
+from spectral import DEFAULT_FRAME_SIZE, OVERLAP
+
+# Units of the bounds of a region
+REGION_UNITS = ('seconds', 'samples')
+
+
+def context_frames(name, params, sample_rate):
+    """
+    Return (context, grid) for an operation: the frames of surrounding audio
+    it needs on each side of a region, and the spacing of the frames or blocks
+    it analyses. Starting the decoded audio on a multiple of grid lines those
+    up with the ones of whole-file processing.
+    """
+    if name == 'reduce_noise_with_reference':
+        # An output sample depends on the STFT frames that overlap it
+        return params['frame_size'], params['frame_size'] // OVERLAP
+    if name == 'reduce_noise':
+        # The gate gain lags the signal by up to the attack, hold and release times
+        context = math.ceil((params['attack_ms'] + params['hold_ms'] + params['release_ms']) * sample_rate / 1000)
+        return context, detector_block_length(sample_rate)
+    if name in ('limit', 'compress'):
+        # The gain looks ahead and averages over the attack, then recovers over the release
+        return math.ceil((2 * params['attack_ms'] + params['release_ms']) * sample_rate / 1000), 1
+    return 0, 1
+
+
+class ClearWaveRegion:
+    """
+    Apply ClearWaveAudio operations to a time range of a WAV file, in place.
+
+    Only length-preserving operations are available (amplify, anti_distortion,
+    the noise reductions, limit and compress), so the processed region has the same size as
+    the bytes it replaces. apply() maps the data chunk of the file read-write,
+    decodes the frames of the region plus the context its operations need on
+    each side, runs the operations and writes back the frames of the region
+    only. The rest of the file is neither read nor rewritten, so the cost
+    depends on the length of the region, not of the file.
+
+    reduce_noise estimates its noise floor from the region and its context
+    rather than from the whole file.
+
+    Example:
+        ClearWaveRegion(600, 610).amplify(1.5).anti_distortion(0.8).apply('out.wav')
+    """
+
+    def __init__(self, start, end=None, unit='seconds', quiet=False, observer=None, channel_workers=1):
+        """
+        Parameters:
+            start (float): Start of the region
+            end (float): End of the region (excluded), or None for the end of the file
+            unit (str): 'seconds', or 'samples' for frame indices
+            quiet, observer, channel_workers: As for ClearWaveAudio
+        """
+        if unit not in REGION_UNITS:
+            raise ValueError(f"Unknown region unit '{unit}', expected one of {', '.join(REGION_UNITS)}")
+        if start < 0 or (end is not None and end <= start):
+            raise ValueError("A region must start at or after 0 and end after its start")
+        self.start = start
+        self.end = end
+        self.unit = unit
+        self.quiet = quiet
+        self.observer = observer
+        self.channel_workers = channel_workers
+        self.operations = []
+
+    def _log(self, *args):
+        """Print diagnostics unless in quiet mode"""
+        if not self.quiet:
+            print(*args)
+
+    def amplify(self, gain_factor=2.0, no_limit=True):
+        self.operations.append(('amplify', {'gain_factor': gain_factor, 'no_limit': no_limit}))
+        return self
+
+    def anti_distortion(self, threshold=0.8):
+        self.operations.append(('anti_distortion', {'threshold': threshold}))
+        return self
+
+    def reduce_noise(self, threshold_db=-60, attack_ms=5.0, hold_ms=50.0, release_ms=100.0,
+                     floor_percentile=10.0, detector='rms'):
+        self.operations.append(('reduce_noise', {
+            'threshold_db': threshold_db,
+            'attack_ms': attack_ms,
+            'hold_ms': hold_ms,
+            'release_ms': release_ms,
+            'floor_percentile': floor_percentile,
+            'detector': detector
+        }))
+        return self
+
+    def reduce_noise_with_reference(self, noise_file, over_subtraction=1.0, spectral_floor=0.05,
+                                    frame_size=DEFAULT_FRAME_SIZE):
+        self.operations.append(('reduce_noise_with_reference', {
+            'noise_file': noise_file,
+            'over_subtraction': over_subtraction,
+            'spectral_floor': spectral_floor,
+            'frame_size': frame_size
+        }))
+        return self
+
+    def limit(self, ceiling_db=-1.0, attack_ms=5.0, release_ms=50.0):
+        self.operations.append(('limit', {'ceiling_db': ceiling_db, 'attack_ms': attack_ms, 'release_ms': release_ms}))
+        return self
+
+    def compress(self, threshold_db=-20.0, ratio=4.0, attack_ms=5.0, release_ms=100.0, makeup_db=0.0):
+        self.operations.append(('compress', {
+            'threshold_db': threshold_db,
+            'ratio': ratio,
+            'attack_ms': attack_ms,
+            'release_ms': release_ms,
+            'makeup_db': makeup_db
+        }))
+        return self
+
+    def frame_range(self, sample_rate, frame_count):
+        """Return the region as (first frame, end frame), clamped to a file of frame_count frames"""
+        scale = sample_rate if self.unit == 'seconds' else 1
+        start = min(int(round(self.start * scale)), frame_count)
+        end = frame_count if self.end is None else min(int(round(self.end * scale)), frame_count)
+        return start, max(start, end)
+
+    def apply(self, filename):
+        """
+        Process the region of a WAV file and write the result back into the file.
+
+        Parameters:
+            filename (str): WAV file to patch; its size and header are unchanged
+
+        Returns:
+            int: The number of frames rewritten (0 if the region lies past the end)
+        """
+        header, data = map_wav_data(filename, writable=True)
+        audio = ClearWaveAudio(lazy=True, quiet=self.quiet, observer=self.observer,
+                               channel_workers=self.channel_workers)
+        audio._set_format(header)
+
+        channels = header['channels']
+        bytes_per_sample = header['bits_per_sample'] // 8
+        audio_format = header['audio_format']
+        frame_size = bytes_per_sample * channels
+        frame_count = len(data) // frame_size
+        start, end = self.frame_range(header['sample_rate'], frame_count)
+        if start == end:
+            self._log(f"Region is empty in {filename} ({frame_count} samples), nothing to do")
+            return 0
+
+        # Decode the region with the context its operations need on each side
+        context, grid = 0, 1
+        for name, params in self.operations:
+            frames, spacing = context_frames(name, params, header['sample_rate'])
+            context, grid = max(context, frames), math.lcm(grid, spacing)
+        first = max(0, (start - context) // grid * grid)
+        last = min(frame_count, end + context)
+        self._log(f"Editing samples {start} to {end} of {frame_count} in {filename}")
+
+        with audio._measure('read_wav_region') as metrics:
+            audio.samples = audio._decode_samples(data[first * frame_size:last * frame_size], bytes_per_sample,
+                                                  channels, audio_format).astype(audio._dtype)
+            metrics.input_samples = len(audio.samples)
+
+        for name, params in self.operations:
+            getattr(audio, name)(**params)
+        audio.execute()
+
+        with audio._measure('write_wav_region') as metrics:
+            region = audio.samples[start - first:end - first]
+            if audio._counting:
+                metrics.clipped_count = int(np.count_nonzero(region > audio.max_value) +
+                                            np.count_nonzero(region < audio.min_value))
+            region = np.clip(region, audio.min_value, audio.max_value)
+            data[start * frame_size:end * frame_size] = np.frombuffer(
+                audio._encode_samples(region, bytes_per_sample, audio_format), dtype=np.uint8)
+            data.flush()
+
+        if metrics.clipped_count:
+            self._log(f"Clipped {metrics.clipped_count} samples in the region")
+        self._log(f"Patched {end - start} samples of {filename} in place")
+        return end - start
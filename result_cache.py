@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from ClearWave import ClearWaveAudio
+from noise_profiles import file_digest
+from pipeline import stage_keys
+from streaming import DEFAULT_BLOCK_SIZE, ClearWaveStream
+
+# Total size of the entries kept on disk; the least recently used ones are removed beyond this
+DEFAULT_MAX_BYTES = 2 << 30
+
+# Suffixes of final WAV outputs and of intermediate stage outputs
+OUTPUT_SUFFIX = '.wav'
+STAGE_SUFFIX = '.npz'
+
+
+class ResultCache:
+    """
+    On-disk, content-addressed cache of pipeline results.
+
+    Entries are keyed by pipeline.stage_keys: the content hash of the input
+    file chained with the canonical JSON of each operation, so a renamed or
+    copied input still hits the cache and an edited one does not. Final
+    outputs are stored as WAV files; intermediate stage outputs hold the
+    working samples unclipped (.npz with the format), so resuming from one
+    gives exactly the samples the full run would have had at that point.
+
+    As in noise_profiles.NoiseProfileStore, writes go through a temporary file
+    and an atomic rename, and hits refresh the modification time, which
+    orders entries for LRU eviction once they take more than max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Digests of files already hashed by this process, by (path, size, mtime)
+        self._digests = {}
+
+    def digest(self, filename):
+        """Return the content digest of a file, hashing it once per version of the file"""
+        status = os.stat(filename)
+        identity = (os.path.abspath(filename), status.st_size, status.st_mtime_ns)
+        if identity not in self._digests:
+            self._digests[identity] = file_digest(filename)
+        return self._digests[identity]
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key[:2], f"{key}{suffix}")
+
+    def _hit(self, key, suffix):
+        """Return the path of an entry and mark it used, or None"""
+        path = self._path(key, suffix)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def _store(self, key, suffix, write):
+        """Store an entry written by write(file) and evict the least recently used ones"""
+        directory = os.path.dirname(self._path(key, suffix))
+        temp_path = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(handle, 'wb') as file:
+                write(file)
+            if os.path.getsize(temp_path) > self.max_bytes:
+                # Would evict everything else and then itself
+                os.remove(temp_path)
+                return
+            os.replace(temp_path, self._path(key, suffix))
+        except OSError as e:
+            print(f"Warning: Could not store result in {self.directory}: {e}")
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self.evict()
+
+    def get_output(self, key):
+        """Return the path of the cached WAV output for key, or None"""
+        return self._hit(key, OUTPUT_SUFFIX)
+
+    def put_output(self, key, filename):
+        """Store a copy of the WAV file filename as the output for key"""
+        if os.path.getsize(filename) > self.max_bytes:
+            return
+        with open(filename, 'rb') as source:
+            self._store(key, OUTPUT_SUFFIX, lambda file: shutil.copyfileobj(source, file))
+
+    def get_stage(self, key):
+        """Return (header, samples) of a cached intermediate stage output, or None"""
+        path = self._hit(key, STAGE_SUFFIX)
+        if path is None:
+            return None
+        try:
+            with np.load(path) as entry:
+                return json.loads(str(entry['header'])), entry['samples']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put_stage(self, key, header, samples):
+        """Store the working samples and format header of an intermediate stage output"""
+        if samples.nbytes > self.max_bytes:
+            # Not worth writing only to remove it
+            return
+        self._store(key, STAGE_SUFFIX, lambda file: np.savez(file, header=json.dumps(header), samples=samples))
+
+    def evict(self):
+        """Remove the least recently used entries until they take at most max_bytes"""
+        entries = []
+        try:
+            for folder in os.scandir(self.directory):
+                if not folder.is_dir():
+                    continue
+                for entry in os.scandir(folder.path):
+                    if entry.name.endswith((OUTPUT_SUFFIX, STAGE_SUFFIX)):
+                        status = entry.stat()
+                        entries.append((status.st_mtime, status.st_size, entry.path))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def run(self, input_file, output_file, operations, cache_stages=True, quiet=True, block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Write the result of a pipeline on input_file to output_file, from the
+        cache when possible.
+
+        A cached output is copied straight to output_file. Otherwise, with
+        cache_stages, the run resumes from the output of the longest cached
+        prefix of the pipeline and stores the output of every stage it runs,
+        so changing one operation only re-runs it and the ones after it. The
+        stages then run one at a time in memory (no fusion of point-wise
+        operations). Without cache_stages, a miss streams the whole pipeline
+        with ClearWaveStream.
+
+        Parameters:
+            input_file (str): WAV file to process
+            output_file (str): WAV file to write
+            operations (list): (name, params) operations, e.g. from pipeline.parse_pipeline
+            cache_stages (bool): Also cache and reuse intermediate stage outputs
+            quiet (bool): As for ClearWaveAudio
+            block_size (int): Frames per block when streaming without cache_stages
+
+        Returns:
+            int: The number of operations actually run (0 when the output came from the cache)
+        """
+        input_digest = self.digest(input_file)
+        keys = stage_keys(input_digest, operations)
+        # The output of an empty pipeline is the input rewritten canonically
+        output_key = hashlib.sha256(f"{keys[-1] if keys else input_digest}:output".encode()).hexdigest()
+
+        cached = self.get_output(output_key)
+        if cached is not None:
+            shutil.copyfile(cached, output_file)
+            return 0
+
+        if not cache_stages:
+            stream = ClearWaveStream(block_size, quiet=quiet)
+            stream.operations = list(operations)
+            stream.process(input_file, output_file)
+            self.put_output(output_key, output_file)
+            return len(operations)
+
+        # Resume from the longest cached prefix
+        audio = ClearWaveAudio(quiet=quiet)
+        done = 0
+        for index in range(len(operations), 0, -1):
+            stage = self.get_stage(keys[index - 1])
+            if stage is not None:
+                header, samples = stage
+                audio._set_format(header)
+                audio.samples = samples
+                done = index
+                break
+        if not done:
+            audio.read_wav_file(input_file)
+
+        for (name, params), key in zip(operations[done:], keys[done:]):
+            getattr(audio, name)(**params)
+            self.put_stage(key, audio.header, audio.samples)
+
+        audio.write_wav_file(output_file)
+        self.put_output(output_key, output_file)
+        return len(operations) - done
+
+
+_default_cache = None
+
+
+def default_cache():
+    """
+    Return the cache in $CLEARWAVE_CACHE_DIR/results (by default
+    ~/.cache/clearwave/results), or None when CLEARWAVE_CACHE_DIR is set to an
+    empty string.
+    """
+    global _default_cache
+    base = os.environ.get('CLEARWAVE_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'clearwave'))
+    if not base:
+        return None
+
+    directory = os.path.join(base, 'results')
+    if _default_cache is None or _default_cache.directory != directory:
+        _default_cache = ResultCache(directory)
+    return _default_cache
@@ -0,0 +1,555 @@
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from pipeline import parse_pipeline
+from streaming import DEFAULT_BLOCK_SIZE, ClearWaveStream
+
+DEFAULT_PORT = 8750
+
+# Requests waiting for a worker beyond this are rejected with 503
+DEFAULT_MAX_QUEUE = 16
+
+# Seconds a request may wait for a worker before it is rejected with 503
+DEFAULT_QUEUE_TIMEOUT = 30.0
+
+# Bytes of request body read from the socket and passed to the worker at a time
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Largest request line plus headers accepted
+MAX_HEADER_SIZE = 64 * 1024
+
+# Seconds spent discarding the rest of an upload after an error response, so
+# the client reads the response instead of a connection reset
+LINGER_SECONDS = 5.0
+
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class RequestError(Exception):
+    """A request that is answered with an HTTP error status"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class _PipeReader:
+    """
+    Binary file object over the byte chunks received on a connection, up to an
+    empty chunk. Only forward seeks are possible.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.buffer = bytearray()
+        self.position = 0
+        self.ended = False
+
+    def _fill(self, size):
+        while (size < 0 or len(self.buffer) < size) and not self.ended:
+            chunk = self.connection.recv_bytes()
+            if chunk:
+                self.buffer += chunk
+            else:
+                self.ended = True
+
+    def read(self, size=-1):
+        self._fill(size)
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.position += len(data)
+        return data
+
+    def tell(self):
+        return self.position
+
+    def seekable(self):
+        return False
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        target = offset if whence == io.SEEK_SET else self.position + offset
+        if whence not in (io.SEEK_SET, io.SEEK_CUR) or target < self.position:
+            raise io.UnsupportedOperation("Only forward seeks are possible on a stream")
+        while self.position < target and self.read(min(target - self.position, UPLOAD_CHUNK_SIZE)):
+            pass
+        return self.position
+
+    def drain(self):
+        """Discard the rest of the input"""
+        while not self.ended:
+            self.buffer.clear()
+            self._fill(UPLOAD_CHUNK_SIZE)
+        self.buffer.clear()
+
+
+def _worker_main(requests, responses):
+    """
+    Worker process loop.
+
+    Each job arrives as (operations, block_size) followed by the WAV file in
+    byte chunks and an empty chunk. The output goes back as ('data', bytes)
+    messages, an ('error', status, message) message if the job fails, and a
+    final ('done',) once the input has been consumed and the worker is free.
+    """
+    while True:
+        try:
+            job = requests.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+
+        operations, block_size = job
+        source = _PipeReader(requests)
+        spool = None
+        try:
+            stream = ClearWaveStream(block_size, quiet=True)
+            stream.operations = operations
+            if stream.needs_seekable_input():
+                # An analysis pass reads the input twice, so it is kept on disk
+                spool = tempfile.TemporaryFile()
+                shutil.copyfileobj(source, spool, UPLOAD_CHUNK_SIZE)
+                spool.seek(0)
+            for data in stream.iter_process(spool or source):
+                responses.send(('data', data))
+        except Exception as e:
+            responses.send(('error', 400 if isinstance(e, ValueError) else 500, str(e)))
+        finally:
+            if spool is not None:
+                spool.close()
+        source.drain()
+        responses.send(('done',))
+
+
+class _Worker:
+    """A worker process and the pipes that carry its jobs"""
+
+    def __init__(self, context):
+        request_receiver, self.requests = context.Pipe(duplex=False)
+        self.responses, response_sender = context.Pipe(duplex=False)
+        self.process = context.Process(target=_worker_main, args=(request_receiver, response_sender), daemon=True)
+        self.process.start()
+        # Set when the process failed during a job
+        self.broken = False
+        # Only the worker keeps its ends, so a dead worker shows up as EOFError
+        request_receiver.close()
+        response_sender.close()
+
+    def stop(self):
+        try:
+            self.requests.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.requests.close()
+        self.responses.close()
+
+
+class ClearWaveServer:
+    """
+    Local HTTP service that streams WAV files through ClearWave pipelines.
+
+    POST /process with the WAV file as the body (Content-Length or chunked) and
+    the pipeline (see parse_pipeline) in the X-ClearWave-Pipeline header or the
+    pipeline query parameter. The processed WAV file is sent back with chunked
+    transfer encoding as blocks are finished. GET /status returns the load as JSON.
+
+    The work runs on a fixed pool of worker processes, one request per worker
+    at a time. Requests wait for a free worker in a queue of at most max_queue
+    entries and for at most queue_timeout seconds; beyond either limit they are
+    rejected with 503 and a Retry-After header, so accepted requests keep a
+    predictable latency. Uploads are read only as fast as the worker consumes
+    them and results only produced as fast as the client reads them, since
+    every pipe and socket in between is bounded.
+
+    The noise_file of reduce_noise_with_reference is resolved inside
+    reference_dir, and refused if it points outside of it, so clients cannot
+    make the workers open arbitrary files. Without a reference_dir that
+    operation is refused.
+
+    Example:
+        asyncio.run(ClearWaveServer(workers=4).serve(port=8750))
+    """
+
+    def __init__(self, workers=None, max_queue=DEFAULT_MAX_QUEUE, queue_timeout=DEFAULT_QUEUE_TIMEOUT,
+                 block_size=DEFAULT_BLOCK_SIZE, max_upload_size=None, reference_dir=None):
+        workers = workers or os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError("Number of workers must be at least 1")
+        if max_queue < 0:
+            raise ValueError("Queue size cannot be negative")
+        self.worker_count = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.block_size = block_size
+        self.max_upload_size = max_upload_size
+        self.reference_dir = os.path.realpath(reference_dir) if reference_dir else None
+
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = []
+        self.idle = None
+        self.waiting = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.server = None
+        # Threads doing the blocking pipe I/O: at most a send and a receive per worker
+        self.executor = ThreadPoolExecutor(2 * workers)
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT, unix_path=None):
+        """Start the workers and listen on host:port, or on a Unix socket at unix_path"""
+        self.idle = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        self.workers = await asyncio.gather(*(loop.run_in_executor(self.executor, _Worker, self.context)
+                                              for _ in range(self.worker_count)))
+        for worker in self.workers:
+            self.idle.put_nowait(worker)
+
+        if unix_path:
+            self.server = await asyncio.start_unix_server(self._handle, path=unix_path, limit=MAX_HEADER_SIZE)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port, limit=MAX_HEADER_SIZE)
+        return self.server
+
+    async def close(self):
+        """Stop listening and stop the workers"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, worker.stop) for worker in self.workers))
+        self.workers = []
+        self.executor.shutdown(wait=False)
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT, unix_path=None):
+        """Start the server and run until cancelled"""
+        server = await self.start(host, port, unix_path)
+        address = unix_path or ':'.join(str(part) for part in server.sockets[0].getsockname()[:2])
+        print(f"ClearWave server listening on {address} with {self.worker_count} worker(s)")
+        try:
+            await server.serve_forever()
+        finally:
+            await self.close()
+
+    def status(self):
+        """Return the load of the server as a dict"""
+        return {
+            'workers': self.worker_count,
+            'busy': self.worker_count - self.idle.qsize(),
+            'queued': self.waiting,
+            'max_queue': self.max_queue,
+            'processed': self.processed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+        }
+
+    async def _acquire(self):
+        """Wait for a free worker, or raise RequestError(503) if the queue is full or too slow"""
+        if self.idle.empty() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise RequestError(503, "All workers are busy and the queue is full", {'Retry-After': '1'})
+
+        self.waiting += 1
+        try:
+            return await asyncio.wait_for(self.idle.get(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise RequestError(503, f"No worker became free within {self.queue_timeout}s", {'Retry-After': '1'})
+        finally:
+            self.waiting -= 1
+
+    def _release(self, worker):
+        """Return a worker to the pool, replacing it if its process failed"""
+        if worker.broken or not worker.process.is_alive():
+            failed = worker
+            failed.stop()
+            worker = _Worker(self.context)
+            self.workers = [worker if old is failed else old for old in self.workers]
+        self.idle.put_nowait(worker)
+
+    async def _handle(self, reader, writer):
+        """Serve one request on a connection, then close it"""
+        try:
+            method, target, headers = await self._read_head(reader)
+            url = urlsplit(target)
+            if url.path == '/status':
+                if method != 'GET':
+                    raise RequestError(405, "Use GET for /status")
+                await self._respond(writer, 200, json.dumps(self.status()), 'application/json')
+            elif url.path == '/process':
+                if method != 'POST':
+                    raise RequestError(405, "Use POST for /process")
+                await self._process(reader, writer, headers, parse_qs(url.query))
+            else:
+                raise RequestError(404, f"No such resource {url.path}")
+        except RequestError as e:
+            try:
+                await self._respond(writer, e.status, str(e), headers=e.headers)
+                await self._linger(reader, writer)
+            except ConnectionError:
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_head(self, reader):
+        """Return (method, target, headers) of the next request, header names in lower case"""
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise RequestError(400, "Request headers are too large")
+
+        lines = head.decode('latin-1').split('\r\n')
+        parts = lines[0].split(' ')
+        if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+            raise RequestError(400, "Malformed request line")
+
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, separator, value = line.partition(':')
+            if not separator:
+                raise RequestError(400, "Malformed header line")
+            headers[name.strip().lower()] = value.strip()
+        return parts[0], parts[1], headers
+
+    async def _linger(self, reader, writer):
+        """Close the sending side and discard what the client still uploads, for a while"""
+        if writer.can_write_eof():
+            writer.write_eof()
+
+        async def discard():
+            while await reader.read(UPLOAD_CHUNK_SIZE):
+                pass
+
+        try:
+            await asyncio.wait_for(discard(), LINGER_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _respond(self, writer, status, body, content_type='text/plain; charset=utf-8', headers=None):
+        """Send a complete response"""
+        body = (body if body.endswith('\n') else body + '\n').encode()
+        head = [f"HTTP/1.1 {status} {REASONS[status]}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}", "Connection: close"]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+        await writer.drain()
+
+    async def _body_chunks(self, reader, headers):
+        """Yield the request body in chunks of at most UPLOAD_CHUNK_SIZE bytes"""
+        received = 0
+
+        def count(size):
+            nonlocal received
+            received += size
+            if self.max_upload_size is not None and received > self.max_upload_size:
+                raise RequestError(413, f"Uploads are limited to {self.max_upload_size} bytes")
+
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            while True:
+                line = await reader.readline()
+                try:
+                    size = int(line.split(b';')[0], 16)
+                except ValueError:
+                    raise RequestError(400, "Malformed chunked body")
+                if size == 0:
+                    # Skip the trailers
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return
+                count(size)
+                while size:
+                    data = await reader.readexactly(min(size, UPLOAD_CHUNK_SIZE))
+                    size -= len(data)
+                    yield data
+                await reader.readexactly(2)
+        else:
+            remaining = int(headers['content-length'])
+            while remaining:
+                data = await reader.read(min(remaining, UPLOAD_CHUNK_SIZE))
+                if not data:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                count(len(data))
+                remaining -= len(data)
+                yield data
+
+    async def _process(self, reader, writer, headers, query):
+        spec = headers.get('x-clearwave-pipeline') or query.get('pipeline', ['[]'])[0]
+        try:
+            operations = parse_pipeline(spec)
+        except ValueError as e:
+            raise RequestError(400, str(e))
+        operations = self._resolve_references(operations)
+
+        if 'chunked' not in headers.get('transfer-encoding', '').lower():
+            if 'content-length' not in headers:
+                raise RequestError(411, "The request body needs a Content-Length or chunked encoding")
+            try:
+                length = int(headers['content-length'])
+            except ValueError:
+                raise RequestError(400, "Invalid Content-Length")
+            if self.max_upload_size is not None and length > self.max_upload_size:
+                raise RequestError(413, f"Uploads are limited to {self.max_upload_size} bytes")
+
+        queued = time.perf_counter()
+        worker = await self._acquire()
+        try:
+            if headers.get('expect', '').lower() == '100-continue':
+                writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+                await writer.drain()
+            await self._run_job(worker, operations, reader, writer, headers, time.perf_counter() - queued)
+        finally:
+            self._release(worker)
+
+    def _resolve_references(self, operations):
+        """Return operations with every noise_file resolved inside reference_dir"""
+        resolved = []
+        for name, params in operations:
+            if 'noise_file' in params:
+                if self.reference_dir is None:
+                    raise RequestError(400, f"{name} is not available: the server has no reference directory")
+                path = os.path.realpath(os.path.join(self.reference_dir, params['noise_file']))
+                if os.path.commonpath([self.reference_dir, path]) != self.reference_dir:
+                    raise RequestError(400, f"Invalid noise_file of {name}: outside the reference directory")
+                if not os.path.isfile(path):
+                    raise RequestError(400, f"Unknown noise_file of {name}: {params['noise_file']}")
+                params = dict(params, noise_file=path)
+            resolved.append((name, params))
+        return resolved
+
+    async def _run_job(self, worker, operations, reader, writer, headers, queue_seconds):
+        """Feed the upload to a worker while relaying its output to the client"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, worker.requests.send, (operations, self.block_size))
+
+        worker_error = None
+        upload_error = None
+        stop_feeding = asyncio.Event()
+
+        async def feed():
+            nonlocal upload_error
+            try:
+                async for chunk in self._body_chunks(reader, headers):
+                    if stop_feeding.is_set():
+                        break
+                    await loop.run_in_executor(self.executor, worker.requests.send_bytes, chunk)
+            except (RequestError, ConnectionError, asyncio.IncompleteReadError) as e:
+                upload_error = e
+            finally:
+                try:
+                    await loop.run_in_executor(self.executor, worker.requests.send_bytes, b'')
+                except OSError:
+                    pass
+
+        started = False
+
+        async def relay():
+            nonlocal worker_error, started
+            client_gone = False
+            while True:
+                message = await loop.run_in_executor(self.executor, worker.responses.recv)
+                if message[0] == 'done':
+                    return
+                if message[0] == 'error':
+                    worker_error = RequestError(message[1], message[2])
+                    stop_feeding.set()
+                    continue
+                if client_gone or upload_error is not None:
+                    continue
+                try:
+                    if not started:
+                        writer.write((f"HTTP/1.1 200 OK\r\nContent-Type: audio/wav\r\n"
+                                      f"Transfer-Encoding: chunked\r\nConnection: close\r\n"
+                                      f"X-ClearWave-Queue-Seconds: {queue_seconds:.3f}\r\n\r\n").encode())
+                        started = True
+                    data = message[1]
+                    writer.write(f"{len(data):x}\r\n".encode() + data + b'\r\n')
+                    # Waiting for the client here holds back the worker
+                    await writer.drain()
+                except ConnectionError:
+                    client_gone = True
+
+        relay_task = asyncio.ensure_future(relay())
+        await feed()
+        try:
+            await relay_task
+            error = upload_error or worker_error
+        except (EOFError, OSError):
+            worker.broken = True
+            error = RequestError(500, "The worker process failed")
+
+        if error is None:
+            self.processed += 1
+            writer.write(b'0\r\n\r\n')
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+            return
+
+        self.failed += 1
+        if started:
+            # The response is already under way: break it off so the client sees it is incomplete
+            writer.transport.abort()
+        elif isinstance(error, RequestError):
+            raise error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve ClearWave processing over HTTP on this machine.")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument('--unix', metavar='PATH', help="Listen on a Unix socket instead of TCP")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE,
+                        help=f"Requests allowed to wait for a worker (default: {DEFAULT_MAX_QUEUE})")
+    parser.add_argument('--queue-timeout', type=float, default=DEFAULT_QUEUE_TIMEOUT,
+                        help=f"Seconds a request may wait for a worker (default: {DEFAULT_QUEUE_TIMEOUT:g})")
+    parser.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE,
+                        help="Frames processed at a time in each worker")
+    parser.add_argument('--max-upload-mb', type=float, default=None, help="Largest accepted upload in MB")
+    parser.add_argument('--reference-dir', metavar='DIR',
+                        help="Directory of the noise references reduce_noise_with_reference may use "
+                             "(default: none, the operation is refused)")
+    args = parser.parse_args(argv)
+
+    max_upload_size = int(args.max_upload_mb * 1e6) if args.max_upload_mb else None
+    server = ClearWaveServer(args.workers, args.max_queue, args.queue_timeout, args.block_size, max_upload_size,
+                             args.reference_dir)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
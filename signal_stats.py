@@ -0,0 +1,157 @@
+import numpy as np
+
+# Frames reduced at a time when measuring a whole signal
+CHUNK_FRAMES = 65536
+
+
+class SignalStats:
+    """
+    Summary statistics of a (frames, channels) signal.
+
+    The range (minimum, maximum, peak) is always known. The sums behind rms and
+    dc_offset, and the count of samples outside the format range, are None when
+    the statistics were derived from those of the previous signal instead of
+    measured (see mapped), unless the derived range shows that nothing clips.
+
+    Attributes:
+        frames (int): Number of frames
+        channel_min (ndarray): Smallest sample of each channel
+        channel_max (ndarray): Largest sample of each channel
+        total (ndarray): Sum of the samples of each channel, or None
+        total_squares (ndarray): Sum of the squared samples of each channel, or None
+        clip_count (int): Samples outside the format range, or None
+    """
+
+    def __init__(self, frames, channel_min, channel_max, total=None, total_squares=None, clip_count=None):
+        self.frames = frames
+        self.channel_min = np.asarray(channel_min)
+        self.channel_max = np.asarray(channel_max)
+        self.total = total
+        self.total_squares = total_squares
+        self.clip_count = clip_count
+
+    @property
+    def complete(self):
+        """Whether every statistic is known"""
+        return self.total is not None and self.clip_count is not None
+
+    @property
+    def minimum(self):
+        """Smallest sample over all channels (0 for an empty signal)"""
+        return self.channel_min.min().item() if self.frames else 0
+
+    @property
+    def maximum(self):
+        """Largest sample over all channels (0 for an empty signal)"""
+        return self.channel_max.max().item() if self.frames else 0
+
+    @property
+    def peak(self):
+        """Largest magnitude over all channels"""
+        return max(abs(self.minimum), abs(self.maximum))
+
+    @property
+    def rms(self):
+        """Root mean square of each channel, or None"""
+        if self.total_squares is None:
+            return None
+        return np.sqrt(self.total_squares / self.frames) if self.frames else np.zeros(len(self.channel_min))
+
+    @property
+    def dc_offset(self):
+        """Mean of each channel, or None"""
+        if self.total is None:
+            return None
+        return self.total / self.frames if self.frames else np.zeros(len(self.channel_min))
+
+    def out_of_range(self, min_value, max_value):
+        """Whether any sample lies outside min_value..max_value"""
+        return self.minimum < min_value or self.maximum > max_value
+
+    def mapped(self, function, min_value, max_value):
+        """
+        Return the statistics of the signal after a monotonic point-wise function.
+
+        A monotonic function (increasing or decreasing) maps the extremes of each
+        channel to the extremes of the result, so the new range is function()
+        of the two old extremes, without looking at the samples. The sums are
+        unknown afterwards; the clip count is 0 if the new range fits in
+        min_value..max_value and unknown otherwise.
+        """
+        if not self.frames:
+            return SignalStats(0, self.channel_min, self.channel_max, self.total, self.total_squares, 0)
+        extremes = function(np.stack((self.channel_min, self.channel_max)))
+        stats = SignalStats(self.frames, extremes.min(axis=0), extremes.max(axis=0))
+        if not stats.out_of_range(min_value, max_value):
+            stats.clip_count = 0
+        return stats
+
+    def __repr__(self):
+        return (f"SignalStats(frames={self.frames}, min={self.minimum}, max={self.maximum}, "
+                f"rms={self.rms}, dc_offset={self.dc_offset}, clip_count={self.clip_count})")
+
+
+class StatsAccumulator:
+    """
+    Builds SignalStats from consecutive blocks of a signal.
+
+    A stage that produces its output block by block adds each block while it
+    is still in cache, so the statistics cost no extra pass over memory.
+    """
+
+    def __init__(self, channels, min_value, max_value):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.frames = 0
+        self.channel_min = np.zeros(channels)
+        self.channel_max = np.zeros(channels)
+        self.total = np.zeros(channels)
+        self.total_squares = np.zeros(channels)
+        self.clip_count = 0
+
+    def add(self, block):
+        """Add a (frames, channels) block"""
+        if not len(block):
+            return
+        low, high = block.min(axis=0), block.max(axis=0)
+        if self.frames:
+            np.minimum(self.channel_min, low, out=self.channel_min)
+            np.maximum(self.channel_max, high, out=self.channel_max)
+        else:
+            self.channel_min, self.channel_max = low, high
+        values = block.astype(np.float64)
+        self.total += values.sum(axis=0)
+        self.total_squares += np.einsum('ij,ij->j', values, values)
+        self.clip_count += int(np.count_nonzero(block > self.max_value) + np.count_nonzero(block < self.min_value))
+        self.frames += len(block)
+
+    def result(self):
+        """Return the SignalStats of the blocks added so far"""
+        return SignalStats(self.frames, self.channel_min, self.channel_max, self.total.copy(),
+                           self.total_squares.copy(), self.clip_count)
+
+
+def measure(samples, min_value, max_value):
+    """Return the SignalStats of a (frames, channels) signal, CHUNK_FRAMES at a time"""
+    accumulator = StatsAccumulator(samples.shape[1], min_value, max_value)
+    for start in range(0, len(samples), CHUNK_FRAMES):
+        accumulator.add(samples[start:start + CHUNK_FRAMES])
+    return accumulator.result()
+
+
+def combine(parts):
+    """
+    Return the SignalStats of consecutive segments of a signal from those of
+    the segments (a non-empty list). Sums and clip counts are None unless
+    known for every segment.
+    """
+    present = [part for part in parts if part.frames] or parts[:1]
+    stats = SignalStats(sum(part.frames for part in parts),
+                        np.min([part.channel_min for part in present], axis=0),
+                        np.max([part.channel_max for part in present], axis=0))
+    if all(part.total is not None for part in parts):
+        stats.total = np.sum([part.total for part in parts], axis=0)
+        stats.total_squares = np.sum([part.total_squares for part in parts], axis=0)
+    if all(part.clip_count is not None for part in parts):
+        stats.clip_count = sum(part.clip_count for part in parts)
+    return stats
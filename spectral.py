@@ -0,0 +1,164 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# STFT frame length in samples (about 46ms at 44.1kHz) and frames per hop
+DEFAULT_FRAME_SIZE = 2048
+OVERLAP = 4
+
+# Frames transformed together in one batched FFT call
+BATCH_FRAMES = 256
+
+
+def stft_window(frame_size):
+    """
+    Return the periodic square-root Hann window used for analysis and synthesis.
+
+    Applied twice (before the FFT and after the inverse FFT) it gives a Hann
+    window, whose copies at a hop of frame_size / OVERLAP add up to a constant.
+    """
+    return np.sqrt(np.hanning(frame_size + 1)[:-1])
+
+
+def stft(samples, frame_size=DEFAULT_FRAME_SIZE):
+    """
+    Return the spectra of all complete frames of samples, one frame per row.
+
+    Parameters:
+        samples (ndarray): 1-D signal
+        frame_size (int): FFT length, a multiple of OVERLAP
+
+    Returns:
+        ndarray: Complex array of shape (frames, frame_size // 2 + 1)
+    """
+    hop = frame_size // OVERLAP
+    if len(samples) < frame_size:
+        return np.zeros((0, frame_size // 2 + 1), dtype=np.complex128)
+    frames = sliding_window_view(samples, frame_size)[::hop]
+    return np.fft.rfft(frames * stft_window(frame_size), axis=1)
+
+
+def noise_spectrum(samples, frame_size=DEFAULT_FRAME_SIZE):
+    """
+    Estimate the average magnitude of each frequency bin of a noise recording.
+
+    The signal is analysed BATCH_FRAMES frames at a time, so long references do
+    not need a full spectrogram in memory. References shorter than one frame
+    are zero-padded. The spectra of the channels of a (frames, channels)
+    recording are averaged.
+
+    Returns:
+        ndarray: Mean magnitude per bin, frame_size // 2 + 1 values
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    if samples.ndim == 2:
+        return np.mean([noise_spectrum(samples[:, channel], frame_size)
+                        for channel in range(samples.shape[1])], axis=0)
+
+    if len(samples) < frame_size:
+        samples = np.concatenate((samples, np.zeros(frame_size - len(samples))))
+
+    hop = frame_size // OVERLAP
+    frame_count = (len(samples) - frame_size) // hop + 1
+    total = np.zeros(frame_size // 2 + 1)
+    for first in range(0, frame_count, BATCH_FRAMES):
+        last = min(first + BATCH_FRAMES, frame_count)
+        segment = samples[first * hop:(last - 1) * hop + frame_size]
+        total += np.abs(stft(segment, frame_size)).sum(axis=0)
+    return total / frame_count
+
+
+class SpectralSubtractor:
+    """
+    Streaming spectral subtraction with overlap-add resynthesis.
+
+    Each frame's magnitude is reduced by over_subtraction times the noise
+    magnitude of its bin, never going below spectral_floor times the original
+    magnitude (which avoids "musical noise" from bins set to zero); the phase is
+    kept. Samples are fed with process() in blocks of any number of frames,
+    as (frames, channels) arrays, and come back delayed by less than one STFT
+    frame; flush() returns the rest, so the total output has exactly as many
+    frames as the input. Every channel is cleaned independently, in the same
+    batched FFT calls.
+    """
+
+    def __init__(self, noise_magnitude, frame_size=DEFAULT_FRAME_SIZE,
+                 over_subtraction=1.0, spectral_floor=0.05, channels=1):
+        if frame_size % OVERLAP:
+            raise ValueError(f"Frame size must be a multiple of {OVERLAP}")
+        if len(noise_magnitude) != frame_size // 2 + 1:
+            raise ValueError("Noise spectrum does not match the frame size")
+
+        self.frame_size = frame_size
+        self.hop = frame_size // OVERLAP
+        self.noise_magnitude = over_subtraction * np.asarray(noise_magnitude, dtype=np.float64)
+        self.spectral_floor = spectral_floor
+        self.window = stft_window(frame_size)
+        # Windowed overlap-add of the squared window sums to this constant
+        self.scale = self.hop / (self.window ** 2).sum()
+
+        # The input starts with frame_size - hop zeros so that the first samples
+        # are covered by as many frames as every other sample
+        padding = frame_size - self.hop
+        self.channels = channels
+        self.input = np.zeros((padding, channels))
+        self.overlap = np.zeros((padding, channels))
+        self.skip = padding
+        self.received = 0
+        self.emitted = 0
+
+    def _process_frames(self, frame_count):
+        """Transform, clean and overlap-add frame_count frames from the input buffer"""
+        hop = self.hop
+        channels = self.channels
+        # Frames of shape (frame_count, channels, frame_size)
+        frames = sliding_window_view(self.input[:(frame_count - 1) * hop + self.frame_size],
+                                     self.frame_size, axis=0)[::hop]
+        spectra = np.fft.rfft(frames * self.window, axis=-1)
+
+        # Spectral subtraction as a real gain per bin
+        magnitude = np.abs(spectra)
+        gain = 1.0 - self.noise_magnitude / np.maximum(magnitude, 1e-12)
+        np.maximum(gain, self.spectral_floor, out=gain)
+        cleaned = np.fft.irfft(spectra * gain, n=self.frame_size, axis=-1) * (self.window * self.scale)
+
+        # Overlap-add: frame i covers hops i .. i + OVERLAP - 1
+        output = np.zeros((frame_count + OVERLAP - 1, hop, channels))
+        output[:OVERLAP - 1] = self.overlap.reshape(OVERLAP - 1, hop, channels)
+        cleaned = cleaned.transpose(0, 2, 1).reshape(frame_count, OVERLAP, hop, channels)
+        for part in range(OVERLAP):
+            output[part:part + frame_count] += cleaned[:, part]
+
+        # Hops before the next frame start are complete
+        self.overlap = output[frame_count:].reshape(-1, channels)
+        self.input = self.input[frame_count * hop:]
+        return output[:frame_count].reshape(-1, channels)
+
+    def _drain(self):
+        """Process every complete frame in the input buffer and return the finished samples"""
+        pieces = []
+        while len(self.input) >= self.frame_size:
+            available = (len(self.input) - self.frame_size) // self.hop + 1
+            pieces.append(self._process_frames(min(available, BATCH_FRAMES)))
+        finished = np.concatenate(pieces) if pieces else np.zeros((0, self.channels))
+
+        # Drop the output of the leading padding
+        if self.skip:
+            dropped = min(self.skip, len(finished))
+            finished = finished[dropped:]
+            self.skip -= dropped
+        return finished
+
+    def process(self, block):
+        """Feed a (frames, channels) block and return the frames finished so far"""
+        self.received += len(block)
+        self.input = np.concatenate((self.input, np.asarray(block, dtype=np.float64)))
+        finished = self._drain()
+        self.emitted += len(finished)
+        return finished
+
+    def flush(self):
+        """Return the remaining samples once the whole signal has been fed"""
+        self.input = np.concatenate((self.input, np.zeros((self.frame_size, self.channels))))
+        finished = self._drain()[:self.received - self.emitted]
+        self.emitted += len(finished)
+        return finished
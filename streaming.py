@@ -0,0 +1,612 @@
+import copy
+import io
+import math
+import time
+import tracemalloc
+import numpy as np
+from ClearWave import (POINTWISE_OPERATIONS, SAMPLE_FORMATS, SPEED_METHODS, ClearWaveAudio, read_wav_header,
+                       write_wav_header)
+from instrumentation import StageMetrics, peak_rss
+from noise_gate import LevelMeter, NoiseFloorEstimator, detector_block_length
+from spectral import DEFAULT_FRAME_SIZE
+from timestretch import TimeStretcher, stretched_length
+
+# Number of frames read, processed and written at a time
+DEFAULT_BLOCK_SIZE = 65536
+
+
+class _Stage:
+    """
+    One operation of a streaming chain.
+
+    Each stage works on its own copy of the audio format so that a stage sees
+    the format in effect at its position in the chain (change_speed rewrites
+    the sample rate and convert_format the sample format for the stages that
+    follow).
+    """
+    needs_analysis = False
+
+    def __init__(self, audio, name):
+        self.audio = audio
+        self.metrics = StageMetrics(name)
+
+    def start(self, input_length):
+        """Reset the per-run state and return the number of samples this stage will output"""
+        return input_length
+
+    def analyze(self, block):
+        """Accumulate statistics from a block during an analysis pass"""
+
+    def finish_analysis(self):
+        """Called once the analysis pass has seen every block"""
+
+    def process(self, block):
+        return block
+
+    def flush(self):
+        """Return the samples still held by the stage once the input is exhausted"""
+        return np.zeros((0, self.audio.header['channels']), dtype=self.audio._dtype)
+
+
+class _PointwiseStage(_Stage):
+    """Consecutive point-wise operations, applied together (by table lookup when possible)"""
+
+    def __init__(self, audio, operations):
+        super().__init__(audio, '+'.join(name for name, params in operations))
+        self.count_modified = audio._counting and any(name == 'anti_distortion' for name, params in operations)
+        self.chain = audio._pointwise_chain(operations, count_modified=self.count_modified)
+
+    def start(self, input_length):
+        if self.count_modified:
+            self.metrics.modified_count = 0
+        return input_length
+
+    def process(self, block):
+        block, modified_count = self.chain(block)
+        if self.count_modified:
+            self.metrics.modified_count += modified_count
+        return block
+
+
+class _NoiseGateStage(_Stage):
+    # The noise floor is estimated over the whole signal before gating
+    needs_analysis = True
+
+    def __init__(self, audio, threshold_db=-60, attack_ms=5.0, hold_ms=50.0, release_ms=100.0,
+                 floor_percentile=10.0, detector='rms'):
+        super().__init__(audio, 'reduce_noise')
+        self.threshold_db = threshold_db
+        self.floor_percentile = floor_percentile
+        self.settings = (attack_ms, hold_ms, release_ms, detector)
+        self.meter = LevelMeter(detector_block_length(audio.header['sample_rate']), audio.max_value, detector)
+        self.estimator = NoiseFloorEstimator()
+        self.noise_floor_db = threshold_db
+
+    def start(self, input_length):
+        self.gate = self.audio._noise_gate(self.noise_floor_db, *self.settings)
+        return input_length
+
+    def analyze(self, block):
+        self.estimator.add(self.meter.process(block))
+
+    def finish_analysis(self):
+        self.estimator.add(self.meter.flush())
+        self.noise_floor_db = self.audio._noise_floor(self.estimator, self.threshold_db, self.floor_percentile)
+        self.audio._log(f"Detected noise floor: {self.noise_floor_db:.1f} dBFS")
+
+    def process(self, block):
+        return self.audio._to_samples(self.gate.process(block))
+
+    def flush(self):
+        return self.audio._to_samples(self.gate.flush())
+
+
+class _SpectralStage(_Stage):
+    """Spectral subtraction; its output lags the input by less than one STFT frame"""
+
+    def __init__(self, audio, noise_file, over_subtraction=1.0, spectral_floor=0.05,
+                 frame_size=DEFAULT_FRAME_SIZE):
+        super().__init__(audio, 'reduce_noise_with_reference')
+        self.noise_magnitude = audio._noise_spectrum(noise_file, frame_size)
+        self.settings = (frame_size, over_subtraction, spectral_floor)
+
+    def start(self, input_length):
+        self.subtractor = self.audio._spectral_subtractor(self.noise_magnitude, *self.settings)
+        return input_length
+
+    def process(self, block):
+        return self.audio._to_samples(self.subtractor.process(block))
+
+    def flush(self):
+        return self.audio._to_samples(self.subtractor.flush())
+
+
+class _DynamicsStage(_Stage):
+    """Look-ahead limiter or compressor; its output lags the input by the look-ahead"""
+
+    def __init__(self, audio, name, *settings):
+        super().__init__(audio, name)
+        self.settings = settings
+
+    def start(self, input_length):
+        self.processor = self.audio._dynamics(*self.settings)
+        return input_length
+
+    def process(self, block):
+        return self.audio._to_samples(self.processor.process(block))
+
+    def flush(self):
+        return self.audio._to_samples(self.processor.flush())
+
+
+class _LimitStage(_DynamicsStage):
+    def __init__(self, audio, ceiling_db=-1.0, attack_ms=5.0, release_ms=50.0):
+        super().__init__(audio, 'limit', ceiling_db, math.inf, attack_ms, release_ms)
+
+
+class _CompressStage(_DynamicsStage):
+    def __init__(self, audio, threshold_db=-20.0, ratio=4.0, attack_ms=5.0, release_ms=100.0, makeup_db=0.0):
+        super().__init__(audio, 'compress', threshold_db, ratio, attack_ms, release_ms, makeup_db)
+
+
+class _NormalizeStage(_Stage):
+    # The gain follows from the loudness of the whole signal
+    needs_analysis = True
+
+    def __init__(self, audio, target_lufs=-23.0, max_true_peak_db=None):
+        super().__init__(audio, 'normalize_loudness')
+        self.settings = (target_lufs, max_true_peak_db)
+        self.meter = audio._loudness_meter()
+        self.gain_factor = 1.0
+
+    def analyze(self, block):
+        self.meter.process(block)
+
+    def finish_analysis(self):
+        self.gain_factor = self.audio._loudness_gain(self.meter.result(), *self.settings)
+
+    def process(self, block):
+        return self.audio._apply_gain(block, self.gain_factor, True)
+
+
+class _SpeedStage(_Stage):
+    def __init__(self, audio, speed_factor=1.0, method='wsola'):
+        super().__init__(audio, 'change_speed')
+        if speed_factor <= 0:
+            raise ValueError("Speed factor must be greater than 0")
+        if method not in SPEED_METHODS:
+            raise ValueError(f"Unknown speed change method '{method}', expected one of {', '.join(SPEED_METHODS)}")
+        self.speed_factor = speed_factor
+        self.method = method
+
+    def start(self, input_length):
+        if self.speed_factor == 1.0:
+            return input_length
+        if self.method == 'wsola':
+            self.stretcher = TimeStretcher(self.speed_factor, self.audio.header['sample_rate'],
+                                           channels=self.audio.header['channels'])
+            return stretched_length(input_length, self.speed_factor)
+        self.state = {'input_length': input_length, 'next_output': 0, 'offset': 0, 'carry': None}
+        return self.audio._speed_output_length(input_length, self.speed_factor)
+
+    def process(self, block):
+        if self.speed_factor == 1.0:
+            return block
+        if self.method == 'wsola':
+            return self.audio._to_samples(self.stretcher.process(block))
+        return self.audio._change_speed_block(block, self.speed_factor, self.state)
+
+    def flush(self):
+        if self.speed_factor != 1.0 and self.method == 'wsola':
+            return self.audio._to_samples(self.stretcher.flush())
+        return super().flush()
+
+
+class _FormatStage(_Stage):
+    """convert_format: rescales each block to the new sample format"""
+
+    def __init__(self, audio, sample_format):
+        super().__init__(audio, 'convert_format')
+        self.audio_format, self.bits_per_sample = SAMPLE_FORMATS[sample_format]
+
+    def process(self, block):
+        return self.audio._convert_samples(block, self.audio_format, self.bits_per_sample)
+
+    def flush(self):
+        return np.zeros((0, self.audio.header['channels']),
+                        dtype=ClearWaveAudio._working_dtype(self.bits_per_sample, self.audio_format))
+
+
+_STAGES = {
+    'reduce_noise': _NoiseGateStage,
+    'reduce_noise_with_reference': _SpectralStage,
+    'limit': _LimitStage,
+    'compress': _CompressStage,
+    'normalize_loudness': _NormalizeStage,
+    'change_speed': _SpeedStage,
+    'convert_format': _FormatStage,
+}
+
+
+class ClearWaveStream:
+    """
+    Apply a chain of ClearWaveAudio operations to a WAV file block by block.
+
+    The chain is recorded with the same method names and parameters as
+    ClearWaveAudio, then process() reads the input in fixed-size blocks, runs
+    every block through the chain and writes it straight to the output, so
+    peak memory does not depend on the length of the file. Operations that
+    need the whole signal (the reduce_noise floor estimate) get an extra
+    analysis pass over the input instead of holding it in memory;
+    normalize_loudness measures the loudness in such a pass and then only
+    applies the resulting gain.
+
+    quiet, observer and channel_workers work as for ClearWaveAudio. Stages run interleaved
+    block by block, so each stage's StageMetrics add up its time over all
+    blocks, and peak_memory is the peak of the whole run.
+
+    Example:
+        ClearWaveStream().amplify(1.5).reduce_noise(-50).process('in.wav', 'out.wav')
+    """
+
+    def __init__(self, block_size=DEFAULT_BLOCK_SIZE, quiet=False, observer=None, channel_workers=1):
+        if block_size <= 0:
+            raise ValueError("Block size must be greater than 0")
+        self.block_size = block_size
+        self.quiet = quiet
+        self.observer = observer
+        self.channel_workers = channel_workers
+        self.operations = []
+
+    def _log(self, *args):
+        """Print diagnostics unless in quiet mode"""
+        if not self.quiet:
+            print(*args)
+
+    def amplify(self, gain_factor=2.0, no_limit=True):
+        self.operations.append(('amplify', {'gain_factor': gain_factor, 'no_limit': no_limit}))
+        return self
+
+    def anti_distortion(self, threshold=0.8):
+        self.operations.append(('anti_distortion', {'threshold': threshold}))
+        return self
+
+    def reduce_noise(self, threshold_db=-60, attack_ms=5.0, hold_ms=50.0, release_ms=100.0,
+                     floor_percentile=10.0, detector='rms'):
+        self.operations.append(('reduce_noise', {
+            'threshold_db': threshold_db,
+            'attack_ms': attack_ms,
+            'hold_ms': hold_ms,
+            'release_ms': release_ms,
+            'floor_percentile': floor_percentile,
+            'detector': detector
+        }))
+        return self
+
+    def reduce_noise_with_reference(self, noise_file, over_subtraction=1.0, spectral_floor=0.05,
+                                    frame_size=DEFAULT_FRAME_SIZE):
+        self.operations.append(('reduce_noise_with_reference', {
+            'noise_file': noise_file,
+            'over_subtraction': over_subtraction,
+            'spectral_floor': spectral_floor,
+            'frame_size': frame_size
+        }))
+        return self
+
+    def limit(self, ceiling_db=-1.0, attack_ms=5.0, release_ms=50.0):
+        if ceiling_db > 0:
+            raise ValueError("Limiter ceiling must be at most 0 dBFS")
+        if attack_ms < 0 or release_ms <= 0:
+            raise ValueError("Attack must not be negative and release must be greater than 0")
+        self.operations.append(('limit', {'ceiling_db': ceiling_db, 'attack_ms': attack_ms, 'release_ms': release_ms}))
+        return self
+
+    def compress(self, threshold_db=-20.0, ratio=4.0, attack_ms=5.0, release_ms=100.0, makeup_db=0.0):
+        if ratio < 1:
+            raise ValueError("Ratio must be at least 1")
+        if attack_ms < 0 or release_ms <= 0:
+            raise ValueError("Attack must not be negative and release must be greater than 0")
+        self.operations.append(('compress', {
+            'threshold_db': threshold_db,
+            'ratio': ratio,
+            'attack_ms': attack_ms,
+            'release_ms': release_ms,
+            'makeup_db': makeup_db
+        }))
+        return self
+
+    def normalize_loudness(self, target_lufs=-23.0, max_true_peak_db=None):
+        if max_true_peak_db is not None and max_true_peak_db > 0:
+            raise ValueError("True peak ceiling must be at most 0 dBTP")
+        self.operations.append(('normalize_loudness', {'target_lufs': target_lufs,
+                                                       'max_true_peak_db': max_true_peak_db}))
+        return self
+
+    def change_speed(self, speed_factor=1.0, method='wsola'):
+        if speed_factor <= 0:
+            raise ValueError("Speed factor must be greater than 0")
+        self.operations.append(('change_speed', {'speed_factor': speed_factor, 'method': method}))
+        return self
+
+    def convert_format(self, sample_format):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"Unknown sample format '{sample_format}', expected one of {', '.join(SAMPLE_FORMATS)}")
+        self.operations.append(('convert_format', {'sample_format': sample_format}))
+        return self
+
+    def _build_stages(self, header):
+        """Create the stages of the recorded operations, grouping consecutive point-wise ones"""
+        audio = ClearWaveAudio(quiet=self.quiet, observer=self.observer, channel_workers=self.channel_workers)
+        audio._set_format(header)
+
+        stages = []
+        pointwise = []
+        for name, params in self.operations:
+            if name in POINTWISE_OPERATIONS:
+                pointwise.append((name, params))
+                continue
+            if pointwise:
+                stages.append(_PointwiseStage(copy.deepcopy(audio), pointwise))
+                pointwise = []
+            stages.append(_STAGES[name](copy.deepcopy(audio), **params))
+            if name == 'change_speed' and params.get('method', 'wsola') == 'resample':
+                audio.header['sample_rate'] = int(audio.header['sample_rate'] * params['speed_factor'])
+            elif name == 'convert_format':
+                audio._set_format(audio._format_header(*SAMPLE_FORMATS[params['sample_format']]))
+        if pointwise:
+            stages.append(_PointwiseStage(copy.deepcopy(audio), pointwise))
+        return audio, stages
+
+    def _read_blocks(self, file, header, metrics=None):
+        """
+        Yield the frames of the data chunk as (frames, channels) arrays,
+        block_size frames at a time, adding the reading and decoding time to
+        metrics if given.
+        """
+        bits_per_sample = header['bits_per_sample']
+        bytes_per_sample = bits_per_sample // 8
+        channels = header['channels']
+        audio_format = header['audio_format']
+        frame_size = bytes_per_sample * channels
+        dtype = ClearWaveAudio._working_dtype(bits_per_sample, audio_format)
+
+        file.seek(header['data_offset'])
+        remaining = (header['data_size'] // frame_size) * frame_size
+        while remaining > 0:
+            start = time.perf_counter()
+            chunk = file.read(min(remaining, self.block_size * frame_size))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            block = ClearWaveAudio._decode_samples(chunk, bytes_per_sample, channels, audio_format).astype(dtype)
+            if metrics is not None:
+                metrics.seconds += time.perf_counter() - start
+                metrics.output_samples += len(block)
+            yield block
+
+    @staticmethod
+    def _run_stage(stage, function, block, measure):
+        """Return function(block), adding its time and sample counts to stage.metrics if measure"""
+        if not measure:
+            return function(block)
+        start = time.perf_counter()
+        output = function(block)
+        metrics = stage.metrics
+        metrics.seconds += time.perf_counter() - start
+        metrics.input_samples += len(block)
+        metrics.output_samples += len(output)
+        return output
+
+    def _chain_blocks(self, source, header, stages, read_metrics=None):
+        """
+        Yield the input blocks processed by stages, then the samples the stages
+        still hold at the end of the input. With read_metrics given, the stages
+        are measured as well.
+        """
+        measure = read_metrics is not None
+        for block in self._read_blocks(source, header, read_metrics):
+            for stage in stages:
+                block = self._run_stage(stage, stage.process, block, measure)
+            yield block
+
+        # Each stage's tail still goes through the stages after it
+        tail = np.zeros((0, header['channels']),
+                        dtype=ClearWaveAudio._working_dtype(header['bits_per_sample'], header['audio_format']))
+        for stage in stages:
+            tail = self._run_stage(stage, lambda tail: np.concatenate((stage.process(tail), stage.flush())),
+                                   tail, measure)
+        if len(tail):
+            yield tail
+
+    def needs_seekable_input(self):
+        """Return True if a stage needs an analysis pass, so the input must be read twice"""
+        return any(name in _STAGES and _STAGES[name].needs_analysis for name, params in self.operations)
+
+    def _process_blocks(self, source, exact_length=False):
+        """
+        Yield (data, samples) pieces of the output WAV file: first the header,
+        with the sizes of the output length computed by the stages, then the
+        encoded blocks as they are finished.
+
+        On a seekable source only the frames actually present are read, as in
+        map_wav_data, so a truncated file or a placeholder data size gives the
+        right length. With exact_length, the output is also truncated or padded
+        with silence to the length in the header, for sources whose real length
+        is only known once they are read.
+        """
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+
+        header = read_wav_header(source)
+
+        bits_per_sample = header['bits_per_sample']
+        frame_size = (bits_per_sample // 8) * header['channels']
+        if source.seekable():
+            source.seek(0, io.SEEK_END)
+            available = max(source.tell() - header['data_offset'], 0)
+            source.seek(header['data_offset'])
+            header['data_size'] = min(header['data_size'], available)
+        input_length = header['data_size'] // frame_size
+        self._log(f"Streaming {input_length} samples in blocks of {self.block_size} through {len(self.operations)} operation(s)")
+
+        output_format, stages = self._build_stages(header)
+        if any(stage.needs_analysis for stage in stages) and not source.seekable():
+            raise ValueError("The pipeline needs an analysis pass, which requires a seekable input")
+
+        # Analysis passes for stages that need statistics of their whole input
+        for index, stage in enumerate(stages):
+            if not stage.needs_analysis:
+                continue
+            length = input_length
+            for previous in stages[:index]:
+                length = previous.start(length)
+            analysis_start = time.perf_counter()
+            for block in self._chain_blocks(source, header, stages[:index]):
+                stage.analyze(block)
+            stage.finish_analysis()
+            # The analysis pass is part of the cost of the stage
+            stage.metrics.seconds += time.perf_counter() - analysis_start
+
+        # Reset every stage for the processing pass
+        length = input_length
+        for stage in stages:
+            length = stage.start(length)
+
+        max_value = output_format.max_value
+        min_value = output_format.min_value
+        output_bits = output_format.bits_per_sample
+        output_audio_format = output_format.header['audio_format']
+        bytes_per_sample = output_bits // 8
+        counting = output_format._counting
+        read_metrics = StageMetrics('read_wav_file')
+        write_metrics = StageMetrics('write_wav_file')
+        clipped_count = 0
+
+        header_bytes = io.BytesIO()
+        write_wav_header(header_bytes, header['channels'], output_format.header['sample_rate'], output_bits,
+                         length * header['channels'] * bytes_per_sample, output_audio_format,
+                         output_format.header['channel_mask'])
+        yield header_bytes.getvalue(), 0
+
+        blocks = self._chain_blocks(source, header, stages, read_metrics)
+        if exact_length:
+            blocks = self._fit_blocks(blocks, length, header['channels'], output_format._dtype)
+        for block in blocks:
+            if not len(block):
+                continue
+            write_start = time.perf_counter()
+
+            # Clip the samples to fit in the WAV format
+            if counting:
+                clipped_count += int(np.count_nonzero(block > max_value) +
+                                     np.count_nonzero(block < min_value))
+            block = np.clip(block, min_value, max_value)
+
+            data = ClearWaveAudio._encode_samples(block, bytes_per_sample, output_audio_format)
+            write_metrics.input_samples += len(block)
+            write_metrics.seconds += time.perf_counter() - write_start
+            yield data, len(block)
+
+        written = write_metrics.input_samples
+        if self.observer is not None:
+            read_metrics.input_samples = read_metrics.output_samples
+            write_metrics.output_samples = written
+            write_metrics.clipped_count = clipped_count
+            peak_memory = tracemalloc.get_traced_memory()[1] if tracing else peak_rss()
+            for metrics in [read_metrics] + [stage.metrics for stage in stages] + [write_metrics]:
+                metrics.peak_memory = peak_memory
+                self.observer.stage_finished(metrics)
+
+        if clipped_count:
+            clip_percentage = (clipped_count / (written * header['channels'])) * 100
+            self._log(f"Clipped {clipped_count} samples ({clip_percentage:.2f}% of total)")
+
+    def _fit_blocks(self, blocks, length, channels, dtype):
+        """Yield blocks truncated or padded with silence to length frames in total"""
+        remaining = length
+        for block in blocks:
+            if remaining <= 0:
+                # Read on, so the stages still run to the end of the input
+                continue
+            block = block[:remaining]
+            remaining -= len(block)
+            yield block
+        if remaining > 0:
+            self._log(f"Input ended early, padding the output with {remaining} samples of silence")
+        while remaining > 0:
+            block = np.zeros((min(remaining, self.block_size), channels), dtype=dtype)
+            remaining -= len(block)
+            yield block
+
+    @staticmethod
+    def _patched_header(header_bytes, written):
+        """
+        Return the bytes of an output header rewritten for written frames, as
+        long as the original: a header that no longer needs RF64 keeps the room
+        of its ds64 chunk as a JUNK chunk before the data chunk.
+        """
+        header = read_wav_header(io.BytesIO(header_bytes))
+        patched = io.BytesIO()
+        write_wav_header(patched, header['channels'], header['sample_rate'], header['bits_per_sample'],
+                         written * header['block_align'], header['audio_format'], header['channel_mask'])
+        patched = patched.getvalue()
+        padding = len(header_bytes) - len(patched)
+        if padding >= 8:
+            patched = (patched[:-8] + b'JUNK' + (padding - 8).to_bytes(4, byteorder='little') +
+                       bytes(padding - 8) + patched[-8:])
+        elif padding:
+            raise ValueError("The output grew past the size its header can describe")
+        return patched
+
+    def iter_process(self, source):
+        """
+        Stream a WAV file object through the recorded operations and yield the
+        output WAV file piece by piece.
+
+        The first piece is the header, which already holds the final sizes, and
+        every later piece is a block of samples as soon as it is finished, so
+        the output can be sent on before the input has been read completely.
+        Since the header cannot be rewritten, an input shorter than its header
+        says is padded with silence, and the output never runs past the header.
+
+        Parameters:
+            source: Binary file object positioned at the start of a WAV file. It
+                    only needs read(), tell() and forward seek(), unless a stage
+                    needs an analysis pass (see needs_seekable_input)
+
+        Yields:
+            bytes: The header, then the sample data
+        """
+        for data, samples in self._process_blocks(source, exact_length=True):
+            yield data
+
+    def process(self, input_file, output_file):
+        """
+        Stream input_file through the recorded operations into output_file.
+
+        Parameters:
+            input_file (str): WAV file to read
+            output_file (str): WAV file to write
+
+        Returns:
+            int: The number of samples written
+        """
+        written = 0
+        with open(input_file, 'rb') as source, open(output_file, 'wb') as target:
+            pieces = self._process_blocks(source)
+            header_bytes, _ = next(pieces)
+            target.write(header_bytes)
+            for data, samples in pieces:
+                target.write(data)
+                written += samples
+
+            # The header holds the length predicted by the stages; patch it if
+            # a different number of frames came out
+            patched = self._patched_header(header_bytes, written)
+            if patched != header_bytes:
+                target.seek(0)
+                target.write(patched)
+
+        self._log(f"Written enhanced audio to {output_file}")
+        return written
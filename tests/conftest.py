@@ -0,0 +1,60 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ClearWave import ClearWaveAudio
+from generate_test_wav import generate_test_wav
+
+# (bits per sample, channels) of the generated inputs; 32 is IEEE float
+FORMATS = [(bits_per_sample, channels) for bits_per_sample in (8, 16, 24, 32) for channels in (1, 2, 6)]
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep the noise profile and result caches of every test in its own directory"""
+    directory = tmp_path / 'cache'
+    monkeypatch.setenv('CLEARWAVE_CACHE_DIR', str(directory))
+    return directory
+
+
+@pytest.fixture
+def make_wav(tmp_path):
+    """Return a function that generates a WAV file in tmp_path and returns its path"""
+    def make(name='input.wav', duration=1.0, bits_per_sample=16, channels=1, signal='speech', **kwargs):
+        path = str(tmp_path / name)
+        generate_test_wav(path, duration, bits_per_sample=bits_per_sample, channels=channels, signal=signal,
+                          verbose=False, **kwargs)
+        return path
+    return make
+
+
+@pytest.fixture
+def noise_reference(make_wav):
+    """A short 16-bit mono noise recording for reduce_noise_with_reference"""
+    return make_wav('noise.wav', duration=0.5, signal='noise', amplitude=0.05)
+
+
+def read_samples(filename):
+    """Return (header, samples) of a WAV file as decoded by ClearWaveAudio"""
+    audio = ClearWaveAudio(quiet=True)
+    audio.read_wav_file(filename)
+    return audio.header, audio.samples
+
+
+def assert_same_audio(first, second, steps=0):
+    """Assert two WAV files have the same format and samples within steps quantization steps"""
+    first_header, first_samples = read_samples(first)
+    second_header, second_samples = read_samples(second)
+    assert first_header == second_header
+    assert first_samples.shape == second_samples.shape
+    if steps == 0:
+        np.testing.assert_array_equal(first_samples, second_samples)
+    else:
+        # One step is one LSB of PCM, or the float spacing at full scale
+        bits_per_sample = first_header['bits_per_sample']
+        step = np.finfo(f'f{bits_per_sample // 8}').eps if first_samples.dtype.kind == 'f' else 1
+        np.testing.assert_allclose(first_samples, second_samples, rtol=0, atol=steps * step)
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from ClearWave import WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, ClearWaveAudio, map_wav_data, map_wav_file
+from conftest import FORMATS, read_samples
+
+
+def _data_chunk(filename):
+    _, data = map_wav_data(filename)
+    return bytes(data)
+
+
+@pytest.mark.parametrize('bits_per_sample, channels', FORMATS)
+def test_read_write_round_trip(make_wav, tmp_path, bits_per_sample, channels):
+    input_file = make_wav(bits_per_sample=bits_per_sample, channels=channels, signal='noise', amplitude=1.0)
+    audio = ClearWaveAudio(quiet=True)
+    audio.read_wav_file(input_file)
+    output_file = str(tmp_path / 'output.wav')
+    audio.write_wav_file(output_file)
+
+    assert _data_chunk(output_file) == _data_chunk(input_file)
+    header, samples = read_samples(output_file)
+    assert samples.shape == (44100, channels)
+    np.testing.assert_array_equal(samples, audio.samples)
+    for key in ('audio_format', 'channels', 'sample_rate', 'bits_per_sample', 'byte_rate', 'block_align'):
+        assert header[key] == audio.header[key]
+
+
+@pytest.mark.parametrize('bits_per_sample, audio_format', [
+    (8, WAVE_FORMAT_PCM), (16, WAVE_FORMAT_PCM), (24, WAVE_FORMAT_PCM), (32, WAVE_FORMAT_PCM),
+    (32, WAVE_FORMAT_IEEE_FLOAT), (64, WAVE_FORMAT_IEEE_FLOAT),
+])
+@pytest.mark.parametrize('channels', [1, 2, 6])
+def test_decode_encode_round_trip(bits_per_sample, audio_format, channels):
+    bytes_per_sample = bits_per_sample // 8
+    rng = np.random.default_rng(bits_per_sample)
+    if audio_format == WAVE_FORMAT_IEEE_FLOAT:
+        data = rng.uniform(-1, 1, 999 * channels).astype(f'<f{bytes_per_sample}').tobytes()
+    else:
+        data = rng.integers(0, 256, 999 * channels * bytes_per_sample, dtype=np.uint8).tobytes()
+
+    samples = ClearWaveAudio._decode_samples(data, bytes_per_sample, channels, audio_format)
+    assert samples.shape == (999, channels)
+    assert ClearWaveAudio._encode_samples(samples, bytes_per_sample, audio_format) == data
+
+
+@pytest.mark.parametrize('bits_per_sample, data, expected', [
+    (8, b'\x00\x80\xff', [-128, 0, 127]),
+    (16, b'\x00\x80\xff\x7f\xff\xff', [-32768, 32767, -1]),
+    (24, b'\x00\x00\x80\xff\xff\x7f\xff\xff\xff', [-8388608, 8388607, -1]),
+])
+def test_decode_pcm_extremes(bits_per_sample, data, expected):
+    samples = ClearWaveAudio._decode_samples(data, bits_per_sample // 8, 1)
+    assert samples[:, 0].tolist() == expected
+
+
+@pytest.mark.parametrize('bits_per_sample', [8, 16, 32])
+def test_map_wav_file_matches_read(make_wav, bits_per_sample):
+    input_file = make_wav(bits_per_sample=bits_per_sample, channels=2)
+    _, frames = map_wav_file(input_file)
+    _, samples = read_samples(input_file)
+    if bits_per_sample == 8:
+        frames = frames.astype(np.int32) - 128
+    np.testing.assert_array_equal(frames, samples)
+
+
+@pytest.mark.parametrize('source, target', [
+    ('pcm16', 'float32'), ('pcm16', 'pcm24'), ('pcm8', 'pcm16'), ('pcm24', 'float64'), ('float32', 'float64'),
+])
+def test_widening_conversion_round_trip(make_wav, tmp_path, source, target):
+    input_file = make_wav(bits_per_sample=24, channels=2, signal='noise', amplitude=1.0)
+    audio = ClearWaveAudio(quiet=True)
+    audio.read_wav_file(input_file)
+    audio.convert_format(source)
+    original = audio.samples.copy()
+    original_header = dict(audio.header)
+
+    audio.convert_format(target).convert_format(source)
+    assert audio.header == original_header
+    np.testing.assert_array_equal(audio.samples, original)
+
+    # The same holds through files written in the wider format
+    audio.write_wav_file(str(tmp_path / 'wide.wav'), sample_format=target)
+    wide = ClearWaveAudio(quiet=True)
+    wide.read_wav_file(str(tmp_path / 'wide.wav'))
+    np.testing.assert_array_equal(wide.convert_format(source).samples, original)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from ClearWave import ClearWaveAudio
+from conftest import FORMATS
+
+CHAINS = {
+    'pointwise': lambda audio, noise: audio.amplify(1.5).anti_distortion(0.5).amplify(0.8),
+    'pointwise_around_gate': lambda audio, noise: audio.amplify(1.2).reduce_noise(-40).anti_distortion(0.6),
+    'reduce_noise_with_reference': lambda audio, noise: audio.amplify(0.9).reduce_noise_with_reference(noise),
+    'dynamics': lambda audio, noise: audio.compress(-30.0, 4.0).limit(-3.0).amplify(1.1),
+    'normalize_loudness': lambda audio, noise: audio.amplify(0.5).normalize_loudness(-20.0, -1.0),
+    'change_speed': lambda audio, noise: audio.amplify(1.3).change_speed(1.25).anti_distortion(0.7),
+    'convert_format': lambda audio, noise: audio.amplify(1.1).convert_format('float32').amplify(1.5),
+}
+
+
+def _run(chain, input_file, noise, lazy):
+    audio = ClearWaveAudio(lazy=lazy, quiet=True)
+    audio.read_wav_file(input_file)
+    return chain(audio, noise)
+
+
+@pytest.mark.parametrize('bits_per_sample, channels', FORMATS)
+@pytest.mark.parametrize('name', sorted(CHAINS))
+def test_lazy_write_matches_eager(make_wav, noise_reference, tmp_path, name, bits_per_sample, channels):
+    input_file = make_wav(bits_per_sample=bits_per_sample, channels=channels)
+    _run(CHAINS[name], input_file, noise_reference, lazy=False).write_wav_file(str(tmp_path / 'eager.wav'))
+    _run(CHAINS[name], input_file, noise_reference, lazy=True).write_wav_file(str(tmp_path / 'lazy.wav'))
+
+    with open(tmp_path / 'lazy.wav', 'rb') as lazy, open(tmp_path / 'eager.wav', 'rb') as eager:
+        assert lazy.read() == eager.read()
+
+
+@pytest.mark.parametrize('name', sorted(CHAINS))
+def test_lazy_execute_matches_eager(make_wav, noise_reference, name):
+    input_file = make_wav(bits_per_sample=24, channels=2)
+    eager = _run(CHAINS[name], input_file, noise_reference, lazy=False)
+    lazy = _run(CHAINS[name], input_file, noise_reference, lazy=True).execute()
+
+    assert lazy.plan == []
+    assert lazy.header == eager.header
+    np.testing.assert_array_equal(lazy.samples, eager.samples)
+
+
+def test_writing_keeps_trailing_pointwise_operations_planned(make_wav, tmp_path):
+    input_file = make_wav(channels=2)
+    audio = ClearWaveAudio(lazy=True, quiet=True)
+    audio.read_wav_file(input_file)
+    audio.reduce_noise(-40).amplify(1.5).anti_distortion(0.5)
+
+    audio.write_wav_file(str(tmp_path / 'first.wav'))
+    assert [name for name, params in audio.plan] == ['amplify', 'anti_distortion']
+    audio.write_wav_file(str(tmp_path / 'second.wav'))
+    with open(tmp_path / 'first.wav', 'rb') as first, open(tmp_path / 'second.wav', 'rb') as second:
+        assert first.read() == second.read()
+
+    eager = ClearWaveAudio(quiet=True)
+    eager.read_wav_file(input_file)
+    eager.reduce_noise(-40).amplify(1.5).anti_distortion(0.5)
+    np.testing.assert_array_equal(audio.execute().samples, eager.samples)
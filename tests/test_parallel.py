@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pytest
+
+import parallel
+from ClearWave import ClearWaveAudio
+from parallel import SegmentExecutor
+
+WORKERS = 3
+
+CHAINS = {
+    'pointwise': lambda audio, noise: audio.amplify(1.5).anti_distortion(0.5),
+    'reduce_noise': lambda audio, noise: audio.amplify(1.2).reduce_noise(-40).amplify(0.9),
+    'mixed': lambda audio, noise: audio.reduce_noise(-40).change_speed(1.25).anti_distortion(0.6),
+}
+
+
+@pytest.fixture(scope='module')
+def executor():
+    """An executor with WORKERS workers, whatever the number of CPUs here"""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(os, 'cpu_count', lambda: WORKERS)
+        executor = SegmentExecutor(WORKERS)
+    with executor:
+        yield executor
+
+
+@pytest.fixture(autouse=True)
+def short_segments(monkeypatch):
+    """Split the one-second test files into segments"""
+    monkeypatch.setattr(parallel, 'MIN_SEGMENT_FRAMES', 4096)
+
+
+def _run(chain, input_file, noise, executor=None):
+    audio = ClearWaveAudio(lazy=executor is not None, quiet=True)
+    audio.read_wav_file(input_file)
+    chain(audio, noise)
+    if executor is not None:
+        executor.execute(audio)
+    return audio
+
+
+@pytest.mark.parametrize('bits_per_sample, channels', [(16, 2), (24, 6), (32, 1)])
+@pytest.mark.parametrize('name', sorted(CHAINS))
+def test_segments_match_eager(make_wav, noise_reference, executor, name, bits_per_sample, channels):
+    input_file = make_wav(bits_per_sample=bits_per_sample, channels=channels)
+    eager = _run(CHAINS[name], input_file, noise_reference)
+    segmented = _run(CHAINS[name], input_file, noise_reference, executor)
+
+    assert executor.pool is not None
+    assert segmented.plan == []
+    assert segmented.header == eager.header
+    np.testing.assert_array_equal(segmented.samples, eager.samples)
+
+
+@pytest.mark.parametrize('bits_per_sample, channels', [(16, 2), (24, 6)])
+def test_spectral_segments_match_eager_within_one_step(make_wav, noise_reference, executor,
+                                                        bits_per_sample, channels):
+    input_file = make_wav(bits_per_sample=bits_per_sample, channels=channels)
+
+    def chain(audio, noise):
+        return audio.reduce_noise_with_reference(noise)
+    eager = _run(chain, input_file, noise_reference)
+    segmented = _run(chain, input_file, noise_reference, executor)
+    np.testing.assert_allclose(segmented.samples, eager.samples, rtol=0, atol=1)
+
+
+def test_failed_stage_leaves_usable_samples(make_wav, tmp_path, executor):
+    input_file = make_wav(channels=2)
+    audio = ClearWaveAudio(lazy=True, quiet=True)
+    audio.read_wav_file(input_file)
+    original = audio.samples.copy()
+    audio.amplify(1.5).reduce_noise_with_reference(str(tmp_path / 'missing.wav'))
+
+    with pytest.raises(FileNotFoundError):
+        executor.execute(audio)
+    # The samples were copied out of the freed shared memory
+    assert audio.samples.flags.owndata
+    np.testing.assert_array_equal(audio.samples, np.trunc(original * 1.5))
+
+
+def test_short_signal_runs_in_process(make_wav, monkeypatch):
+    monkeypatch.setattr(parallel, 'MIN_SEGMENT_FRAMES', 1 << 20)
+    audio = ClearWaveAudio(lazy=True, quiet=True)
+    audio.read_wav_file(make_wav(channels=2))
+    with SegmentExecutor(WORKERS) as executor:
+        executor.execute(audio.amplify(1.5))
+        assert executor.pool is None
+    assert audio.plan == []
+
+
+def test_workers_are_capped_at_the_cpu_count():
+    assert SegmentExecutor(1024).workers == (os.cpu_count() or 1)
+    with pytest.raises(ValueError):
+        SegmentExecutor(-1)
@@ -0,0 +1,80 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from ClearWave import ClearWaveAudio, map_wav_data
+from regions import ClearWaveRegion
+
+# Operations whose output in the region is the one of whole-file processing,
+# given the context the region decodes around it
+CHAINS = {
+    'pointwise': lambda target, noise: target.amplify(1.5).anti_distortion(0.5),
+    'limit': lambda target, noise: target.limit(-6.0),
+    'compress': lambda target, noise: target.compress(-30.0, 4.0),
+    'reduce_noise_with_reference': lambda target, noise: target.reduce_noise_with_reference(noise),
+}
+
+START, END = 20000, 50000
+
+
+def _file_bytes(filename):
+    with open(filename, 'rb') as file:
+        return file.read()
+
+
+def _data_chunk(filename):
+    _, data = map_wav_data(filename)
+    return np.array(data)
+
+
+def _patched_copy(input_file, tmp_path, region):
+    patched = str(tmp_path / 'patched.wav')
+    shutil.copy(input_file, patched)
+    region.apply(patched)
+    return patched
+
+
+@pytest.mark.parametrize('bits_per_sample, channels', [(8, 2), (16, 1), (24, 2), (32, 6)])
+@pytest.mark.parametrize('name', sorted(CHAINS))
+def test_region_matches_whole_file(make_wav, noise_reference, tmp_path, name, bits_per_sample, channels):
+    input_file = make_wav(duration=2.0, bits_per_sample=bits_per_sample, channels=channels)
+    chain = CHAINS[name]
+    patched = _patched_copy(input_file, tmp_path, chain(ClearWaveRegion(START, END, 'samples', quiet=True),
+                                                        noise_reference))
+
+    audio = ClearWaveAudio(quiet=True)
+    audio.read_wav_file(input_file)
+    chain(audio, noise_reference)
+    audio.write_wav_file(str(tmp_path / 'whole.wav'))
+
+    frame_size = bits_per_sample // 8 * channels
+    region = slice(START * frame_size, END * frame_size)
+    np.testing.assert_array_equal(_data_chunk(patched)[region], _data_chunk(str(tmp_path / 'whole.wav'))[region])
+
+
+@pytest.mark.parametrize('chain', [
+    lambda region: region.amplify(1.5),
+    lambda region: region.reduce_noise(-40),
+    lambda region: region.compress(-30.0, 4.0).limit(-6.0),
+])
+def test_region_only_rewrites_its_bytes(make_wav, tmp_path, chain):
+    # The region spans the end of a phrase and the pause after it, so the gate closes in it
+    input_file = make_wav(duration=3.5, channels=2)
+    patched = _patched_copy(input_file, tmp_path, chain(ClearWaveRegion(2.0, 3.0, quiet=True)))
+
+    original, result = _file_bytes(input_file), _file_bytes(patched)
+    assert len(result) == len(original)
+    start, end = 44 + 88200 * 4, 44 + 132300 * 4
+    assert result[:start] == original[:start]
+    assert result[end:] == original[end:]
+    assert result[start:end] != original[start:end]
+
+
+def test_region_past_the_end_leaves_the_file_alone(make_wav, tmp_path):
+    input_file = make_wav(duration=0.5)
+    region = ClearWaveRegion(10.0, 20.0, quiet=True).amplify(1.5)
+    patched = str(tmp_path / 'patched.wav')
+    shutil.copy(input_file, patched)
+    assert region.apply(patched) == 0
+    assert _file_bytes(patched) == _file_bytes(input_file)
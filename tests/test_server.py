@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from pipeline import parse_pipeline
+from server import ClearWaveServer, RequestError
+
+
+@pytest.fixture
+def reference_dir(tmp_path, noise_reference):
+    directory = tmp_path / 'references'
+    directory.mkdir()
+    os.replace(noise_reference, directory / 'noise.wav')
+    return str(directory)
+
+
+def _reference_pipeline(noise_file):
+    return [('reduce_noise_with_reference', {'noise_file': noise_file})]
+
+
+def test_noise_file_is_resolved_in_reference_dir(reference_dir):
+    server = ClearWaveServer(workers=1, reference_dir=reference_dir)
+    (name, params), = server._resolve_references(_reference_pipeline('noise.wav'))
+    assert params['noise_file'] == os.path.join(os.path.realpath(reference_dir), 'noise.wav')
+
+
+@pytest.mark.parametrize('noise_file', ['../noise.wav', '/etc/passwd', 'missing.wav', '.'])
+def test_noise_file_outside_reference_dir_is_refused(reference_dir, noise_file):
+    server = ClearWaveServer(workers=1, reference_dir=reference_dir)
+    with pytest.raises(RequestError) as error:
+        server._resolve_references(_reference_pipeline(noise_file))
+    assert error.value.status == 400
+
+
+def test_noise_file_without_reference_dir_is_refused():
+    with pytest.raises(RequestError) as error:
+        ClearWaveServer(workers=1)._resolve_references(_reference_pipeline('noise.wav'))
+    assert error.value.status == 400
+
+
+@pytest.mark.parametrize('spec', [
+    '[["amplify", {"gain_factor": "2"}]]',
+    '[["amplify", {"gain_factor": true}]]',
+    '[["amplify", {"no_limit": 1}]]',
+    '[["reduce_noise_with_reference", {"noise_file": 3}]]',
+    '[["reduce_noise_with_reference", {"noise_file": "noise.wav", "frame_size": 20.5}]]',
+])
+def test_parameters_of_the_wrong_type_are_refused(spec):
+    with pytest.raises(ValueError):
+        parse_pipeline(spec)
+
+
+def test_parameters_are_filled_in():
+    operations = parse_pipeline('[["amplify", {"gain_factor": 2}], ["normalize_loudness", {"max_true_peak_db": null}]]')
+    assert operations == [('amplify', {'gain_factor': 2, 'no_limit': True}),
+                          ('normalize_loudness', {'target_lufs': -23.0, 'max_true_peak_db': None})]
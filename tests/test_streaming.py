@@ -0,0 +1,140 @@
+import io
+
+import numpy as np
+import pytest
+
+from ClearWave import ClearWaveAudio, read_wav_header
+from conftest import FORMATS, assert_same_audio, read_samples
+from streaming import ClearWaveStream
+
+# Chains whose streamed output is bit-identical to the in-memory path
+EXACT_CHAINS = {
+    'pointwise': lambda audio, noise: audio.amplify(1.5).anti_distortion(0.5),
+    'reduce_noise': lambda audio, noise: audio.reduce_noise(-40),
+    'reduce_noise_with_reference': lambda audio, noise: audio.reduce_noise_with_reference(noise),
+    'limit': lambda audio, noise: audio.limit(-6.0),
+    'change_speed': lambda audio, noise: audio.change_speed(1.25),
+    'change_speed_resample': lambda audio, noise: audio.change_speed(0.8, method='resample'),
+    'convert_format': lambda audio, noise: audio.convert_format('float32').amplify(0.5).convert_format('pcm24'),
+}
+
+# Chains whose gain comes from sums over blocks, which can round differently
+# from the whole-file sums by one step
+ROUNDED_CHAINS = {
+    'compress': lambda audio, noise: audio.compress(-30.0, 4.0),
+    'normalize_loudness': lambda audio, noise: audio.normalize_loudness(-20.0, -1.0),
+}
+
+
+def _in_memory(chain, input_file, output_file, noise):
+    audio = ClearWaveAudio(quiet=True)
+    audio.read_wav_file(input_file)
+    chain(audio, noise)
+    audio.write_wav_file(output_file)
+
+
+@pytest.mark.parametrize('bits_per_sample, channels', FORMATS)
+@pytest.mark.parametrize('name', sorted(EXACT_CHAINS))
+def test_stream_matches_in_memory(make_wav, noise_reference, tmp_path, name, bits_per_sample, channels):
+    input_file = make_wav(bits_per_sample=bits_per_sample, channels=channels)
+    chain = EXACT_CHAINS[name]
+    _in_memory(chain, input_file, str(tmp_path / 'memory.wav'), noise_reference)
+
+    for block_size in (1000, 4096):
+        streamed = str(tmp_path / f'stream_{block_size}.wav')
+        chain(ClearWaveStream(block_size, quiet=True), noise_reference).process(input_file, streamed)
+        with open(streamed, 'rb') as file, open(tmp_path / 'memory.wav', 'rb') as expected:
+            assert file.read() == expected.read()
+
+
+@pytest.mark.parametrize('bits_per_sample, channels', [(16, 1), (24, 2), (32, 6)])
+@pytest.mark.parametrize('name', sorted(ROUNDED_CHAINS))
+def test_stream_matches_in_memory_within_one_step(make_wav, noise_reference, tmp_path, name,
+                                                  bits_per_sample, channels):
+    input_file = make_wav(bits_per_sample=bits_per_sample, channels=channels)
+    chain = ROUNDED_CHAINS[name]
+    _in_memory(chain, input_file, str(tmp_path / 'memory.wav'), noise_reference)
+
+    for block_size in (1000, 4096):
+        streamed = str(tmp_path / f'stream_{block_size}.wav')
+        chain(ClearWaveStream(block_size, quiet=True), noise_reference).process(input_file, streamed)
+        assert_same_audio(streamed, str(tmp_path / 'memory.wav'), steps=1)
+
+
+def test_stream_returns_samples_written(make_wav, tmp_path):
+    input_file = make_wav(duration=0.5, channels=2)
+    written = ClearWaveStream(1000, quiet=True).change_speed(2.0).process(input_file, str(tmp_path / 'out.wav'))
+    assert written == 11025
+
+
+class _Upload(io.BytesIO):
+    """An input that cannot seek back, like an HTTP upload"""
+
+    def seekable(self):
+        return False
+
+
+def _damaged_copies(input_file, tmp_path):
+    """Return a copy of a 16-bit PCM file cut in the middle of a frame, and one with a placeholder data size"""
+    with open(input_file, 'rb') as file:
+        data = file.read()
+    truncated = str(tmp_path / 'truncated.wav')
+    with open(truncated, 'wb') as file:
+        file.write(data[:44 + (len(data) - 44) // 2 + 1])
+    placeholder = str(tmp_path / 'placeholder.wav')
+    with open(placeholder, 'wb') as file:
+        file.write(data[:40] + b'\xff\xff\xff\xff' + data[44:])
+    return truncated, placeholder
+
+
+def test_stream_of_damaged_input_writes_its_frames(make_wav, tmp_path):
+    input_file = make_wav(channels=2)
+    for damaged in _damaged_copies(input_file, tmp_path):
+        streamed = str(tmp_path / 'stream.wav')
+        written = ClearWaveStream(1000, quiet=True).amplify(1.5).process(damaged, streamed)
+
+        with open(streamed, 'rb') as file:
+            header = read_wav_header(file)
+            file.seek(0, io.SEEK_END)
+            assert header['data_size'] == file.tell() - header['data_offset'] == written * header['block_align']
+        _in_memory(EXACT_CHAINS['pointwise'], damaged, str(tmp_path / 'memory.wav'), None)
+        assert_same_audio(streamed, str(tmp_path / 'memory.wav'))
+
+
+def test_iter_process_of_seekable_truncated_input_matches_process(make_wav, tmp_path):
+    truncated, _ = _damaged_copies(make_wav(channels=2), tmp_path)
+    ClearWaveStream(1000, quiet=True).amplify(1.5).process(truncated, str(tmp_path / 'stream.wav'))
+    with open(truncated, 'rb') as source:
+        pieces = b''.join(ClearWaveStream(1000, quiet=True).amplify(1.5).iter_process(source))
+    with open(tmp_path / 'stream.wav', 'rb') as file:
+        assert pieces == file.read()
+
+
+def test_iter_process_pads_truncated_upload_to_its_header(make_wav, tmp_path):
+    input_file = make_wav(channels=2)
+    truncated, _ = _damaged_copies(input_file, tmp_path)
+    with open(truncated, 'rb') as file:
+        upload = _Upload(file.read())
+    output = b''.join(ClearWaveStream(1000, quiet=True).amplify(1.5).iter_process(upload))
+
+    header = read_wav_header(io.BytesIO(output))
+    _, input_samples = read_samples(input_file)
+    assert header['data_size'] == len(output) - header['data_offset'] == len(input_samples) * 4
+
+    _in_memory(EXACT_CHAINS['pointwise'], truncated, str(tmp_path / 'memory.wav'), None)
+    _, expected = read_samples(str(tmp_path / 'memory.wav'))
+    samples = np.frombuffer(output[header['data_offset']:], dtype='<i2').reshape(-1, 2)
+    np.testing.assert_array_equal(samples[:len(expected)], expected)
+    assert not samples[len(expected):].any()
+
+
+def test_iter_process_cuts_upload_longer_than_its_header(make_wav):
+    input_file = make_wav(channels=2)
+    with open(input_file, 'rb') as file:
+        data = file.read()
+    declared = 1000 * 4
+    upload = _Upload(data[:40] + declared.to_bytes(4, byteorder='little') + data[44:])
+    output = b''.join(ClearWaveStream(256, quiet=True).amplify(1.5).iter_process(upload))
+
+    header = read_wav_header(io.BytesIO(output))
+    assert header['data_size'] == len(output) - header['data_offset'] == declared
@@ -0,0 +1,123 @@
+import io
+
+import pytest
+
+from ClearWave import (RF64_SIZE_PLACEHOLDER, WAVE_FORMAT_EXTENSIBLE, WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM,
+                       ClearWaveAudio, map_wav_data, read_wav_header, write_wav_header)
+from streaming import ClearWaveStream
+
+
+def _header(channels, sample_rate, bits_per_sample, data_size, audio_format=WAVE_FORMAT_PCM, **kwargs):
+    file = io.BytesIO()
+    write_wav_header(file, channels, sample_rate, bits_per_sample, data_size, audio_format, **kwargs)
+    return file.getvalue()
+
+
+@pytest.mark.parametrize('audio_format, bits_per_sample, size', [
+    (WAVE_FORMAT_PCM, 16, 44),
+    (WAVE_FORMAT_IEEE_FLOAT, 32, 80),
+])
+def test_small_headers_stay_riff(audio_format, bits_per_sample, size):
+    data = _header(2, 44100, bits_per_sample, 4000, audio_format)
+    assert data[:4] == b'RIFF'
+    assert len(data) == size
+    header = read_wav_header(io.BytesIO(data))
+    assert header['audio_format'] == audio_format
+    assert header['data_size'] == 4000
+    assert header['data_offset'] == size
+
+
+@pytest.mark.parametrize('audio_format, bits_per_sample, size', [
+    (WAVE_FORMAT_PCM, 16, 80),
+    (WAVE_FORMAT_IEEE_FLOAT, 32, 116),
+])
+def test_large_headers_are_rf64(audio_format, bits_per_sample, size):
+    data_size = 5 << 30
+    data = _header(2, 48000, bits_per_sample, data_size, audio_format)
+    assert data[:4] == b'RF64'
+    assert len(data) == size
+    assert int.from_bytes(data[4:8], byteorder='little') == RF64_SIZE_PLACEHOLDER
+
+    header = read_wav_header(io.BytesIO(data))
+    assert header['audio_format'] == audio_format
+    assert header['channels'] == 2
+    assert header['sample_rate'] == 48000
+    assert header['data_size'] == data_size
+    assert header['data_offset'] == size
+
+
+def test_map_wav_data_clamps_to_available_frames(tmp_path):
+    filename = str(tmp_path / 'truncated.wav')
+    with open(filename, 'wb') as file:
+        file.write(_header(2, 44100, 16, 4000))
+        file.write(bytes(1001))
+
+    header, data = map_wav_data(filename)
+    assert header['data_size'] == 4000
+    assert len(data) == 1000
+
+
+@pytest.mark.parametrize('channels, bits_per_sample, audio_format, channel_mask, size', [
+    (6, 16, WAVE_FORMAT_PCM, 0x3F, 68),
+    (2, 24, WAVE_FORMAT_PCM, 0x3, 68),
+    (4, 32, WAVE_FORMAT_PCM, 0x33, 68),
+    (1, 32, WAVE_FORMAT_IEEE_FLOAT, 0x4, 80),
+    (6, 64, WAVE_FORMAT_IEEE_FLOAT, 0x60F, 80),
+])
+def test_extensible_headers(channels, bits_per_sample, audio_format, channel_mask, size):
+    data = _header(channels, 48000, bits_per_sample, channels * bits_per_sample // 8 * 100, audio_format,
+                   channel_mask=channel_mask)
+    assert len(data) == size
+
+    header = read_wav_header(io.BytesIO(data))
+    assert header['format_tag'] == WAVE_FORMAT_EXTENSIBLE
+    assert header['audio_format'] == audio_format
+    assert header['channels'] == channels
+    assert header['bits_per_sample'] == header['valid_bits_per_sample'] == bits_per_sample
+    assert header['channel_mask'] == channel_mask
+    assert header['data_size'] == channels * bits_per_sample // 8 * 100
+
+
+@pytest.mark.parametrize('channels, bits_per_sample', [(1, 8), (2, 8), (1, 16), (2, 16)])
+def test_mono_and_stereo_up_to_16_bits_stay_plain_pcm(channels, bits_per_sample):
+    data = _header(channels, 44100, bits_per_sample, 400)
+    assert len(data) == 44
+    assert read_wav_header(io.BytesIO(data))['format_tag'] == WAVE_FORMAT_PCM
+
+
+def test_extensible_rf64_header():
+    data = _header(6, 48000, 24, 5 << 30, channel_mask=0x3F)
+    assert data[:4] == b'RF64'
+    header = read_wav_header(io.BytesIO(data))
+    assert header['data_size'] == 5 << 30
+    assert header['channel_mask'] == 0x3F
+
+
+def _with_channel_mask(filename, channel_mask):
+    """Rewrite a generated 16-bit file as WAVE_FORMAT_EXTENSIBLE with channel_mask"""
+    with open(filename, 'rb') as file:
+        header = read_wav_header(file)
+        data = file.read()
+    with open(filename, 'wb') as file:
+        write_wav_header(file, header['channels'], header['sample_rate'], header['bits_per_sample'], len(data),
+                         channel_mask=channel_mask)
+        file.write(data)
+
+
+def test_channel_mask_survives_processing(make_wav, tmp_path):
+    input_file = make_wav(channels=6)
+    _with_channel_mask(input_file, 0x60F)
+
+    audio = ClearWaveAudio(quiet=True)
+    audio.read_wav_file(input_file)
+    audio.amplify(1.2).convert_format('pcm24')
+    audio.write_wav_file(str(tmp_path / 'memory.wav'))
+    ClearWaveStream(1000, quiet=True).amplify(1.2).convert_format('pcm24').process(
+        input_file, str(tmp_path / 'stream.wav'))
+
+    for output in ('memory.wav', 'stream.wav'):
+        with open(tmp_path / output, 'rb') as file:
+            header = read_wav_header(file)
+        assert header['format_tag'] == WAVE_FORMAT_EXTENSIBLE
+        assert header['bits_per_sample'] == 24
+        assert header['channel_mask'] == 0x60F
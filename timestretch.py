@@ -0,0 +1,148 @@
+import math
+import numpy as np
+
+# Synthesis hop (half a frame) and how far each frame may move to line up with
+# the previous one, in seconds
+HOP_SECONDS = 0.02
+TOLERANCE_SECONDS = 0.01
+
+
+def stretched_length(input_length, speed_factor):
+    """Return the number of samples a time-stretch by speed_factor produces"""
+    return int(input_length / speed_factor)
+
+
+class TimeStretcher:
+    """
+    Streaming WSOLA (waveform similarity overlap-add) time-scale modification.
+
+    Output frames are Hann-windowed and overlap by half, at a fixed synthesis
+    hop. Frame k is read from the input around k * hop * speed_factor; within
+    +/- tolerance of that position, the start whose waveform best matches the
+    natural continuation of the previous frame is chosen by an FFT
+    cross-correlation. Durations change while pitch is kept.
+
+    The frame positions are chosen on the sum of the channels and shared by all
+    of them, so the channels of a (frames, channels) signal stay aligned with
+    each other and the search costs the same whatever the channel count.
+
+    Frames are fed with process() in blocks of any size; flush() returns the
+    rest once the whole signal has been fed, for a total of
+    stretched_length(input frames, speed_factor) frames.
+    """
+
+    def __init__(self, speed_factor, sample_rate, hop_seconds=HOP_SECONDS,
+                 tolerance_seconds=TOLERANCE_SECONDS, channels=1):
+        if speed_factor <= 0:
+            raise ValueError("Speed factor must be greater than 0")
+
+        self.speed_factor = speed_factor
+        self.hop = max(1, int(sample_rate * hop_seconds))
+        self.frame = 2 * self.hop
+        self.tolerance = max(0, int(sample_rate * tolerance_seconds))
+        self.analysis_hop = self.hop * speed_factor
+        self.window = np.hanning(self.frame + 1)[:-1, np.newaxis]
+        self.channels = channels
+        self.fft_size = 1 << (self.frame + 2 * self.tolerance - 1).bit_length()
+
+        # The input starts with one hop of silence so that the first samples
+        # are covered by two frames like every other sample; the matching hop
+        # of output is dropped
+        self.buffer = np.zeros((self.hop, channels))
+        self.buffer_start = 0
+        self.pending_skip = 0
+        self.accumulator = np.zeros((self.frame, channels))
+        self.frame_index = 0
+        self.previous = None
+        self.skip = self.hop
+        self.received = 0
+        self.emitted = 0
+
+    def _best_position(self, low, high):
+        """Return the start in [low, high] that best continues the previous frame"""
+        start = self.buffer_start
+        continuation = self.previous + self.hop - start
+        template = self.buffer[continuation:continuation + self.frame].sum(axis=1)
+        region = self.buffer[low - start:high - start + self.frame].sum(axis=1)
+
+        # Cross-correlation of the template with every candidate start at once
+        spectrum = np.fft.rfft(region, self.fft_size) * np.conj(np.fft.rfft(template, self.fft_size))
+        correlation = np.fft.irfft(spectrum, self.fft_size)[:high - low + 1]
+        return low + int(np.argmax(correlation))
+
+    def _drain(self):
+        """Produce every frame the buffered input allows and return the finished samples"""
+        pieces = []
+        end = self.buffer_start + len(self.buffer)
+
+        while True:
+            nominal = int(round(self.frame_index * self.analysis_hop))
+            if self.previous is None:
+                low = high = nominal
+            else:
+                low = max(nominal - self.tolerance, 0)
+                high = nominal + self.tolerance
+
+            needed = high + self.frame
+            if self.previous is not None:
+                needed = max(needed, self.previous + self.hop + self.frame)
+            if needed > end:
+                break
+
+            position = low if low == high else self._best_position(low, high)
+            segment = self.buffer[position - self.buffer_start:position - self.buffer_start + self.frame]
+
+            # Overlap-add; the first hop of the accumulator is then complete
+            self.accumulator += segment * self.window
+            pieces.append(self.accumulator[:self.hop].copy())
+            self.accumulator = np.concatenate((self.accumulator[self.hop:], np.zeros((self.hop, self.channels))))
+
+            self.previous = position
+            self.frame_index += 1
+
+        # Drop the input no later frame can use
+        if pieces:
+            next_low = int(round(self.frame_index * self.analysis_hop)) - self.tolerance
+            keep_from = max(min(self.previous + self.hop, next_low), self.buffer_start)
+            if keep_from >= end:
+                self.pending_skip = keep_from - end
+                self.buffer = np.zeros((0, self.channels))
+            else:
+                self.buffer = self.buffer[keep_from - self.buffer_start:]
+            self.buffer_start = keep_from
+
+        finished = np.concatenate(pieces) if pieces else np.zeros((0, self.channels))
+        if self.skip:
+            dropped = min(self.skip, len(finished))
+            finished = finished[dropped:]
+            self.skip -= dropped
+        return finished
+
+    def _append(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        if self.pending_skip:
+            # Input the analysis hop jumped over entirely
+            skipped = min(self.pending_skip, len(block))
+            block = block[skipped:]
+            self.pending_skip -= skipped
+        self.buffer = np.concatenate((self.buffer, block))
+
+    def process(self, block):
+        """Feed a (frames, channels) block and return the frames finished so far"""
+        self.received += len(block)
+        self._append(block)
+        finished = self._drain()
+        self.emitted += len(finished)
+        return finished
+
+    def flush(self):
+        """Return the remaining samples once the whole signal has been fed"""
+        target = stretched_length(self.received, self.speed_factor)
+        pieces = []
+        padding = self.frame + self.tolerance + self.hop + math.ceil(self.analysis_hop)
+        while self.emitted < target:
+            self._append(np.zeros((padding, self.channels)))
+            finished = self._drain()[:target - self.emitted]
+            self.emitted += len(finished)
+            pieces.append(finished)
+        return np.concatenate(pieces) if pieces else np.zeros((0, self.channels))